@@ -1,7 +1,8 @@
 import os
 
-from alx_travel_app.celery import Celery
+from celery import Celery, shared_task
 
+__all__ = ["app", "shared_task"]
 
 # set the default django settings module for celery program
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_travel_app.settings")
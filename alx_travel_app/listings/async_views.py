@@ -0,0 +1,161 @@
+"""
+Async payment verify, initialize and complete endpoints.
+
+Under ASGI a request waiting on Chapa holds no thread: Chapa is called
+through listings.chapa_async, and the ORM through its async API or
+sync_to_async for multi-statement writes. Under WSGI Django runs these views
+in an event loop of their own, so they also work there. It is just slower.
+"""
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET, require_POST
+
+from .chapa import ChapaError, ChapaUnavailable
+from .chapa_async import async_client
+from .idempotency import arun_idempotent
+from .models import Payment
+from .outbox import enqueue
+from .reconcile import apply_results
+from .serializers import PaymentSerializer
+from .tasks import send_payment_checkout_mail
+
+
+def _response(data, status=200, headers=None):
+    return JsonResponse(data, status=status, encoder=DjangoJSONEncoder, headers=headers)
+
+
+async def _authenticated_user(request):
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
+
+async def _get_payment(pk):
+    return await Payment.objects.with_booking().filter(pk=pk).afirst()
+
+
+@sync_to_async
+def _save_checkout(payment, fields):
+    with transaction.atomic():
+        payment.save(
+            update_fields=[*fields, "checkout_url", "response_dump", "updated_at"]
+        )
+        enqueue(
+            send_payment_checkout_mail,
+            payment.payment_id,
+            payment.email,
+            payment.checkout_url,
+        )
+
+
+NOT_AUTHENTICATED = {"detail": "Authentication credentials were not provided."}
+NOT_FOUND = {"detail": "Not found."}
+
+
+@require_GET
+async def verify_payment(request, pk):
+    """Verifies a payment with Chapa and applies the outcome"""
+    if await _authenticated_user(request) is None:
+        return _response(NOT_AUTHENTICATED, 403)
+    payment = await _get_payment(pk)
+    if payment is None:
+        return _response(NOT_FOUND, 404)
+
+    try:
+        async with async_client() as client:
+            response = await client.verify(payment.payment_id)
+        chapa_status = None
+        if response.status_code == 200:
+            data = response.json().get("data") or {}
+            chapa_status = (data.get("status") or "").lower()
+    except ChapaUnavailable as e:
+        return _response({"err": str(e)}, 503)
+    except (ChapaError, ValueError) as e:
+        return _response({"err": str(e)}, 500)
+
+    if chapa_status:
+        await sync_to_async(apply_results)([(payment, chapa_status)])
+        await payment.arefresh_from_db(fields=["status", "updated_at"])
+    return _response(PaymentSerializer(payment).data)
+
+
+@require_POST
+async def initialize_payment(request, pk):
+    """Starts a Chapa checkout for a payment, once per Idempotency-Key"""
+    user = await _authenticated_user(request)
+    if user is None:
+        return _response(NOT_AUTHENTICATED, 403)
+    data, status, headers = await arun_idempotent(
+        request, user, lambda: _initialize(user, pk)
+    )
+    return _response(data, status, headers)
+
+
+async def _initialize(user, pk):
+    """Returns the (data, status) of an initialize request"""
+    payment = await _get_payment(pk)
+    if payment is None:
+        return NOT_FOUND, 404
+
+    booking = payment.booking
+    payment.email = user.email
+    payment.first_name = "Guest"
+    payment.last_name = "User"
+    payment.payment_title = "Reservation Payment"
+    payment.description = f"Booking from {booking.start_date} to {booking.end_date}"
+    payload = {
+        "amount": str(payment.amount),
+        "currency": payment.currency,
+        "email": payment.email,
+        "first_name": payment.first_name,
+        "last_name": payment.last_name,
+        "tx_ref": str(payment.payment_id),
+        "customization": {
+            "title": payment.payment_title,
+            "description": payment.description,
+        },
+    }
+
+    try:
+        async with async_client() as client:
+            response = await client.initialize(payload)
+        response_data = response.json()
+    except ChapaUnavailable as e:
+        return {"err": str(e)}, 503
+    except (ChapaError, ValueError) as e:
+        return {"err": str(e)}, 500
+
+    fields = ["email", "first_name", "last_name", "payment_title", "description"]
+    if response.status_code != 200:
+        payment.status = Payment.PaymentStatus.FAILED
+        await payment.asave(update_fields=[*fields, "status", "updated_at"])
+        message = response_data.get("msg", str(response_data))
+        return {"err": f"CHAPA ERROR: {message}"}, 500
+
+    # One write for the customer details and the checkout session, in the
+    # transaction that queues the checkout mail
+    payment.checkout_url = response_data["data"]["checkout_url"]
+    payment.response_dump = response_data
+    await _save_checkout(payment, fields)
+    return {
+        "checkout_url": payment.checkout_url,
+        "transaction_ref": str(payment.payment_id),
+        "message": "Payment checkout url has been sent to your mail",
+    }, 200
+
+
+@require_GET
+async def complete_payment(request, payment_id):
+    """Payment details after the Chapa checkout redirect"""
+    user = await _authenticated_user(request)
+    if user is None:
+        return _response(NOT_AUTHENTICATED, 403)
+    payment = await _get_payment(payment_id)
+    if payment is None:
+        return _response(NOT_FOUND, 404)
+
+    if not user.is_staff and payment.booking.user_id != user.pk:
+        return _response({"error": "Not authorized to view this payment"}, 403)
+    return _response(PaymentSerializer(payment).data)
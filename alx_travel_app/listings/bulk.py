@@ -0,0 +1,142 @@
+"""
+Bulk booking creation for channel-manager pushes.
+
+A whole batch is validated up front, checked for overlaps both inside the
+batch and against stored bookings (one range query per listing), and the
+accepted rows are inserted with a single bulk_create in one transaction,
+together with the outbox message of their confirmation emails.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+
+from .caching import bump_generation, bump_listing_version
+from .models import Booking, Listing, User
+from .outbox import enqueue
+from .pricing import PriceBook
+from .serializers import BulkBookingItemSerializer
+from .tasks import send_booking_confirmations
+
+CREATED = "created"
+CONFLICT = "conflict"
+INVALID = "invalid"
+
+
+def _overlaps(ranges, start, end):
+    return any(s < end and e > start for s, e in ranges)
+
+
+def create_bookings(items):
+    """Creates the bookings it can; returns (results, created bookings)"""
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        serializer = BulkBookingItemSerializer(data=item)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            results[index] = {
+                "index": index,
+                "status": INVALID,
+                "errors": serializer.errors,
+            }
+
+    by_listing = defaultdict(list)
+    for index, data in valid:
+        by_listing[data["listing"]].append((index, data))
+
+    created = []
+    with transaction.atomic():
+        # Locking the listing rows serializes concurrent batches per listing
+        listings = set(
+            Listing.objects.select_for_update()
+            .filter(pk__in=by_listing.keys())
+            .values_list("pk", flat=True)
+        )
+        # Totals are priced on the server from one PriceBook for the batch
+        prices = PriceBook(
+            listings,
+            min((data["start_date"] for _, data in valid), default=None),
+            max((data["end_date"] for _, data in valid), default=None),
+        )
+        users = set(
+            User.objects.filter(pk__in={data["user"] for _, data in valid}).values_list(
+                "pk", flat=True
+            )
+        )
+
+        for listing_id, entries in by_listing.items():
+            if listing_id not in listings:
+                for index, _ in entries:
+                    results[index] = {
+                        "index": index,
+                        "status": INVALID,
+                        "errors": {"listing": ["Listing not found."]},
+                    }
+                continue
+
+            start = min(data["start_date"] for _, data in entries)
+            end = max(data["end_date"] for _, data in entries)
+            taken = list(
+                Booking.objects.filter(listing_id=listing_id)
+                .overlapping(start, end)
+                .values_list("start_date", "end_date")
+            )
+
+            for index, data in entries:
+                if data["user"] not in users:
+                    results[index] = {
+                        "index": index,
+                        "status": INVALID,
+                        "errors": {"user": ["User not found."]},
+                    }
+                    continue
+
+                if _overlaps(taken, data["start_date"], data["end_date"]):
+                    results[index] = {"index": index, "status": CONFLICT}
+                    continue
+
+                taken.append((data["start_date"], data["end_date"]))
+                booking = Booking(
+                    listing_id=listing_id,
+                    user_id=data["user"],
+                    start_date=data["start_date"],
+                    end_date=data["end_date"],
+                    total_price=prices.quote(
+                        listing_id, data["start_date"], data["end_date"]
+                    )["total_price"],
+                    status=data["status"],
+                )
+                booking.confirmation_email = data.get("email")
+                created.append((index, booking))
+
+        Booking.objects.bulk_create([booking for _, booking in created])
+
+        recipients = [
+            [booking.confirmation_email, str(booking.booking_id)]
+            for _, booking in created
+            if booking.confirmation_email
+        ]
+        if recipients:
+            # One task for the whole batch instead of one per booking
+            enqueue(send_booking_confirmations, recipients)
+
+        # bulk_create skips post_save, so invalidate listing caches here
+        touched = {booking.listing_id for _, booking in created}
+        transaction.on_commit(lambda: _invalidate(touched))
+
+    for index, booking in created:
+        results[index] = {
+            "index": index,
+            "status": CREATED,
+            "booking_id": str(booking.booking_id),
+        }
+    return results, [booking for _, booking in created]
+
+
+def _invalidate(listing_ids):
+    for listing_id in listing_ids:
+        bump_listing_version(listing_id)
+    if listing_ids:
+        bump_generation()
@@ -0,0 +1,94 @@
+"""
+Versioned response cache for listing reads.
+
+Cache keys embed a global generation counter and, for detail responses, a
+per-listing version. Writes never delete entries; they bump the counters
+(see listings.signals) so stale entries simply stop being addressed and age
+out through the cache timeout.
+"""
+
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+GENERATION_KEY = "listings:cache:generation"
+VERSION_KEY = "listings:cache:version:{pk}"
+HITS_KEY = "listings:cache:hits"
+MISSES_KEY = "listings:cache:misses"
+
+
+def cache_enabled():
+    return getattr(settings, "LISTINGS_CACHE_ENABLED", False)
+
+
+def _incr(key):
+    """Atomically increments a counter, creating it on first use"""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        if cache.add(key, 1, timeout=None):
+            return 1
+        return cache.incr(key)
+
+
+def bump_generation():
+    """Invalidates every cached listing response"""
+    _incr(GENERATION_KEY)
+
+
+def bump_listing_version(pk):
+    """Invalidates cached detail responses of one listing"""
+    _incr(VERSION_KEY.format(pk=pk))
+
+
+def _request_digest(request):
+    return hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()
+
+
+def list_key(request):
+    generation = cache.get(GENERATION_KEY, 0)
+    return f"listings:list:{generation}:{_request_digest(request)}"
+
+
+def detail_key(request, pk):
+    try:
+        pk = uuid.UUID(str(pk))
+    except ValueError:
+        pass
+
+    version_key = VERSION_KEY.format(pk=pk)
+    values = cache.get_many([GENERATION_KEY, version_key])
+    generation = values.get(GENERATION_KEY, 0)
+    version = values.get(version_key, 0)
+    return f"listings:detail:{pk}:{generation}:{version}:{_request_digest(request)}"
+
+
+def cached_response(key, build):
+    """Returns the cached response data for key, or builds and stores it"""
+    if not cache_enabled():
+        return build()
+
+    cached = cache.get(key)
+    if cached is not None:
+        _incr(HITS_KEY)
+        data, status = cached
+        return Response(data, status=status, headers={"X-Cache": "HIT"})
+
+    _incr(MISSES_KEY)
+    response = build()
+    if response.status_code == 200:
+        cache.set(
+            key,
+            (response.data, response.status_code),
+            settings.LISTINGS_CACHE_TIMEOUT,
+        )
+    response["X-Cache"] = "MISS"
+    return response
+
+
+def cache_stats():
+    values = cache.get_many([HITS_KEY, MISSES_KEY])
+    return {"hits": values.get(HITS_KEY, 0), "misses": values.get(MISSES_KEY, 0)}
@@ -0,0 +1,252 @@
+"""
+HTTP client for the Chapa payment gateway.
+
+One pooled requests.Session is kept per process so calls reuse keep-alive
+connections instead of doing a TCP+TLS handshake each time. Every call is
+bounded by connect/read timeouts, idempotent calls are retried with jittered
+backoff, and a circuit breaker fails fast while Chapa keeps erroring.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class ChapaError(Exception):
+    """Chapa could not be reached or kept failing"""
+
+
+class ChapaUnavailable(ChapaError):
+    """The circuit breaker is open; Chapa is not being called"""
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures for `reset_timeout` seconds.
+
+    Once the timeout has passed a single trial call is let through
+    (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, threshold, reset_timeout, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning(
+                        "Chapa circuit opened after %s failures", self.failures
+                    )
+                self.opened_at = self.clock()
+            self.trial_in_flight = False
+
+
+class ChapaMetrics:
+    """Per-operation call, error and latency counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = defaultdict(
+            lambda: {
+                "calls": 0,
+                "errors": 0,
+                "retries": 0,
+                "rejected": 0,
+                "latency_total_ms": 0.0,
+                "latency_max_ms": 0.0,
+            }
+        )
+
+    def record(self, operation, latency_ms=None, error=False, retry=False):
+        with self._lock:
+            data = self._data[operation]
+            if latency_ms is not None:
+                data["calls"] += 1
+                data["latency_total_ms"] += latency_ms
+                data["latency_max_ms"] = max(data["latency_max_ms"], latency_ms)
+            data["errors"] += int(error)
+            data["retries"] += int(retry)
+
+    def reject(self, operation):
+        with self._lock:
+            self._data[operation]["rejected"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for operation, data in self._data.items():
+                data = dict(data)
+                calls = data["calls"]
+                data["latency_avg_ms"] = (
+                    data["latency_total_ms"] / calls if calls else 0.0
+                )
+                result[operation] = data
+            return result
+
+
+class ChapaClient:
+    def __init__(
+        self,
+        base_url=None,
+        secret_key=None,
+        api_version=None,
+        connect_timeout=None,
+        read_timeout=None,
+        max_retries=None,
+        backoff=None,
+        pool_size=None,
+        breaker=None,
+    ):
+        self.base_url = (base_url or settings.CHAPA_API_URL).rstrip("/")
+        self.secret_key = secret_key or settings.CHAPA_SECRET_KEY
+        self.api_version = api_version or settings.CHAPA_API_VERSION
+        self.timeout = (
+            connect_timeout or settings.CHAPA_CONNECT_TIMEOUT,
+            read_timeout or settings.CHAPA_READ_TIMEOUT,
+        )
+        self.max_retries = (
+            settings.CHAPA_MAX_RETRIES if max_retries is None else max_retries
+        )
+        self.backoff = settings.CHAPA_RETRY_BACKOFF if backoff is None else backoff
+        self.breaker = breaker or CircuitBreaker(
+            settings.CHAPA_BREAKER_THRESHOLD, settings.CHAPA_BREAKER_RESET_TIMEOUT
+        )
+        self.metrics = ChapaMetrics()
+
+        self.pool_size = pool_size or settings.CHAPA_POOL_SIZE
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(
+            {
+                "Authorization": f"Bearer {self.secret_key}",
+                "Content-Type": "application/json",
+            }
+        )
+
+    def url(self, path):
+        return f"{self.base_url}/{self.api_version}/{path.lstrip('/')}"
+
+    def _sleep_before_retry(self, attempt):
+        # Full jitter keeps retrying workers from hitting Chapa in lockstep
+        time.sleep(random.uniform(0, self.backoff * 2**attempt))
+
+    def request(self, operation, method, path, idempotent, **kwargs):
+        """Sends a request through the breaker, retrying when it is safe"""
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self.metrics.reject(operation)
+                raise ChapaUnavailable("Chapa is temporarily unavailable")
+
+            began = time.perf_counter()
+            try:
+                response = self.session.request(
+                    method, self.url(path), timeout=self.timeout, **kwargs
+                )
+                error = None
+            except requests.RequestException as e:
+                response, error = None, e
+            latency_ms = (time.perf_counter() - began) * 1000
+
+            failed = error is not None or response.status_code >= 500
+            self.metrics.record(operation, latency_ms, error=failed)
+            if failed:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+
+            if idempotent:
+                retryable = error is not None or response.status_code in RETRY_STATUSES
+            else:
+                # Only retry when the request provably never reached Chapa
+                retryable = isinstance(error, requests.ConnectTimeout)
+
+            if not retryable or attempt >= self.max_retries:
+                if error is not None:
+                    raise ChapaError(f"CHAPA ERROR: {error}") from error
+                return response
+
+            self.metrics.record(operation, retry=True)
+            self._sleep_before_retry(attempt)
+            attempt += 1
+
+    def verify(self, tx_ref):
+        return self.request(
+            "verify", "GET", f"transaction/verify/{tx_ref}", idempotent=True
+        )
+
+    def initialize(self, payload):
+        return self.request(
+            "initialize",
+            "POST",
+            "transaction/initialize",
+            idempotent=False,
+            json=payload,
+        )
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Returns the per-process Chapa client (recreated after a fork)"""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = ChapaClient()
+            _client_pid = os.getpid()
+        return _client
@@ -0,0 +1,152 @@
+"""
+Non-blocking HTTP client for the Chapa payment gateway, for async views.
+
+It follows listings.chapa.ChapaClient (timeouts, retries, circuit breaker,
+metrics) on an httpx.AsyncClient, so a request waiting on Chapa holds a
+socket rather than a thread. httpx connections belong to the event loop that
+opened them, and under WSGI each async view runs in a loop of its own, so a
+client is opened per request with async_client() and closed, sockets and
+all, when the view is done with it. The breaker and metrics are shared with
+the process's sync client, so both kinds of view see the same circuit state.
+"""
+
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+from .chapa import RETRY_STATUSES, ChapaError, ChapaUnavailable, get_client
+
+
+class AsyncChapaClient:
+    """Async counterpart of ChapaClient; build it with for_client().
+
+    Use it as an async context manager, or call aclose(), so its
+    connections are closed in the event loop that opened them.
+    """
+
+    def __init__(
+        self,
+        base_url,
+        secret_key,
+        api_version,
+        timeout,
+        max_retries,
+        backoff,
+        pool_size,
+        breaker,
+        metrics,
+    ):
+        self.api_version = api_version
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker
+        self.metrics = metrics
+        connect_timeout, read_timeout = timeout
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            headers={
+                "Authorization": f"Bearer {secret_key}",
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+            },
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size
+            ),
+            # Like the requests session of the sync client
+            follow_redirects=True,
+        )
+
+    @classmethod
+    def for_client(cls, client):
+        """Same settings, breaker and metrics as a sync ChapaClient"""
+        return cls(
+            base_url=client.base_url,
+            secret_key=client.secret_key,
+            api_version=client.api_version,
+            timeout=client.timeout,
+            max_retries=client.max_retries,
+            backoff=client.backoff,
+            pool_size=client.pool_size,
+            breaker=client.breaker,
+            metrics=client.metrics,
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    def path(self, path):
+        return f"{self.api_version}/{path.lstrip('/')}"
+
+    async def request(self, operation, method, path, idempotent, payload=None):
+        """Sends a request through the breaker, retrying when it is safe"""
+        body = None if payload is None else json.dumps(payload, default=str)
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self.metrics.reject(operation)
+                raise ChapaUnavailable("Chapa is temporarily unavailable")
+
+            began = time.perf_counter()
+            try:
+                response = await self.http.request(
+                    method, self.path(path), content=body
+                )
+                error = None
+            except httpx.HTTPError as e:
+                response, error = None, e
+            latency_ms = (time.perf_counter() - began) * 1000
+
+            failed = error is not None or response.status_code >= 500
+            self.metrics.record(operation, latency_ms, error=failed)
+            if failed:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+
+            if idempotent:
+                retryable = error is not None or response.status_code in RETRY_STATUSES
+            else:
+                # Only retry when the request provably never reached Chapa
+                retryable = isinstance(error, httpx.ConnectTimeout)
+
+            if not retryable or attempt >= self.max_retries:
+                if error is not None:
+                    raise ChapaError(f"CHAPA ERROR: {error!r}") from error
+                return response
+
+            self.metrics.record(operation, retry=True)
+            # Full jitter keeps retrying requests from hitting Chapa in lockstep
+            await asyncio.sleep(random.uniform(0, self.backoff * 2**attempt))
+            attempt += 1
+
+    async def verify(self, tx_ref):
+        return await self.request(
+            "verify", "GET", f"transaction/verify/{tx_ref}", idempotent=True
+        )
+
+    async def initialize(self, payload):
+        return await self.request(
+            "initialize",
+            "POST",
+            "transaction/initialize",
+            idempotent=False,
+            payload=payload,
+        )
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+def async_client():
+    """A new async Chapa client mirroring the process's sync client.
+
+    Use it with `async with`, which closes it on the way out.
+    """
+    return AsyncChapaClient.for_client(get_client())
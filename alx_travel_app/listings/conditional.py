@@ -0,0 +1,196 @@
+"""
+Conditional requests (ETag / Last-Modified) for model viewsets.
+
+A detail ETag hashes the row's pk and updated_at; a list ETag hashes the
+request path with the pk and updated_at of every row on the page, which
+also follows rows joining or leaving it (availability of a ?check_in=
+search included). A plain GET reads them off the response it serves, so
+it costs no extra query. A revalidation looks them up with one small
+query, the page's keyset scan over two columns, and answers a 304 before
+any caching or serialization. Writes honour If-Match and If-None-Match
+against the row locked for the update, giving optimistic concurrency.
+"""
+
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+CONDITIONAL_HEADERS = (
+    "HTTP_IF_MATCH",
+    "HTTP_IF_NONE_MATCH",
+    "HTTP_IF_MODIFIED_SINCE",
+    "HTTP_IF_UNMODIFIED_SINCE",
+)
+
+
+def make_etag(*parts):
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def _timestamp(value):
+    return int(value.timestamp()) if value else None
+
+
+def _version(updated_at):
+    """updated_at in microseconds, the same whether read or serialized"""
+    return (updated_at - EPOCH) // timedelta(microseconds=1)
+
+
+def detail_etag(pk, updated_at):
+    return make_etag("detail", pk, _version(updated_at))
+
+
+def list_etag(request, rows):
+    """ETag of a list page from the (pk, updated_at) of its rows"""
+    return make_etag(
+        "list",
+        request.get_full_path(),
+        *(f"{pk}:{_version(updated_at)}" for pk, updated_at in rows),
+    )
+
+
+def _served_row(item, pk_name):
+    """(pk, updated_at) read off a served item, or None without them"""
+    pk, updated_at = item.get(pk_name), item.get("updated_at")
+    if isinstance(updated_at, str):
+        updated_at = parse_datetime(updated_at)
+    if pk is None or not isinstance(updated_at, datetime):
+        return None
+    return pk, updated_at
+
+
+def _served_rows(data, pk_name):
+    """(pk, updated_at) of the rows in a served list, or None without them"""
+    items = data.get("results") if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return None
+    rows = [_served_row(item, pk_name) for item in items]
+    return None if None in rows else rows
+
+
+def is_conditional(request):
+    return any(header in request.META for header in CONDITIONAL_HEADERS)
+
+
+def _set_validators(response, etag, last_modified):
+    if response.status_code in (200, 304):
+        response["ETag"] = etag
+        if last_modified:
+            response["Last-Modified"] = http_date(_timestamp(last_modified))
+    return response
+
+
+class ConditionalMixin:
+    """ETag/Last-Modified on list and retrieve, preconditions on writes.
+
+    Views call conditional_list/conditional_retrieve from their list and
+    retrieve, wrapping the cached or serialized response.
+    """
+
+    def list_rows(self, request):
+        """(pk, updated_at) of the rows on the requested page, in one query"""
+        queryset = self.filter_queryset(self.get_queryset())
+        # Cursor positions are read off the rows, so their columns come too
+        rows = queryset.values("pk", "updated_at", *self._ordering_columns(queryset))
+        page = self.paginate_queryset(rows)
+        return [
+            (row["pk"], row["updated_at"]) for row in (rows if page is None else page)
+        ]
+
+    def served_validators(self, response):
+        """Detail validators read off the served row, or None without them"""
+        data = response.data if isinstance(response.data, dict) else {}
+        row = _served_row(data, self.get_queryset().model._meta.pk.name)
+        if row is None:
+            return None
+        return detail_etag(*row), row[1]
+
+    def detail_validators(self, lock=False):
+        lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        queryset = self.get_queryset().order_by()
+        if lock:
+            queryset = queryset.select_for_update()
+
+        try:
+            row = (
+                queryset.filter(**{self.lookup_field: lookup})
+                .values_list("pk", "updated_at")
+                .first()
+            )
+        except (TypeError, ValueError, ValidationError):
+            row = None
+        if row is None:
+            raise Http404
+
+        pk, updated_at = row
+        return detail_etag(pk, updated_at), updated_at
+
+    def _conditional(self, request, validators, build):
+        etag, last_modified = validators
+        response = get_conditional_response(
+            request, etag=etag, last_modified=_timestamp(last_modified)
+        )
+        if response is None:
+            response = build()
+        return _set_validators(response, etag, last_modified)
+
+    def conditional_list(self, request, build):
+        if "HTTP_IF_NONE_MATCH" in request.META:
+            return self._conditional(
+                request, (list_etag(request, self.list_rows(request)), None), build
+            )
+
+        response = build()
+        if response.status_code != 200:
+            return response
+        pk_name = self.get_queryset().model._meta.pk.name
+        rows = _served_rows(response.data, pk_name)
+        if rows is None:
+            # Served without updated_at (?fields=); look the page up
+            rows = self.list_rows(request)
+        return _set_validators(response, list_etag(request, rows), None)
+
+    def conditional_retrieve(self, request, build):
+        if is_conditional(request):
+            return self._conditional(request, self.detail_validators(), build)
+
+        response = build()
+        if response.status_code != 200:
+            return response
+        validators = self.served_validators(response) or self.detail_validators()
+        return _set_validators(response, *validators)
+
+    def _guarded_write(self, request, write):
+        with transaction.atomic():
+            # Locked so the precondition still holds when the write lands
+            etag, last_modified = self.detail_validators(lock=True)
+            failed = get_conditional_response(
+                request, etag=etag, last_modified=_timestamp(last_modified)
+            )
+            if failed is not None:
+                return failed
+            response = write()
+
+        if response.status_code == 200:
+            _set_validators(response, *self.detail_validators())
+        return response
+
+    def update(self, request, *args, **kwargs):
+        return self._guarded_write(
+            request,
+            lambda: super(ConditionalMixin, self).update(request, *args, **kwargs),
+        )
+
+    def destroy(self, request, *args, **kwargs):
+        return self._guarded_write(
+            request,
+            lambda: super(ConditionalMixin, self).destroy(request, *args, **kwargs),
+        )
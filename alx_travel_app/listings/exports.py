@@ -0,0 +1,142 @@
+"""
+Streaming NDJSON/CSV exports of bookings and payments.
+
+Rows are read with values_list().iterator(), so no model instances are built
+and the queryset result cache is never filled; lines are encoded and, when
+asked, gzipped as they are produced. Memory stays bounded by one fetch chunk
+and one output block whatever the number of rows exported.
+"""
+
+import csv
+import zlib
+from datetime import datetime, time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import Booking, Payment
+
+EXPORTS = {
+    "bookings": (
+        Booking,
+        [
+            "booking_id",
+            "listing_id",
+            "user_id",
+            "start_date",
+            "end_date",
+            "total_price",
+            "status",
+            "created_at",
+            "updated_at",
+        ],
+    ),
+    "payments": (
+        Payment,
+        [
+            "payment_id",
+            "booking_id",
+            "amount",
+            "currency",
+            "status",
+            "payment_method",
+            "transaction_id",
+            "created_at",
+            "updated_at",
+        ],
+    ),
+}
+FORMATS = ("ndjson", "csv")
+CONTENT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+# Encoded output is handed on in blocks of about this many bytes
+BLOCK_SIZE = 64 * 1024
+
+
+def export_queryset(kind, start=None, end=None, status=None):
+    """Rows of one export, created in [start, end) and with the given status"""
+    model, columns = EXPORTS[kind]
+    queryset = model.objects.all()
+    if start is not None:
+        queryset = queryset.filter(created_at__gte=_midnight(start))
+    if end is not None:
+        queryset = queryset.filter(created_at__lt=_midnight(end))
+    if status:
+        queryset = queryset.filter(status=status)
+    # Matches the (created_at, pk) index, so rows come out in index order
+    return queryset.order_by("created_at", "pk").values_list(*columns)
+
+
+def _midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _ndjson_lines(columns, rows):
+    encoder = DjangoJSONEncoder(separators=(",", ":"))
+    for row in rows:
+        yield encoder.encode(dict(zip(columns, row))) + "\n"
+
+
+class _Line:
+    """File-like target that hands back what csv.writer writes"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(columns, rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(
+            [
+                value.isoformat() if isinstance(value, datetime) else value
+                for value in row
+            ]
+        )
+
+
+def _blocks(lines):
+    """Joins encoded lines into blocks of about BLOCK_SIZE bytes"""
+    block, size = [], 0
+    for line in lines:
+        data = line.encode()
+        block.append(data)
+        size += len(data)
+        if size >= BLOCK_SIZE:
+            yield b"".join(block)
+            block, size = [], 0
+    if block:
+        yield b"".join(block)
+
+
+def gzip_stream(blocks):
+    """Gzips a stream of byte blocks incrementally"""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(kind, fmt, start=None, end=None, status=None, compress=False):
+    """Encoded (and optionally gzipped) byte blocks of one export"""
+    _, columns = EXPORTS[kind]
+    rows = export_queryset(kind, start, end, status).iterator(
+        chunk_size=settings.EXPORT_CHUNK_SIZE
+    )
+    lines = (
+        _ndjson_lines(columns, rows) if fmt == "ndjson" else _csv_lines(columns, rows)
+    )
+    blocks = _blocks(lines)
+    return gzip_stream(blocks) if compress else blocks
+
+
+def export_filename(kind, fmt, start=None, end=None, compress=False):
+    """Download name, e.g. bookings_2025-01-01_2025-02-01.csv.gz"""
+    name = kind
+    if start or end:
+        name += f"_{start or ''}_{end or ''}"
+    name += f".{fmt}"
+    return name + ".gz" if compress else name
@@ -0,0 +1,193 @@
+"""
+Sparse fieldsets and a values()-based list path.
+
+?fields=a,b and ?exclude=c narrow both the serializer output and the SQL
+(only() for the regular path, values() for the fast one). Read-only list
+endpoints skip model instantiation altogether: rows come from values() and
+each column goes through its serializer field's to_representation(), so
+the output is identical to the regular path.
+"""
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+
+def _parse_names(params, name):
+    value = params.get(name) or ""
+    return [part.strip() for part in value.split(",") if part.strip()]
+
+
+def select_fields(available, params):
+    """Serializer field names picked by ?fields=/?exclude=, or None for all"""
+    fields = _parse_names(params, "fields")
+    exclude = _parse_names(params, "exclude")
+    if not fields and not exclude:
+        return None
+
+    for name, requested in (("fields", fields), ("exclude", exclude)):
+        unknown = sorted(set(requested) - set(available))
+        if unknown:
+            raise ValidationError({name: f"Unknown fields: {', '.join(unknown)}."})
+
+    return [
+        name
+        for name in available
+        if (not fields or name in fields) and name not in exclude
+    ]
+
+
+class SparseFieldsSerializerMixin:
+    """Drops the fields not listed in context["fields"]"""
+
+    # Model columns behind fields that aren't a plain column, e.g. properties
+    source_columns = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = self.context.get("fields")
+        if selected is not None:
+            for name in list(self.fields):
+                if name not in selected:
+                    self.fields.pop(name)
+
+
+def field_columns(serializer, model):
+    """{field name: (column, to_representation)} for the values() path.
+
+    Returns None when a field can't be built from plain columns.
+    """
+    opts = model._meta
+    columns = {}
+    for name, field in serializer.fields.items():
+        if name in serializer.source_columns:
+            builder = getattr(serializer, f"values_{name}", None)
+            if builder is None:
+                return None
+            columns[name] = (None, builder)
+            continue
+
+        try:
+            model_field = opts.get_field(field.source)
+        except FieldDoesNotExist:
+            return None
+        if model_field.many_to_many or model_field.one_to_many:
+            return None
+
+        if isinstance(field, serializers.PrimaryKeyRelatedField):
+            # The row already holds the related pk
+            represent = (
+                field.pk_field.to_representation if field.pk_field else _identity
+            )
+        elif isinstance(field, serializers.RelatedField):
+            return None
+        else:
+            represent = field.to_representation
+        columns[name] = (model_field.attname, represent)
+    return columns
+
+
+def _identity(value):
+    return value
+
+
+def query_columns(serializer, model):
+    """Model columns needed to render the serializer's current fields"""
+    opts = model._meta
+    names = {opts.pk.attname}
+    for name, field in serializer.fields.items():
+        if name in serializer.source_columns:
+            names.update(serializer.source_columns[name])
+            continue
+        try:
+            names.add(opts.get_field(field.source).attname)
+        except FieldDoesNotExist:
+            # Not a column (a property or method); load everything
+            return None
+    return names
+
+
+class SparseFieldsMixin:
+    """?fields=/?exclude= on a model viewset, plus the values() list path"""
+
+    def selected_fields(self):
+        if not hasattr(self, "_selected_fields"):
+            self._selected_fields = None
+            if self.request is not None and self.request.method in ("GET", "HEAD"):
+                available = list(self.get_serializer_class()().fields)
+                self._selected_fields = select_fields(
+                    available, self.request.query_params
+                )
+        return self._selected_fields
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["fields"] = self.selected_fields()
+        return context
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.selected_fields() is None:
+            return queryset
+
+        serializer = self.get_serializer()
+        columns = query_columns(serializer, queryset.model)
+        if columns is None:
+            return queryset
+
+        # Ordering and cursor positions read these, whatever was selected
+        columns.update(self._ordering_columns(queryset))
+        return queryset.only(*columns)
+
+    def _ordering_columns(self, queryset):
+        opts = queryset.model._meta
+        names = set()
+        ordering = list(getattr(self, "ordering_fields", None) or [])
+        ordering += [
+            name.lstrip("-") for name in getattr(self.paginator, "ordering", ())
+        ]
+        for name in ordering:
+            name = opts.pk.attname if name == "pk" else name
+            try:
+                names.add(opts.get_field(name).attname)
+            except FieldDoesNotExist:
+                pass
+        return names
+
+    def values_list_response(self, request, build):
+        """Serves the list from values() rows when every field allows it"""
+        if not settings.API_VALUES_LIST:
+            return build()
+
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = self.get_serializer()
+        columns = field_columns(serializer, queryset.model)
+        if columns is None:
+            return build()
+
+        names = {column for column, _ in columns.values() if column}
+        for name in serializer.source_columns:
+            if name in columns:
+                names.update(serializer.source_columns[name])
+        names.update(self._ordering_columns(queryset))
+        names.add("pk")
+
+        rows = queryset.values(*names)
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response([self._represent(row, columns) for row in rows])
+        data = [self._represent(row, columns) for row in page]
+        return self.get_paginated_response(data)
+
+    @staticmethod
+    def _represent(row, columns):
+        item = {}
+        for name, (column, represent) in columns.items():
+            if column is None:
+                item[name] = represent(row)
+            else:
+                value = row[column]
+                item[name] = None if value is None else represent(value)
+        return item
@@ -0,0 +1,154 @@
+import math
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from uuid import UUID
+
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+
+from . import geo
+
+
+def parse_date_param(params, name):
+    """Reads an ISO date (YYYY-MM-DD) from the query params"""
+    value = params.get(name)
+    if not value:
+        return None
+
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValidationError({name: "Expected a date in YYYY-MM-DD format."})
+
+
+def parse_int_param(params, name, min_value=None):
+    """Reads an integer from the query params"""
+    value = params.get(name)
+    if value in (None, ""):
+        return None
+
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValidationError({name: "Expected an integer."})
+
+    if min_value is not None and number < min_value:
+        raise ValidationError({name: f"Must be at least {min_value}."})
+    return number
+
+
+def parse_decimal_param(params, name, min_value=None, max_value=None):
+    """Reads a decimal number from the query params"""
+    value = params.get(name)
+    if value in (None, ""):
+        return None
+
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        raise ValidationError({name: "Expected a number."})
+
+    if not number.is_finite():
+        raise ValidationError({name: "Expected a number."})
+    if min_value is not None and number < min_value:
+        raise ValidationError({name: f"Must be at least {min_value}."})
+    if max_value is not None and number > max_value:
+        raise ValidationError({name: f"Must be at most {max_value}."})
+    return number
+
+
+def parse_uuid_list_param(params, name, max_items=None):
+    """Reads a comma-separated list of UUIDs from the query params"""
+    value = params.get(name)
+    if not value:
+        return []
+
+    try:
+        ids = [UUID(part.strip()) for part in value.split(",") if part.strip()]
+    except ValueError:
+        raise ValidationError({name: "Expected comma-separated UUIDs."})
+
+    if max_items is not None and len(ids) > max_items:
+        raise ValidationError({name: f"At most {max_items} ids are allowed."})
+    return ids
+
+
+def parse_coordinates_param(params, name, count):
+    """Reads count comma-separated numbers, e.g. ?near=-1.29,36.82"""
+    value = params.get(name)
+    if not value:
+        return None
+
+    try:
+        numbers = [float(part) for part in value.split(",")]
+    except ValueError:
+        numbers = []
+    if len(numbers) != count or not all(map(math.isfinite, numbers)):
+        raise ValidationError({name: f"Expected {count} comma-separated numbers."})
+    return numbers
+
+
+def _check_point(name, latitude, longitude):
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        raise ValidationError({name: "Latitude or longitude out of range."})
+
+
+def parse_near_params(params):
+    """Reads ?near=lat,lng&radius_km= as (lat, lng, radius_km), or None"""
+    near = parse_coordinates_param(params, "near", 2)
+    if near is None:
+        return None
+    _check_point("near", *near)
+
+    radius = parse_decimal_param(
+        params,
+        "radius_km",
+        min_value=0,
+        max_value=settings.GEO_MAX_RADIUS_KM,
+    )
+    if radius is None:
+        raise ValidationError({"radius_km": "Required with near."})
+    return near[0], near[1], float(radius)
+
+
+def filter_bbox(queryset, params):
+    """Applies ?bbox=south,west,north,east to a listing queryset"""
+    bbox = parse_coordinates_param(params, "bbox", 4)
+    if bbox is None:
+        return queryset
+
+    south, west, north, east = bbox
+    _check_point("bbox", south, west)
+    _check_point("bbox", north, east)
+    if north < south:
+        raise ValidationError({"bbox": "north must not be below south."})
+    # west > east is a box across the antimeridian
+    return queryset.filter(geo.box_condition(south, west, north, east))
+
+
+def filter_available(queryset, params):
+    """Applies ?check_in=&check_out=&guests= to a listing queryset"""
+    check_in = parse_date_param(params, "check_in")
+    check_out = parse_date_param(params, "check_out")
+    guests = parse_int_param(params, "guests", min_value=1)
+
+    if check_in is None and check_out is None:
+        if guests:
+            queryset = queryset.filter(max_guests__gte=guests)
+        return queryset
+
+    if check_in is None or check_out is None:
+        raise ValidationError("check_in and check_out must be provided together.")
+
+    if check_out <= check_in:
+        raise ValidationError({"check_out": "Must be after check_in."})
+
+    return queryset.available(check_in, check_out, guests)
+
+
+def filter_rating(queryset, params):
+    """Applies ?min_rating= to a listing queryset"""
+    min_rating = parse_decimal_param(params, "min_rating", min_value=0, max_value=5)
+    if min_rating is None:
+        return queryset
+    return queryset.filter(rating_avg__gte=float(min_rating))
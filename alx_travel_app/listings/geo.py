@@ -0,0 +1,215 @@
+"""
+Radius and bounding-box search over listing coordinates, without PostGIS.
+
+Every listing stores the geohash of its latitude/longitude. A search covers
+its area with a few geohash cells, chosen as fine as possible while staying
+under GEO_MAX_CELLS, and turns them into index range scans on the geohash
+column (adjacent cells merge into one range). A bounding box is then exact
+with plain lat/lng comparisons; a radius search fetches the candidate
+coordinates once and keeps the ones whose haversine distance is in range,
+stopping early once more than the caller's cap are in range.
+"""
+
+import itertools
+import math
+
+from django.conf import settings
+from django.db.models import Q
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+# Stored precision; 8 characters is a cell of about 38m x 19m
+PRECISION = 8
+EARTH_RADIUS_KM = 6371.0088
+# Candidates measured per pass of a radius search
+CHUNK_SIZE = 2000
+
+
+class TooManyMatches(Exception):
+    pass
+
+
+def encode(latitude, longitude, precision=PRECISION):
+    """Geohash of a point"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits = value = 0
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = value = 0
+    return "".join(chars)
+
+
+def cell_size(precision):
+    """(height, width) in degrees of a geohash cell"""
+    lng_bits = math.ceil(5 * precision / 2)
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2**lat_bits, 360.0 / 2**lng_bits
+
+
+def _steps(low, high, size, origin):
+    first = max(0, math.floor((low - origin) / size))
+    last = math.floor((min(high, -origin) - origin) / size)
+    # high sits on the last cell's upper edge at the end of the range
+    last = min(last, round(-2 * origin / size) - 1)
+    return range(first, last + 1)
+
+
+def covering_cells(boxes, max_cells=None):
+    """Geohash prefixes covering every (south, west, north, east) box"""
+    max_cells = max_cells or settings.GEO_MAX_CELLS
+    best = [""]
+    for precision in range(1, PRECISION + 1):
+        height, width = cell_size(precision)
+        cells = set()
+        for south, west, north, east in boxes:
+            rows = _steps(south, north, height, -90.0)
+            columns = _steps(west, east, width, -180.0)
+            if len(cells) + len(rows) * len(columns) > max_cells:
+                return best
+            for row in rows:
+                for column in columns:
+                    cells.add(
+                        encode(
+                            -90.0 + (row + 0.5) * height,
+                            -180.0 + (column + 0.5) * width,
+                            precision,
+                        )
+                    )
+        best = sorted(cells)
+    return best
+
+
+def _successor(cell):
+    """The first geohash after every one starting with cell, or None"""
+    chars = list(cell)
+    while chars:
+        index = BASE32.index(chars[-1])
+        if index + 1 < len(BASE32):
+            chars[-1] = BASE32[index + 1]
+            return "".join(chars)
+        chars.pop()
+    return None
+
+
+def cell_ranges(cells):
+    """Merges sorted prefixes into [start, end) ranges; end None is unbounded"""
+    ranges = []
+    for cell in cells:
+        end = _successor(cell)
+        if ranges and ranges[-1][1] == cell:
+            ranges[-1][1] = end
+        else:
+            ranges.append([cell, end])
+    return ranges
+
+
+def cells_condition(cells):
+    """Q matching geohashes under any of the cells, as index range scans"""
+    condition = Q()
+    for start, end in cell_ranges(cells):
+        if not start and end is None:
+            return Q(geohash__gt="")
+        bounds = Q(geohash__gte=start) if start else Q(geohash__gt="")
+        if end is not None:
+            bounds &= Q(geohash__lt=end)
+        condition |= bounds
+    return condition
+
+
+def split_box(south, west, north, east):
+    """Boxes crossing the antimeridian (west > east) become two"""
+    if west <= east:
+        return [(south, west, north, east)]
+    return [(south, west, north, 180.0), (south, -180.0, north, east)]
+
+
+def box_condition(south, west, north, east):
+    """Q for listings inside the box, served by the geohash index"""
+    boxes = split_box(south, west, north, east)
+    inside = Q()
+    for s, w, n, e in boxes:
+        inside |= Q(
+            latitude__gte=s, latitude__lte=n, longitude__gte=w, longitude__lte=e
+        )
+    return cells_condition(covering_cells(boxes)) & inside
+
+
+def radius_box(latitude, longitude, radius_km):
+    """Smallest lat/lng box around a circle, as (south, west, north, east)"""
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    south, north = latitude - delta_lat, latitude + delta_lat
+    if south <= -90 or north >= 90:
+        # The circle holds a pole, so every longitude
+        return max(south, -90.0), -180.0, min(north, 90.0), 180.0
+
+    ratio = math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(latitude))
+    if ratio >= 1:
+        return south, -180.0, north, 180.0
+    delta_lng = math.degrees(math.asin(ratio))
+    west = (longitude - delta_lng + 540) % 360 - 180
+    east = (longitude + delta_lng + 540) % 360 - 180
+    return south, west, north, east
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """Distances in km from one point to many, given as coordinate columns"""
+    lat1 = math.radians(latitude)
+    lng1 = math.radians(longitude)
+    cos_lat1 = math.cos(lat1)
+    sin, cos, asin, sqrt, radians = (
+        math.sin,
+        math.cos,
+        math.asin,
+        math.sqrt,
+        math.radians,
+    )
+    diameter = 2 * EARTH_RADIUS_KM
+    return [
+        diameter
+        * asin(
+            sqrt(
+                sin((radians(lat2) - lat1) / 2) ** 2
+                + cos_lat1 * cos(radians(lat2)) * sin((radians(lng2) - lng1) / 2) ** 2
+            )
+        )
+        for lat2, lng2 in zip(latitudes, longitudes)
+    ]
+
+
+def within_radius(queryset, latitude, longitude, radius_km, max_matches=None):
+    """{pk: distance_km} of the queryset's listings inside the circle.
+
+    Candidates are measured column-wise a chunk at a time; past max_matches
+    listings in range, TooManyMatches is raised without reading the rest.
+    """
+    candidates = queryset.filter(
+        box_condition(*radius_box(latitude, longitude, radius_km))
+    ).values_list("pk", "latitude", "longitude")
+    rows = candidates.iterator(chunk_size=CHUNK_SIZE)
+    matches = {}
+    try:
+        while chunk := list(itertools.islice(rows, CHUNK_SIZE)):
+            ids, latitudes, longitudes = zip(*chunk)
+            distances = haversine_km(latitude, longitude, latitudes, longitudes)
+            matches.update(
+                (pk, distance)
+                for pk, distance in zip(ids, distances)
+                if distance <= radius_km
+            )
+            if max_matches is not None and len(matches) > max_matches:
+                raise TooManyMatches(f"More than {max_matches} listings in range")
+    finally:
+        rows.close()
+    return matches
@@ -0,0 +1,195 @@
+"""
+Idempotency-Key support for POST endpoints.
+
+The first request with a key claims it by inserting an IdempotencyKey row,
+runs, and stores its status and body on the row. Repeats within
+IDEMPOTENCY_KEY_TTL get that response back from the row, without running the
+view, so no second booking, payment or Chapa call is made. A duplicate that
+arrives while the first request is still running polls the row until the
+outcome is stored (or IDEMPOTENCY_WAIT_TIMEOUT passes, then it gets a 409).
+
+Keys are scoped to the caller, and reusing one for a different request is
+refused with a 422. Server errors are not stored, so a retry after a 5xx or
+an exception runs again. The rows live in the database rather than the cache
+because the configured cache is per process. Async views use
+arun_idempotent, which runs the same steps off the event loop.
+"""
+
+import functools
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.05
+
+
+def _digest(*parts):
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def request_fingerprint(request):
+    if hasattr(request, "data"):
+        body = json.dumps(request.data, sort_keys=True, default=str)
+    else:
+        # A plain Django request, as async views get
+        body = request.body.decode(errors="replace")
+    return _digest(request.method, request.path, body)
+
+
+def _claim(key, fingerprint):
+    """Returns (row, None) once the key is ours, or (None, (data, status, headers))
+    to answer with"""
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+    while True:
+        now = timezone.now()
+        row = IdempotencyKey.objects.filter(key=key).first()
+        if row is not None and row.expires_at <= now:
+            IdempotencyKey.objects.filter(pk=row.pk, expires_at__lte=now).delete()
+            row = None
+
+        if row is None:
+            try:
+                with transaction.atomic():
+                    row = IdempotencyKey.objects.create(
+                        key=key,
+                        fingerprint=fingerprint,
+                        locked_until=now
+                        + timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT),
+                        expires_at=now
+                        + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                    )
+                return row, None
+            except IntegrityError:
+                # A duplicate claimed it first; read its row
+                continue
+
+        if row.fingerprint != fingerprint:
+            return None, (
+                {"detail": f"{HEADER} was already used for a different request."},
+                status.HTTP_422_UNPROCESSABLE_ENTITY,
+                {},
+            )
+        if row.status_code is not None:
+            return None, (row.body, row.status_code, {"Idempotent-Replayed": "true"})
+
+        if row.locked_until <= now:
+            # The request holding the key died; take it over
+            taken = IdempotencyKey.objects.filter(
+                pk=row.pk, status_code__isnull=True, locked_until=row.locked_until
+            ).update(
+                locked_until=now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+            )
+            if taken:
+                return row, None
+            continue
+
+        if time.monotonic() >= deadline:
+            return None, (
+                {"detail": f"A request with this {HEADER} is still in progress."},
+                status.HTTP_409_CONFLICT,
+                {"Retry-After": "1"},
+            )
+        time.sleep(POLL_INTERVAL)
+
+
+def begin(request, user):
+    """Claims the request's key; returns (row, None) or (None, answer).
+
+    row is None too when the request has no key, and answer is the
+    (data, status, headers) to send instead of running the view.
+    """
+    header = request.headers.get(HEADER)
+    if header is None:
+        return None, None
+    if not header or len(header) > MAX_KEY_LENGTH:
+        return None, (
+            {"detail": f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters."},
+            status.HTTP_400_BAD_REQUEST,
+            {},
+        )
+
+    caller = str(getattr(user, "pk", None) or "")
+    return _claim(_digest(caller, header), request_fingerprint(request))
+
+
+def finish(row, status_code, data):
+    """Stores the outcome on the claimed row; server errors are forgotten"""
+    if status_code >= 500:
+        IdempotencyKey.objects.filter(pk=row.pk).delete()
+    else:
+        IdempotencyKey.objects.filter(pk=row.pk).update(
+            status_code=status_code, body=data
+        )
+
+
+def forget(row):
+    IdempotencyKey.objects.filter(pk=row.pk).delete()
+
+
+def run_idempotent(request, handler):
+    """Runs handler() once per Idempotency-Key, replaying its response after"""
+    row, answer = begin(request, request.user)
+    if answer is not None:
+        data, status_code, headers = answer
+        return Response(data, status_code, headers=headers)
+    if row is None:
+        return handler()
+
+    try:
+        response = handler()
+    except Exception:
+        forget(row)
+        raise
+    finish(row, response.status_code, response.data)
+    return response
+
+
+async def arun_idempotent(request, user, handler):
+    """run_idempotent for async views.
+
+    handler is a coroutine function returning (data, status); the result is
+    the (data, status, headers) to answer with.
+    """
+    row, answer = await sync_to_async(begin)(request, user)
+    if answer is not None:
+        return answer
+    if row is None:
+        return (*await handler(), {})
+
+    try:
+        data, status_code = await handler()
+    except BaseException:
+        await sync_to_async(forget)(row)
+        raise
+    await sync_to_async(finish)(row, status_code, data)
+    return data, status_code, {}
+
+
+def idempotent(view_method):
+    """Honors the Idempotency-Key header on a viewset or APIView method"""
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        return run_idempotent(
+            request, lambda: view_method(self, request, *args, **kwargs)
+        )
+
+    return wrapper
+
+
+def purge_expired():
+    """Deletes keys past their TTL; returns how many"""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
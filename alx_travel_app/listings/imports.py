@@ -0,0 +1,230 @@
+"""
+Streaming bulk import of listings from CSV or NDJSON.
+
+The file is parsed one row at a time and handled in chunks: each chunk is
+validated with the ListingSerializer rules, then upserted on (host,
+external_id) with bulk_create(update_conflicts=True), one call per set of
+columns the rows give, and reindexed for search. Rows that fail are written to an NDJSON error report as they
+are found, so memory stays bounded by one chunk whatever the file size.
+"""
+
+import csv
+import io
+import json
+import os
+import tempfile
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from . import geo
+from .caching import bump_generation, bump_listing_version
+from .models import Listing, ListingImport
+from .search import index_listings
+from .serializers import ListingImportSerializer
+
+FORMATS = ("csv", "ndjson")
+
+
+def detect_format(filename):
+    """csv or ndjson from a file name, or None"""
+    extension = os.path.splitext(filename or "")[1].lower().lstrip(".")
+    if extension in ("json", "jsonl"):
+        return "ndjson"
+    return extension if extension in FORMATS else None
+
+
+def read_rows(stream, fmt):
+    """Yields (line number, row dict or None, error) from a binary stream"""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            # Empty cells count as missing, so optional columns can be left blank
+            yield reader.line_num, {k: v for k, v in row.items() if v != ""}, None
+        return
+
+    for line_num, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_num, None, {"non_field_errors": ["Invalid JSON."]}
+            continue
+        if not isinstance(row, dict):
+            yield line_num, None, {"non_field_errors": ["Expected a JSON object."]}
+            continue
+        yield line_num, row, None
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _report(report, line_num, row, errors):
+    entry = {"line": line_num, "external_id": (row or {}).get("external_id")}
+    report.write(json.dumps({**entry, "errors": errors}) + "\n")
+
+
+def _upsert(host_id, rows):
+    """Writes validated rows of one chunk; returns (created, updated) counts"""
+    external_ids = [data["external_id"] for data in rows]
+    existing = dict(
+        Listing.objects.filter(
+            host_id=host_id, external_id__in=external_ids
+        ).values_list("external_id", "pk")
+    )
+    # A row updates the columns it gives. Rows are upserted in groups of the
+    # same columns, so no row resets a column another row in the chunk gave.
+    groups = defaultdict(list)
+    for data in rows:
+        groups[frozenset(data) - {"external_id"}].append(data)
+    # MySQL upserts on any unique key and takes no conflict target
+    target = {}
+    if connection.features.supports_update_conflicts_with_target:
+        target["unique_fields"] = ["host", "external_id"]
+
+    with transaction.atomic():
+        for columns, group in groups.items():
+            columns = sorted(columns)
+            listings = [Listing(host_id=host_id, **data) for data in group]
+            if "latitude" in columns:
+                # bulk_create skips the pre_save signal that keeps it
+                columns.append("geohash")
+                for listing in listings:
+                    if listing.latitude is not None:
+                        listing.geohash = geo.encode(
+                            listing.latitude, listing.longitude
+                        )
+            Listing.objects.bulk_create(
+                listings,
+                update_conflicts=True,
+                update_fields=[*columns, "updated_at"],
+                **target,
+            )
+        index_listings(
+            Listing.objects.filter(host_id=host_id, external_id__in=external_ids)
+        )
+
+    for pk in existing.values():
+        bump_listing_version(pk)
+    return len(rows) - len(existing), len(existing)
+
+
+def import_listings(stream, fmt, host_id, report, chunk_size=None, progress=None):
+    """Imports a host's listings from a binary CSV/NDJSON stream.
+
+    Failed rows go to report (a text stream) as NDJSON; progress, when given,
+    is called with the running counts after each chunk. Returns the counts.
+    """
+    chunk_size = chunk_size or settings.LISTING_IMPORT_CHUNK_SIZE
+    serializer = ListingImportSerializer()
+    counts = {"rows": 0, "created": 0, "updated": 0, "failed": 0}
+
+    for chunk in _chunks(read_rows(stream, fmt), chunk_size):
+        # Later rows win when an external id repeats within the chunk
+        valid = {}
+        for line_num, row, errors in chunk:
+            if errors is None:
+                try:
+                    data = serializer.run_validation(row)
+                except ValidationError as exc:
+                    errors = exc.detail
+            if errors is not None:
+                _report(report, line_num, row, errors)
+                counts["failed"] += 1
+                continue
+
+            previous = valid.pop(data["external_id"], None)
+            if previous is not None:
+                _report(
+                    report,
+                    previous[0],
+                    previous[1],
+                    {"external_id": [f"Superseded by line {line_num}."]},
+                )
+                counts["failed"] += 1
+            valid[data["external_id"]] = (line_num, data)
+
+        if valid:
+            created, updated = _upsert(host_id, [data for _, data in valid.values()])
+            counts["created"] += created
+            counts["updated"] += updated
+        counts["rows"] += len(chunk)
+        if progress is not None:
+            progress(counts)
+
+    if counts["created"] or counts["updated"]:
+        bump_generation()
+    return counts
+
+
+def run_import(import_id):
+    """Runs a stored ListingImport, keeping its counts current per chunk"""
+    job = ListingImport.objects.get(pk=import_id)
+    ListingImport.objects.filter(pk=job.pk).update(
+        status=ListingImport.ImportStatus.RUNNING, updated_at=timezone.now()
+    )
+
+    def progress(counts):
+        ListingImport.objects.filter(pk=job.pk).update(
+            updated_at=timezone.now(), **counts
+        )
+
+    # The report is spooled to disk and stored once complete
+    with tempfile.TemporaryFile("w+b") as spool:
+        report = io.TextIOWrapper(spool, encoding="utf-8", write_through=True)
+        try:
+            with default_storage.open(job.source, "rb") as source:
+                counts = import_listings(
+                    source, job.format, job.host_id, report, progress=progress
+                )
+        except Exception as exc:
+            # Whatever went wrong, the job must not stay running
+            ListingImport.objects.filter(pk=job.pk).update(
+                status=ListingImport.ImportStatus.FAILED,
+                error=str(exc),
+                updated_at=timezone.now(),
+                finished_at=timezone.now(),
+            )
+            if not isinstance(exc, (OSError, UnicodeDecodeError, csv.Error)):
+                raise
+            return None
+
+        report_name = ""
+        if counts["failed"]:
+            spool.seek(0)
+            report_name = default_storage.save(
+                f"imports/{job.pk}-errors.ndjson", File(spool)
+            )
+        report.detach()
+
+    ListingImport.objects.filter(pk=job.pk).update(
+        status=ListingImport.ImportStatus.DONE,
+        report=report_name,
+        updated_at=timezone.now(),
+        finished_at=timezone.now(),
+        **counts,
+    )
+    return counts
+
+
+def create_import(host_id, upload, fmt):
+    """Stores an uploaded file and the ListingImport that will read it"""
+    job = ListingImport(host_id=host_id, format=fmt)
+    job.source = default_storage.save(f"imports/{job.pk}.{fmt}", upload)
+    job.save()
+    return job
@@ -0,0 +1,139 @@
+"""
+Batched email delivery.
+
+Tasks call queue_mail() instead of send_mail(). The flush_mail_queue task
+then drains the queue in chunks, sending every message of a chunk over a
+single SMTP connection instead of one connection per message.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import QueuedEmail
+
+logger = logging.getLogger(__name__)
+
+# Claimed rows are hidden from other flushers for this long; if a worker dies
+# mid-send they become due again once the lease runs out.
+CLAIM_LEASE = timedelta(minutes=5)
+
+
+def queue_mail(subject, message, recipient_list, from_email=None):
+    """Buffers an email for the next flush"""
+    return QueuedEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(recipient_list),
+    )
+
+
+def queue_mass_mail(datatuple):
+    """Buffers many emails with one INSERT, like Django's send_mass_mail.
+
+    datatuple holds (subject, message, from_email, recipient_list) entries.
+    """
+    return QueuedEmail.objects.bulk_create(
+        QueuedEmail(
+            subject=subject,
+            body=message,
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            to=list(recipient_list),
+        )
+        for subject, message, from_email, recipient_list in datatuple
+    )
+
+
+def retry_delay(attempts):
+    """Exponential backoff between delivery attempts"""
+    return timedelta(seconds=settings.EMAIL_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def claim_batch(batch_size):
+    """Leases up to batch_size due messages to the calling worker"""
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            QueuedEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=QueuedEmail.EmailStatus.PENDING, next_attempt_at__lte=now)
+            .order_by("next_attempt_at")[:batch_size]
+        )
+        QueuedEmail.objects.filter(pk__in=[row.pk for row in batch]).update(
+            next_attempt_at=now + CLAIM_LEASE
+        )
+    return batch
+
+
+def send_batch(batch):
+    """Sends a batch over one connection; returns {row.pk: error or None}"""
+    results = {}
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        return {row.pk: str(e) for row in batch}
+
+    try:
+        for row in batch:
+            email = EmailMessage(
+                subject=row.subject,
+                body=row.body,
+                from_email=row.from_email,
+                to=row.to,
+                connection=connection,
+            )
+            try:
+                connection.send_messages([email])
+                results[row.pk] = None
+            except Exception as e:
+                results[row.pk] = str(e)
+    finally:
+        connection.close()
+    return results
+
+
+def record_results(batch, results):
+    now = timezone.now()
+    for row in batch:
+        error = results.get(row.pk)
+        if error is None:
+            row.status = QueuedEmail.EmailStatus.SENT
+            row.sent_at = now
+            continue
+
+        row.attempts += 1
+        row.last_error = error
+        row.next_attempt_at = now + retry_delay(row.attempts)
+        if row.attempts >= settings.EMAIL_MAX_ATTEMPTS:
+            row.status = QueuedEmail.EmailStatus.FAILED
+            logger.error("Giving up on email %s: %s", row.pk, error)
+
+    QueuedEmail.objects.bulk_update(
+        batch, ["status", "sent_at", "attempts", "last_error", "next_attempt_at"]
+    )
+
+
+def flush_queue(batch_size=None, max_batches=None):
+    """Delivers due queued emails in chunks; returns sent/failed counts"""
+    batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+    sent = failed = batches = 0
+
+    while max_batches is None or batches < max_batches:
+        batch = claim_batch(batch_size)
+        if not batch:
+            break
+
+        results = send_batch(batch)
+        record_results(batch, results)
+
+        errors = sum(1 for error in results.values() if error is not None)
+        sent += len(batch) - errors
+        failed += errors
+        batches += 1
+
+    return {"sent": sent, "failed": failed, "batches": batches}
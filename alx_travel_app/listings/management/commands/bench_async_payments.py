@@ -0,0 +1,219 @@
+import asyncio
+import json
+import os
+import statistics
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+
+from listings import chapa
+from listings.models import Booking, Listing, Payment, User
+
+from .bench_endpoints import percentile
+
+
+class SlowChapaHandler(BaseHTTPRequestHandler):
+    """Answers verify calls with a pending status after the server's latency"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        # Pending leaves the payments untouched, so every run sees the same rows
+        payload = json.dumps({"status": "success", "data": {"status": "pending"}})
+        payload = payload.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-tests payment verification against a Chapa stub with injected "
+        "latency: the sync view on a thread pool against the async view on "
+        "one event loop, reporting throughput and latency percentiles."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=400)
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=200.0,
+            help="Milliseconds the Chapa stub waits before answering.",
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=8,
+            help="Worker threads serving the sync view, like a WSGI server.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=64,
+            help="Requests in flight at once against the async view.",
+        )
+        parser.add_argument("--payments", type=int, default=50)
+
+    def handle(self, *args, **options):
+        stub = ThreadingHTTPServer(("127.0.0.1", 0), SlowChapaHandler)
+        stub.latency = options["latency"] / 1000
+        stub.daemon_threads = True
+        threading.Thread(target=stub.serve_forever, args=(0.05,), daemon=True).start()
+        previous = chapa._client, chapa._client_pid
+        chapa._client = chapa.ChapaClient(
+            base_url=f"http://127.0.0.1:{stub.server_address[1]}",
+            secret_key="bench",
+            max_retries=0,
+            pool_size=max(options["threads"], options["concurrency"]),
+        )
+        chapa._client_pid = os.getpid()
+
+        overrides = override_settings(
+            QUERY_BUDGET_RAISE=False,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+        )
+        # Worker threads and the event loop use their own connections, so the
+        # rows are committed rather than held in a transaction, then deleted
+        host, admin, payment_ids = self._create(options["payments"])
+        try:
+            with overrides:
+                login = Client()
+                login.force_login(admin)
+                cookies = login.cookies
+                results = {
+                    "sync": self._run_sync(cookies, payment_ids, options),
+                    "async": asyncio.run(
+                        self._run_async(cookies, payment_ids, options)
+                    ),
+                }
+                login.logout()
+        finally:
+            chapa._client, chapa._client_pid = previous
+            stub.shutdown()
+            stub.server_close()
+            host.delete()
+            admin.delete()
+
+        self._print(results, options)
+
+    def _create(self, count):
+        host = User.objects.create()
+        listing = Listing.objects.create(
+            host=host,
+            name="Async payment bench",
+            description="Benchmark listing",
+            location="Nairobi",
+            price_per_night=100,
+            max_guests=2,
+        )
+        start = date.today() + timedelta(days=10 * 365)
+        payment_ids = []
+        for n in range(count):
+            booking = Booking.objects.create(
+                listing=listing,
+                user=host,
+                start_date=start + timedelta(days=n * 2),
+                end_date=start + timedelta(days=n * 2 + 1),
+                total_price=100,
+                status="pending",
+            )
+            payment = Payment.objects.create(booking=booking, amount=100)
+            payment_ids.append(str(payment.pk))
+        admin = get_user_model().objects.create(
+            username=f"bench-async-{time.monotonic_ns()}", is_staff=True
+        )
+        return host, admin, payment_ids
+
+    def _path(self, kind, payment_ids, i):
+        prefix = "/api/async/payments" if kind == "async" else "/api/payments"
+        return f"{prefix}/{payment_ids[i % len(payment_ids)]}/verify/"
+
+    def _run_sync(self, cookies, payment_ids, options):
+        timings, errors = [], []
+        next_index = iter(range(options["requests"]))
+        lock = threading.Lock()
+
+        def worker():
+            client = Client()
+            client.cookies = cookies
+            try:
+                while True:
+                    with lock:
+                        i = next(next_index, None)
+                    if i is None:
+                        return
+                    began = time.perf_counter()
+                    response = client.get(self._path("sync", payment_ids, i))
+                    timings.append((time.perf_counter() - began) * 1000)
+                    errors.append(response.status_code >= 400)
+            finally:
+                connections.close_all()
+
+        began = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(options["threads"])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self._summary(timings, errors, time.perf_counter() - began)
+
+    async def _run_async(self, cookies, payment_ids, options):
+        client = AsyncClient()
+        client.cookies = cookies
+        slots = asyncio.Semaphore(options["concurrency"])
+        timings, errors = [], []
+
+        async def send(i):
+            async with slots:
+                began = time.perf_counter()
+                response = await client.get(self._path("async", payment_ids, i))
+                timings.append((time.perf_counter() - began) * 1000)
+                errors.append(response.status_code >= 400)
+
+        began = time.perf_counter()
+        await asyncio.gather(*(send(i) for i in range(options["requests"])))
+        return self._summary(timings, errors, time.perf_counter() - began)
+
+    def _summary(self, timings, errors, elapsed):
+        timings.sort()
+        return {
+            "requests": len(timings),
+            "errors": sum(errors),
+            "seconds": round(elapsed, 3),
+            "rps": round(len(timings) / elapsed, 1),
+            "mean_ms": round(statistics.fmean(timings), 1),
+            "p50_ms": round(percentile(timings, 50), 1),
+            "p95_ms": round(percentile(timings, 95), 1),
+        }
+
+    def _print(self, results, options):
+        self.stdout.write(
+            f"{options['requests']} verify requests, Chapa latency "
+            f"{options['latency']:g}ms, {options['threads']} sync threads, "
+            f"{options['concurrency']} async in flight"
+        )
+        self.stdout.write(
+            f"{'view':<8}{'req/s':>9}{'p50':>9}{'p95':>9}{'seconds':>9}{'errors':>8}"
+        )
+        for name, result in results.items():
+            line = (
+                f"{name:<8}{result['rps']:>9.1f}{result['p50_ms']:>9.1f}"
+                f"{result['p95_ms']:>9.1f}{result['seconds']:>9.2f}"
+                f"{result['errors']:>8}"
+            )
+            self.stdout.write(self.style.WARNING(line) if result["errors"] else line)
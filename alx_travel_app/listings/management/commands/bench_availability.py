@@ -0,0 +1,96 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from listings.models import Booking, Listing, User
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Benchmarks the availability search as the number of bookings grows."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listings", type=int, default=2000)
+        parser.add_argument(
+            "--bookings",
+            type=int,
+            nargs="+",
+            default=[10_000, 50_000, 100_000],
+            help="Booking totals to measure at (cumulative).",
+        )
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+
+        # Everything is rolled back so the benchmark leaves no rows behind
+        try:
+            with transaction.atomic():
+                self._run(rng, options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, rng, options):
+        host = User.objects.create()
+        listings = Listing.objects.bulk_create(
+            Listing(
+                host=host,
+                name=f"Bench listing {i}",
+                description="",
+                location="Nairobi, Kenya",
+                price_per_night=50,
+                max_guests=rng.randint(1, 6),
+            )
+            for i in range(options["listings"])
+        )
+
+        start = date.today()
+        created = 0
+        self.stdout.write(f"{'bookings':>10} {'avg ms':>10} {'max ms':>10}")
+
+        for target in sorted(options["bookings"]):
+            batch = []
+            while created < target:
+                offset = rng.randint(0, 365)
+                nights = rng.randint(1, 14)
+                batch.append(
+                    Booking(
+                        listing=rng.choice(listings),
+                        user=host,
+                        start_date=start + timedelta(days=offset),
+                        end_date=start + timedelta(days=offset + nights),
+                        total_price=0,
+                        status=rng.choice(["pending", "confirmed", "canceled"]),
+                    )
+                )
+                created += 1
+            Booking.objects.bulk_create(batch, batch_size=5000)
+
+            if connection.vendor == "sqlite":
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE")
+
+            timings = []
+            for _ in range(options["repeat"]):
+                check_in = start + timedelta(days=rng.randint(0, 365))
+                check_out = check_in + timedelta(days=rng.randint(1, 7))
+                began = time.perf_counter()
+                list(
+                    Listing.objects.available(check_in, check_out, 2).values_list(
+                        "pk", flat=True
+                    )
+                )
+                timings.append((time.perf_counter() - began) * 1000)
+
+            self.stdout.write(
+                f"{created:>10} {sum(timings) / len(timings):>10.2f} "
+                f"{max(timings):>10.2f}"
+            )
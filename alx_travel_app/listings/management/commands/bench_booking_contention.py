@@ -0,0 +1,170 @@
+import random
+import threading
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Exists, OuterRef
+from django.test import Client, override_settings
+
+from alx_travel_app.celery import app
+from listings.models import Booking, Listing, User
+
+from .bench_endpoints import percentile
+
+
+def overlapping_pairs(listing_ids):
+    """Active bookings of the listings that share a night with another one"""
+    active = Booking.objects.filter(status__in=Booking.ACTIVE_STATUSES)
+    clash = active.filter(
+        listing_id=OuterRef("listing_id"),
+        start_date__lt=OuterRef("end_date"),
+        end_date__gt=OuterRef("start_date"),
+    ).exclude(pk=OuterRef("pk"))
+    return active.filter(listing_id__in=listing_ids).filter(Exists(clash)).count()
+
+
+class Command(BaseCommand):
+    help = (
+        "Stress-tests booking creation: concurrent writers post overlapping "
+        "stays for a few listings, then the bookings are checked for overlaps "
+        "and the throughput is reported."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--writers", type=int, default=16, help="Concurrent writer threads."
+        )
+        parser.add_argument(
+            "--requests", type=int, default=50, help="Bookings posted per writer."
+        )
+        parser.add_argument(
+            "--listings",
+            type=int,
+            default=4,
+            help="Listings the writers compete for; fewer means more contention.",
+        )
+        parser.add_argument(
+            "--nights",
+            type=int,
+            default=60,
+            help="Window of nights the requested stays fall in.",
+        )
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        if not connection.features.has_select_for_update:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{connection.vendor} ignores select_for_update; writers are "
+                    "only serialized by its write lock (on SQLite, set the "
+                    'transaction_mode option to "IMMEDIATE")'
+                )
+            )
+
+        # Writers use their own connections, so the rows are committed
+        # rather than held in a transaction, then deleted
+        host = User.objects.create()
+        listing_ids = [
+            Listing.objects.create(
+                host=host,
+                name=f"Contention bench {n}",
+                description="Benchmark listing",
+                location="Nairobi",
+                price_per_night=100,
+                max_guests=2,
+            ).pk
+            for n in range(options["listings"])
+        ]
+
+        overrides = override_settings(
+            QUERY_BUDGET_RAISE=False,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+        )
+        # Confirmation mails are queued inline instead of through the broker
+        eager = app.conf.task_always_eager
+        app.conf.task_always_eager = True
+        try:
+            with overrides:
+                result = self._run(host, listing_ids, options)
+            result["overlaps"] = overlapping_pairs(listing_ids)
+        finally:
+            app.conf.task_always_eager = eager
+            host.delete()
+
+        self._print(result, options)
+        if result["overlaps"]:
+            raise CommandError(f"{result['overlaps']} bookings overlap another")
+
+    def _run(self, host, listing_ids, options):
+        first_night = date.today() + timedelta(days=20 * 365)
+        statuses, timings = [], []
+        barrier = threading.Barrier(options["writers"])
+
+        def writer(n):
+            rng = random.Random(options["seed"] + n)
+            # Lock timeouts and deadlocks count as errors instead of raising
+            client = Client(raise_request_exception=False)
+            barrier.wait()
+            try:
+                for _ in range(options["requests"]):
+                    start = first_night + timedelta(
+                        days=rng.randrange(options["nights"])
+                    )
+                    end = start + timedelta(days=rng.randint(1, 4))
+                    began = time.perf_counter()
+                    response = client.post(
+                        "/api/booking/",
+                        {
+                            "listing": str(rng.choice(listing_ids)),
+                            "user": str(host.pk),
+                            "start_date": start.isoformat(),
+                            "end_date": end.isoformat(),
+                            "status": "pending",
+                        },
+                        content_type="application/json",
+                    )
+                    timings.append((time.perf_counter() - began) * 1000)
+                    statuses.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=writer, args=(n,))
+            for n in range(options["writers"])
+        ]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+
+        timings.sort()
+        return {
+            "requests": len(statuses),
+            "created": statuses.count(201),
+            "conflicts": statuses.count(409),
+            "errors": sum(1 for code in statuses if code not in (201, 409)),
+            "seconds": round(elapsed, 3),
+            "rps": round(len(statuses) / elapsed, 1),
+            "p50_ms": round(percentile(timings, 50), 1),
+            "p95_ms": round(percentile(timings, 95), 1),
+        }
+
+    def _print(self, result, options):
+        self.stdout.write(
+            f"{options['writers']} writers x {options['requests']} bookings over "
+            f"{options['listings']} listings and {options['nights']} nights "
+            f"({connection.vendor})"
+        )
+        self.stdout.write(
+            f"created {result['created']}, conflicts {result['conflicts']}, "
+            f"errors {result['errors']}, overlaps {result['overlaps']}"
+        )
+        self.stdout.write(
+            f"{result['rps']:.1f} req/s, p50 {result['p50_ms']:.1f}ms, "
+            f"p95 {result['p95_ms']:.1f}ms, {result['seconds']:.2f}s"
+        )
@@ -0,0 +1,412 @@
+import hashlib
+import hmac
+import json
+import logging
+import math
+import os
+import platform
+import statistics
+import threading
+import time
+import tracemalloc
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+
+from listings import chapa
+from listings.middleware import QueryCounter
+from listings.models import Booking, Listing, Payment, User
+
+METRICS = ["p50_ms", "p95_ms", "p99_ms", "queries", "peak_kb"]
+WEBHOOK_SECRET = "bench-webhook-secret"
+
+
+class _Rollback(Exception):
+    pass
+
+
+class StubChapaHandler(BaseHTTPRequestHandler):
+    """Answers every Chapa call with a successful response"""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; Nagle would delay the body
+    disable_nagle_algorithm = True
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        payload = json.dumps(
+            {
+                "status": "success",
+                "data": {"checkout_url": "https://checkout.chapa.co/bench"},
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def compare(baseline, current, threshold, min_delta_ms, min_delta_kb):
+    """Returns (endpoint, metric, before, after) for every regression"""
+    regressions = []
+    for name, after in current.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        for metric in METRICS:
+            old, new = before.get(metric), after.get(metric)
+            if old is None or new is None:
+                continue
+            floor = {"peak_kb": min_delta_kb, "queries": 0}.get(metric, min_delta_ms)
+            if new - old > floor and new > old * (1 + threshold / 100):
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the listing, booking and payment endpoints in-process and "
+        "records latency percentiles, queries and peak memory per endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listings", type=int, default=2000)
+        parser.add_argument("--bookings", type=int, default=20000)
+        parser.add_argument("--reviews", type=int, default=5000)
+        parser.add_argument("--payments", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--requests", type=int, default=100)
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument(
+            "--memory-requests",
+            type=int,
+            default=5,
+            help="Requests per endpoint traced with tracemalloc.",
+        )
+        parser.add_argument(
+            "--endpoint",
+            action="append",
+            help="Only run the named endpoint (repeatable).",
+        )
+        parser.add_argument(
+            "--cache",
+            action="store_true",
+            help="Keep the listing response cache on (off by default).",
+        )
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+        parser.add_argument(
+            "--compare", help="Baseline JSON file to check the results against."
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=20.0,
+            help="Percent increase over the baseline counted as a regression.",
+        )
+        parser.add_argument("--min-delta-ms", type=float, default=1.0)
+        parser.add_argument("--min-delta-kb", type=float, default=64.0)
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                baseline = json.load(f)
+
+        stub = ThreadingHTTPServer(("127.0.0.1", 0), StubChapaHandler)
+        threading.Thread(target=stub.serve_forever, args=(0.05,), daemon=True).start()
+        previous = chapa._client, chapa._client_pid
+        chapa._client = chapa.ChapaClient(
+            base_url=f"http://127.0.0.1:{stub.server_address[1]}",
+            secret_key="bench",
+            max_retries=0,
+        )
+        chapa._client_pid = os.getpid()
+
+        overrides = override_settings(
+            CHAPA_WEBHOOK_SECRET=WEBHOOK_SECRET,
+            LISTINGS_CACHE_ENABLED=options["cache"],
+            QUERY_BUDGET_RAISE=False,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+        )
+        # Query counts are reported per endpoint, budget warnings are noise here
+        budget_logger = logging.getLogger("listings.middleware")
+        level = budget_logger.level
+        budget_logger.setLevel(logging.ERROR)
+
+        # Everything is rolled back so the benchmark leaves no rows behind
+        try:
+            with overrides, transaction.atomic():
+                results = self._run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            chapa._client, chapa._client_pid = previous
+            budget_logger.setLevel(level)
+            stub.shutdown()
+            stub.server_close()
+            cache.clear()
+
+        report = {
+            "meta": {
+                "dataset": {
+                    name: options[name]
+                    for name in ("listings", "bookings", "reviews", "payments", "seed")
+                },
+                "requests": options["requests"],
+                "cache": options["cache"],
+                "database": connection.vendor,
+                "python": platform.python_version(),
+                "django": django.get_version(),
+            },
+            "endpoints": results,
+        }
+        self._print(results)
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is not None:
+            self._compare(baseline, report, options)
+
+    def _run(self, options):
+        call_command(
+            "seed",
+            listings=options["listings"],
+            bookings=options["bookings"],
+            reviews=options["reviews"],
+            payments=options["payments"],
+            seed=options["seed"],
+            stdout=self.stdout if options["verbosity"] > 1 else StringIO(),
+        )
+
+        admin = get_user_model().objects.create(
+            username="bench-admin", is_staff=True, is_superuser=True
+        )
+        client = Client()
+        client.force_login(admin)
+
+        endpoints = self._endpoints()
+        if options["endpoint"]:
+            unknown = set(options["endpoint"]) - set(endpoints)
+            if unknown:
+                raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+            endpoints = {name: endpoints[name] for name in options["endpoint"]}
+
+        results = {}
+        for name, make_request in endpoints.items():
+            results[name] = self._measure(client, make_request, options)
+        return results
+
+    def _endpoints(self):
+        listing_ids = [
+            str(pk) for pk in Listing.objects.values_list("pk", flat=True)[:200]
+        ]
+        booking_ids = [
+            str(pk) for pk in Booking.objects.values_list("pk", flat=True)[:200]
+        ]
+        payment_ids = [
+            str(pk) for pk in Payment.objects.values_list("pk", flat=True)[:200]
+        ]
+        user_ids = [str(pk) for pk in User.objects.values_list("pk", flat=True)[:50]]
+        # Far enough ahead that bulk bookings never collide with seeded ones
+        future = date.today() + timedelta(days=5 * 365)
+        check_in = date.today() + timedelta(days=30)
+
+        def pick(ids, i):
+            return ids[i % len(ids)]
+
+        def bulk(i):
+            start = future + timedelta(days=i * 3)
+            items = [
+                {
+                    "listing": pick(listing_ids, i + n),
+                    "user": pick(user_ids, n),
+                    "start_date": start.isoformat(),
+                    "end_date": (start + timedelta(days=2)).isoformat(),
+                }
+                for n in range(10)
+            ]
+            return "post", "/api/booking/bulk/", {"data": items}
+
+        def webhook(i):
+            body = json.dumps(
+                {
+                    "id": f"bench-{i}-{time.monotonic_ns()}",
+                    "event": "charge.success",
+                    "tx_ref": pick(payment_ids, i),
+                    "status": "success",
+                }
+            ).encode()
+            signature = hmac.new(
+                WEBHOOK_SECRET.encode(), body, hashlib.sha256
+            ).hexdigest()
+            return (
+                "post",
+                "/api/chapa-webhook/",
+                {"data": body, "HTTP_CHAPA_SIGNATURE": signature},
+            )
+
+        endpoints = {
+            "listings-list": lambda i: ("get", "/api/listings/", {}),
+            "listings-available": lambda i: (
+                "get",
+                "/api/listings/",
+                {
+                    "data": {
+                        "check_in": (check_in + timedelta(days=i % 60)).isoformat(),
+                        "check_out": (
+                            check_in + timedelta(days=i % 60 + 3)
+                        ).isoformat(),
+                        "guests": 2,
+                    }
+                },
+            ),
+            "listings-detail": lambda i: (
+                "get",
+                f"/api/listings/{pick(listing_ids, i)}/",
+                {},
+            ),
+            "listings-search": lambda i: (
+                "get",
+                "/api/listings/search/",
+                {"data": {"q": ["cozy villa", "quiet cabin nai", "modern lo"][i % 3]}},
+            ),
+            "bookings-list": lambda i: ("get", "/api/booking/", {}),
+            "bookings-detail": lambda i: (
+                "get",
+                f"/api/booking/{pick(booking_ids, i)}/",
+                {},
+            ),
+            "bookings-bulk": bulk,
+            "payments-list": lambda i: ("get", "/api/payments/", {}),
+            "payments-verify": lambda i: (
+                "get",
+                f"/api/payments/{pick(payment_ids, i)}/verify/",
+                {},
+            ),
+            "payments-complete": lambda i: (
+                "get",
+                f"/api/payments/{pick(payment_ids, i)}/complete/",
+                {},
+            ),
+            "chapa-webhook": webhook,
+        }
+        if not listing_ids:
+            for name in ("listings-detail", "bookings-bulk"):
+                endpoints.pop(name)
+        if not booking_ids:
+            endpoints.pop("bookings-detail")
+        if not payment_ids:
+            for name in ("payments-verify", "payments-complete", "chapa-webhook"):
+                endpoints.pop(name)
+        return endpoints
+
+    def _send(self, client, make_request, i):
+        method, path, kwargs = make_request(i)
+        if method == "post":
+            kwargs.setdefault("content_type", "application/json")
+        return getattr(client, method)(path, **kwargs)
+
+    def _measure(self, client, make_request, options):
+        for i in range(options["warmup"]):
+            self._send(client, make_request, i)
+
+        timings = []
+        queries = []
+        errors = 0
+        offset = options["warmup"]
+        for i in range(offset, offset + options["requests"]):
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                began = time.perf_counter()
+                response = self._send(client, make_request, i)
+                timings.append((time.perf_counter() - began) * 1000)
+            queries.append(counter.count)
+            errors += response.status_code >= 400
+
+        # tracemalloc slows every allocation, so memory gets its own pass
+        peaks = []
+        offset += options["requests"]
+        tracemalloc.start()
+        try:
+            for i in range(offset, offset + options["memory_requests"]):
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                self._send(client, make_request, i)
+                peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        finally:
+            tracemalloc.stop()
+
+        timings.sort()
+        return {
+            "requests": len(timings),
+            "errors": errors,
+            "mean_ms": round(statistics.fmean(timings), 3),
+            "p50_ms": round(percentile(timings, 50), 3),
+            "p95_ms": round(percentile(timings, 95), 3),
+            "p99_ms": round(percentile(timings, 99), 3),
+            "queries": round(statistics.fmean(queries), 2),
+            "peak_kb": round(max(peaks, default=0) / 1024, 1),
+        }
+
+    def _print(self, results):
+        header = f"{'endpoint':<20}{'p50':>9}{'p95':>9}{'p99':>9}{'queries':>9}{'peak KiB':>10}{'errors':>8}"
+        self.stdout.write(header)
+        for name, result in results.items():
+            line = (
+                f"{name:<20}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+                f"{result['p99_ms']:>9.2f}{result['queries']:>9.2f}"
+                f"{result['peak_kb']:>10.1f}{result['errors']:>8}"
+            )
+            self.stdout.write(self.style.WARNING(line) if result["errors"] else line)
+
+    def _compare(self, baseline, report, options):
+        if baseline.get("meta", {}).get("dataset") != report["meta"]["dataset"]:
+            self.stdout.write(
+                self.style.WARNING("Baseline was recorded on a different dataset")
+            )
+
+        regressions = compare(
+            baseline.get("endpoints", {}),
+            report["endpoints"],
+            options["threshold"],
+            options["min_delta_ms"],
+            options["min_delta_kb"],
+        )
+        if not regressions:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"No regressions above {options['threshold']:g}% "
+                    f"against {options['compare']}"
+                )
+            )
+            return
+
+        for name, metric, old, new in regressions:
+            self.stdout.write(self.style.ERROR(f"{name} {metric}: {old} -> {new}"))
+        raise CommandError(f"{len(regressions)} regression(s) against the baseline")
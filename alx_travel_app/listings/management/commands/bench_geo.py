@@ -0,0 +1,142 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from listings import geo
+from listings.models import Listing, User
+
+# (name, latitude, longitude) of the dense areas listings cluster around
+CENTERS = [
+    ("Nairobi", -1.2921, 36.8219),
+    ("Mombasa", -4.0435, 39.6682),
+    ("Kisumu", -0.0917, 34.7680),
+    ("Nakuru", -0.3031, 36.0800),
+]
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks ?near= and ?bbox= listing searches against a full-table "
+        "haversine scan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listings", type=int, default=1_000_000)
+        parser.add_argument(
+            "--radius",
+            type=float,
+            nargs="+",
+            default=[1, 5, 10, 25],
+            help="Radii (km) to measure ?near= at.",
+        )
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument(
+            "--skip-scan",
+            action="store_true",
+            help="Don't time the full-table scan baseline.",
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+
+        # Everything is rolled back so the benchmark leaves no rows behind
+        try:
+            with transaction.atomic():
+                self._run(rng, options)
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, rng, options):
+        started = time.perf_counter()
+        self._populate(rng, options)
+        self.stdout.write(
+            f"Created {options['listings']} listings in "
+            f"{time.perf_counter() - started:.1f}s ({connection.vendor})"
+        )
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+        self.stdout.write(f"{'search':<22}{'avg ms':>10}{'p95 ms':>10}{'matches':>10}")
+        for radius in sorted(options["radius"]):
+            timings, matches = [], 0
+            for _ in range(options["repeat"]):
+                _, lat, lng = rng.choice(CENTERS)
+                lat, lng = rng.gauss(lat, 0.05), rng.gauss(lng, 0.05)
+                began = time.perf_counter()
+                matches = len(
+                    geo.within_radius(Listing.objects.all(), lat, lng, radius)
+                )
+                timings.append((time.perf_counter() - began) * 1000)
+            self._row(f"near {radius:g}km", timings, matches)
+
+        for size in (0.05, 0.2):
+            timings, matches = [], 0
+            for _ in range(options["repeat"]):
+                _, lat, lng = rng.choice(CENTERS)
+                queryset = Listing.objects.filter(
+                    geo.box_condition(lat - size, lng - size, lat + size, lng + size)
+                )
+                began = time.perf_counter()
+                matches = len(list(queryset.values_list("pk", flat=True)))
+                timings.append((time.perf_counter() - began) * 1000)
+            self._row(f"bbox {2 * size:g}deg", timings, matches)
+
+        if not options["skip_scan"]:
+            _, lat, lng = CENTERS[0]
+            radius = max(options["radius"])
+            began = time.perf_counter()
+            rows = list(Listing.objects.values_list("pk", "latitude", "longitude"))
+            distances = geo.haversine_km(
+                lat, lng, [row[1] for row in rows], [row[2] for row in rows]
+            )
+            matches = sum(distance <= radius for distance in distances)
+            self._row(
+                f"scan {radius:g}km",
+                [(time.perf_counter() - began) * 1000],
+                matches,
+            )
+
+    def _populate(self, rng, options):
+        host = User.objects.create()
+        remaining = options["listings"]
+        while remaining:
+            batch = []
+            for _ in range(min(options["batch_size"], remaining)):
+                if rng.random() < 0.8:
+                    _, lat, lng = rng.choice(CENTERS)
+                    lat, lng = rng.gauss(lat, 0.15), rng.gauss(lng, 0.15)
+                else:
+                    # Thin background across Kenya
+                    lat, lng = rng.uniform(-4.7, 4.6), rng.uniform(33.9, 41.9)
+                batch.append(
+                    Listing(
+                        host=host,
+                        name="Bench listing",
+                        description="",
+                        location="Kenya",
+                        price_per_night=50,
+                        latitude=lat,
+                        longitude=lng,
+                        geohash=geo.encode(lat, lng),
+                    )
+                )
+            Listing.objects.bulk_create(batch)
+            remaining -= len(batch)
+
+    def _row(self, name, timings, matches):
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(
+            f"{name:<22}{statistics.mean(timings):>10.2f}{p95:>10.2f}{matches:>10}"
+        )
@@ -0,0 +1,125 @@
+import random
+import statistics
+import time
+from collections import Counter
+from itertools import accumulate
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from listings.models import Listing, ListingSearchTerm, User
+from listings.search import (
+    DOCUMENT_COUNT_CACHE_KEY,
+    build_postings,
+    search,
+    update_vocabulary,
+)
+
+CITIES = [
+    "Nairobi",
+    "Mombasa",
+    "Naivasha",
+    "Kisumu",
+    "Nakuru",
+    "Malindi",
+    "Diani",
+    "Lamu",
+    "Eldoret",
+    "Nanyuki",
+]
+KINDS = ["apartment", "villa", "cabin", "cottage", "studio", "loft", "house"]
+ADJECTIVES = ["cozy", "luxurious", "quiet", "modern", "rustic", "sunny", "spacious"]
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Benchmarks listing full-text search on a synthetic index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listings", type=int, default=1_000_000)
+        parser.add_argument("--vocabulary", type=int, default=20_000)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+
+        # Everything is rolled back so the benchmark leaves no rows behind
+        try:
+            with transaction.atomic():
+                self._run(rng, options)
+                raise _Rollback
+        except _Rollback:
+            pass
+        cache.delete(DOCUMENT_COUNT_CACHE_KEY)
+
+    def _run(self, rng, options):
+        vocabulary = [f"word{i}" for i in range(options["vocabulary"])]
+        # Zipf-like weights so a few words are very common
+        cum_weights = list(accumulate(1 / (i + 1) for i in range(len(vocabulary))))
+
+        host = User.objects.create()
+        began = time.perf_counter()
+        remaining = options["listings"]
+        while remaining:
+            size = min(remaining, options["batch_size"])
+            listings = [
+                Listing(
+                    host=host,
+                    name=f"{rng.choice(ADJECTIVES)} {rng.choice(KINDS)}",
+                    location=f"{rng.choice(CITIES)}, Kenya",
+                    description=" ".join(
+                        rng.choices(
+                            vocabulary, cum_weights=cum_weights, k=rng.randint(15, 40)
+                        )
+                    ),
+                    price_per_night=rng.randint(20, 400),
+                )
+                for _ in range(size)
+            ]
+            # bulk_create skips post_save, so postings are built here
+            Listing.objects.bulk_create(listings)
+            postings = [p for listing in listings for p in build_postings(listing)]
+            ListingSearchTerm.objects.bulk_create(
+                postings, batch_size=options["batch_size"]
+            )
+            update_vocabulary(Counter(p.term for p in postings))
+            remaining -= size
+        self.stdout.write(
+            f"Indexed {options['listings']} listings in "
+            f"{time.perf_counter() - began:.1f}s"
+        )
+
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+        cache.delete(DOCUMENT_COUNT_CACHE_KEY)
+        search("warmup")
+
+        queries = [
+            f"{rng.choice(ADJECTIVES)} {rng.choice(KINDS)} {rng.choice(CITIES)[:3]}"
+            for _ in range(options["queries"])
+        ]
+        queries += [
+            " ".join(rng.choices(vocabulary, k=2)) for _ in range(options["queries"])
+        ]
+
+        timings = []
+        for query in queries:
+            began = time.perf_counter()
+            search(query)
+            timings.append((time.perf_counter() - began) * 1000)
+
+        timings.sort()
+        self.stdout.write(
+            f"queries={len(timings)} "
+            f"p50={statistics.median(timings):.2f}ms "
+            f"p95={timings[int(len(timings) * 0.95) - 1]:.2f}ms "
+            f"max={timings[-1]:.2f}ms"
+        )
@@ -0,0 +1,119 @@
+import logging
+import statistics
+import time
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+
+from listings.management.commands.bench_endpoints import percentile
+
+# (name, path) pairs; every one runs on both the DRF and the values() path
+REQUESTS = [
+    ("listings-full", "/api/listings/?page_size=200"),
+    (
+        "listings-sparse",
+        "/api/listings/?page_size=200&fields=listing_id,name,price_per_night",
+    ),
+    ("bookings-full", "/api/booking/?page_size=200"),
+    (
+        "bookings-sparse",
+        "/api/booking/?page_size=200&fields=booking_id,start_date,end_date,status",
+    ),
+]
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares list serialization through DRF model instances with the "
+        "values() path, for full and sparse fieldsets."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listings", type=int, default=2000)
+        parser.add_argument("--bookings", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--requests", type=int, default=50)
+        parser.add_argument("--warmup", type=int, default=3)
+
+    def handle(self, *args, **options):
+        overrides = override_settings(
+            LISTINGS_CACHE_ENABLED=False,
+            QUERY_BUDGET_RAISE=False,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+        )
+        budget_logger = logging.getLogger("listings.middleware")
+        level = budget_logger.level
+        budget_logger.setLevel(logging.ERROR)
+
+        # Everything is rolled back so the benchmark leaves no rows behind
+        try:
+            with overrides, transaction.atomic():
+                results = self._run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            budget_logger.setLevel(level)
+            cache.clear()
+
+        self.stdout.write(
+            f"{'request':<18}{'drf p50':>10}{'values p50':>12}{'speedup':>10}"
+        )
+        for name, timings in results.items():
+            drf, fast = timings["drf"], timings["values"]
+            self.stdout.write(
+                f"{name:<18}{drf:>10.2f}{fast:>12.2f}{drf / fast if fast else 0:>9.1f}x"
+            )
+
+    def _run(self, options):
+        call_command(
+            "seed",
+            listings=options["listings"],
+            bookings=options["bookings"],
+            reviews=0,
+            payments=0,
+            seed=options["seed"],
+            skip_search_index=True,
+            stdout=StringIO(),
+        )
+        admin = get_user_model().objects.create(
+            username="bench-admin", is_staff=True, is_superuser=True
+        )
+        client = Client()
+        client.force_login(admin)
+
+        results = {}
+        for name, path in REQUESTS:
+            results[name] = {
+                label: self._measure(client, path, enabled, options)
+                for label, enabled in (("drf", False), ("values", True))
+            }
+        return results
+
+    def _measure(self, client, path, enabled, options):
+        timings = []
+        with override_settings(API_VALUES_LIST=enabled):
+            for i in range(options["warmup"] + options["requests"]):
+                started = time.perf_counter()
+                response = client.get(path)
+                elapsed = (time.perf_counter() - started) * 1000
+                if response.status_code != 200:
+                    self.stderr.write(f"{path}: HTTP {response.status_code}")
+                if i >= options["warmup"]:
+                    timings.append(elapsed)
+        timings.sort()
+        if options["verbosity"] > 1:
+            self.stdout.write(
+                f"{path} values={enabled} mean={statistics.mean(timings):.2f}"
+            )
+        return percentile(timings, 50)
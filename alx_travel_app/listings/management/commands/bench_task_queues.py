@@ -0,0 +1,315 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import defaultdict, deque
+
+from celery import Celery
+from celery.utils.time import rate
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from kombu.utils.limits import TokenBucket
+
+from .bench_endpoints import percentile
+
+EMAIL_TASK = "listings.tasks.send_booking_confirmation"
+PAYMENT_TASKS = (
+    "listings.tasks.apply_chapa_webhook_events",
+    "listings.tasks.send_payment_checkout_mail",
+)
+
+
+def task_topology(names, routed=True):
+    """Maps task names to the (queue, priority, rate limit) the settings give.
+
+    routed=False is the topology without routes: one queue, no priorities
+    and no rate limits.
+    """
+    app = Celery("bench_task_queues", set_as_current=False)
+    app.config_from_object("django.conf:settings", namespace="CELERY")
+    if not routed:
+        return {name: (app.conf.task_default_queue, 0, None) for name in names}
+
+    topology = {}
+    for name in names:
+        route = app.amqp.router.route({}, name, (), {})
+        annotation = (app.conf.task_annotations or {}).get(name, {})
+        topology[name] = (
+            route["queue"].name,
+            route.get("priority", app.conf.task_default_priority) or 0,
+            rate(annotation.get("rate_limit")) or None,
+        )
+    return topology
+
+
+class MemoryBroker:
+    """In-memory broker stand-in: a priority queue per Celery queue"""
+
+    def __init__(self):
+        self.queues = defaultdict(list)
+        self.counter = itertools.count()
+        self.ready = threading.Condition()
+
+    def publish(self, queue, priority, message):
+        with self.ready:
+            # Higher priorities first, then publish order, like RabbitMQ
+            heapq.heappush(self.queues[queue], (-priority, next(self.counter), message))
+            self.ready.notify_all()
+
+    def fetch(self, queues, count, timeout):
+        """Takes up to count messages, cycling over the queues like kombu does"""
+        with self.ready:
+            if not any(self.queues[queue] for queue in queues):
+                self.ready.wait(timeout)
+            batch = []
+            while len(batch) < count and any(self.queues[queue] for queue in queues):
+                for queue in queues:
+                    if self.queues[queue] and len(batch) < count:
+                        batch.append(heapq.heappop(self.queues[queue])[2])
+            return batch
+
+
+class WorkerNode:
+    """A worker consuming some queues with a pool of `concurrency` threads.
+
+    Like a Celery worker, it holds at most concurrency * prefetch_multiplier
+    unacked messages, acks each after its task ran, and rate-limits tasks
+    with one token bucket per task name for the whole node.
+    """
+
+    def __init__(self, broker, queues, concurrency, prefetch_multiplier, topology):
+        self.broker = broker
+        self.queues = queues
+        self.concurrency = concurrency
+        self.prefetch = concurrency * prefetch_multiplier
+        self.buckets = {
+            name: TokenBucket(limit, capacity=1)
+            for name, (_, _, limit) in topology.items()
+            if limit
+        }
+        self.reserved = deque()
+        self.unacked = 0
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.threads = []
+
+    def start(self, run_task):
+        self.threads = [
+            threading.Thread(target=self._work, args=(run_task,), daemon=True)
+            for _ in range(self.concurrency)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        for thread in self.threads:
+            thread.join()
+
+    def _next(self):
+        with self.lock:
+            if not self.reserved and self.unacked < self.prefetch:
+                batch = self.broker.fetch(self.queues, self.prefetch - self.unacked, 0)
+                self.reserved.extend(batch)
+                self.unacked += len(batch)
+            return self.reserved.popleft() if self.reserved else None
+
+    def _wait_for_token(self, name):
+        bucket = self.buckets.get(name)
+        while bucket is not None and not self.stopping.is_set():
+            with self.lock:
+                if bucket.can_consume(1):
+                    return
+                delay = bucket.expected_time(1)
+            time.sleep(delay)
+
+    def _work(self, run_task):
+        while not self.stopping.is_set():
+            message = self._next()
+            if message is None:
+                time.sleep(0.001)
+                continue
+            self._wait_for_token(message["task"])
+            run_task(message)
+            with self.lock:
+                self.unacked -= 1
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the Celery queue topology on an in-memory broker stand-in: "
+        "payment tasks arrive while workers process an email backlog, once "
+        "with every task on one queue and once routed by CELERY_TASK_ROUTES, "
+        "reporting payment-task latency and email throughput."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--emails", type=int, default=100_000, help="Email backlog size."
+        )
+        parser.add_argument(
+            "--payments-per-second",
+            type=float,
+            default=20.0,
+            help="Rate payment tasks are published at.",
+        )
+        parser.add_argument(
+            "--duration",
+            type=float,
+            default=10.0,
+            help="Seconds payment tasks are published for.",
+        )
+        parser.add_argument(
+            "--email-ms", type=float, default=2.0, help="Run time of an email task."
+        )
+        parser.add_argument(
+            "--payment-ms",
+            type=float,
+            default=10.0,
+            help="Run time of a payment task.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=8,
+            help="Worker threads in total, split between the routed workers.",
+        )
+        parser.add_argument(
+            "--payment-concurrency",
+            type=int,
+            default=2,
+            help="Threads of the payments worker in the routed topology.",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=120.0,
+            help="Seconds to wait for the published payments to finish.",
+        )
+
+    def handle(self, *args, **options):
+        multiplier = settings.CELERY_WORKER_PREFETCH_MULTIPLIER
+        names = [EMAIL_TASK, *PAYMENT_TASKS]
+        results = {}
+
+        single = task_topology(names, routed=False)
+        queue = single[EMAIL_TASK][0]
+        results["single"] = self._run(
+            single,
+            [([queue], options["concurrency"])],
+            multiplier,
+            options,
+        )
+
+        routed = task_topology(names)
+        payment_queues = sorted({routed[name][0] for name in PAYMENT_TASKS})
+        email_queues = sorted(
+            {queue for queue, _, _ in routed.values()} - set(payment_queues)
+        )
+        results["routed"] = self._run(
+            routed,
+            [
+                (payment_queues, options["payment_concurrency"]),
+                (
+                    email_queues,
+                    options["concurrency"] - options["payment_concurrency"],
+                ),
+            ],
+            multiplier,
+            options,
+        )
+
+        self._print(results, routed, multiplier, options)
+
+    def _run(self, topology, workers, multiplier, options):
+        broker = MemoryBroker()
+        latencies, lock = [], threading.Lock()
+        emails_done = itertools.count()
+        payments_left = threading.Semaphore(0)
+        durations = {
+            name: (
+                options["payment_ms"] if name in PAYMENT_TASKS else options["email_ms"]
+            )
+            / 1000
+            for name in topology
+        }
+
+        def send(name):
+            queue, priority, _ = topology[name]
+            broker.publish(
+                queue, priority, {"task": name, "published": time.perf_counter()}
+            )
+
+        def run_task(message):
+            time.sleep(durations[message["task"]])
+            if message["task"] == EMAIL_TASK:
+                next(emails_done)
+                return
+            with lock:
+                latencies.append((time.perf_counter() - message["published"]) * 1000)
+            payments_left.release()
+
+        for _ in range(options["emails"]):
+            send(EMAIL_TASK)
+
+        nodes = [
+            WorkerNode(broker, queues, concurrency, multiplier, topology)
+            for queues, concurrency in workers
+            if concurrency > 0
+        ]
+        began = time.perf_counter()
+        for node in nodes:
+            node.start(run_task)
+
+        interval = 1 / options["payments_per_second"]
+        published = 0
+        while time.perf_counter() - began < options["duration"]:
+            send(PAYMENT_TASKS[published % len(PAYMENT_TASKS)])
+            published += 1
+            time.sleep(max(0.0, began + published * interval - time.perf_counter()))
+
+        deadline = time.perf_counter() + options["timeout"]
+        finished = 0
+        while finished < published and payments_left.acquire(
+            timeout=max(0.0, deadline - time.perf_counter())
+        ):
+            finished += 1
+        elapsed = time.perf_counter() - began
+        for node in nodes:
+            node.stop()
+
+        emails = next(emails_done)
+        latencies.sort()
+        return {
+            "payments": published,
+            "finished": finished,
+            "p50_ms": percentile(latencies, 50) if latencies else 0.0,
+            "p95_ms": percentile(latencies, 95) if latencies else 0.0,
+            "max_ms": latencies[-1] if latencies else 0.0,
+            "emails": emails,
+            "emails_per_second": emails / elapsed,
+            "seconds": elapsed,
+        }
+
+    def _print(self, results, routed, multiplier, options):
+        self.stdout.write(
+            f"{options['emails']} queued emails, {options['payments_per_second']:g} "
+            f"payments/s for {options['duration']:g}s, {options['concurrency']} "
+            f"worker threads, prefetch multiplier {multiplier}"
+        )
+        for name, (queue, priority, limit) in routed.items():
+            limit = f", {limit:g}/s" if limit else ""
+            self.stdout.write(f"  {name} -> {queue} (priority {priority}{limit})")
+        self.stdout.write(
+            f"{'topology':<10}{'payments':>10}{'p50':>10}{'p95':>10}{'max':>10}"
+            f"{'emails':>9}{'emails/s':>10}{'seconds':>9}"
+        )
+        for name, result in results.items():
+            line = (
+                f"{name:<10}{result['finished']:>5}/{result['payments']:<4}"
+                f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}"
+                f"{result['max_ms']:>10.1f}{result['emails']:>9}"
+                f"{result['emails_per_second']:>10.1f}{result['seconds']:>9.2f}"
+            )
+            unfinished = result["finished"] < result["payments"]
+            self.stdout.write(self.style.WARNING(line) if unfinished else line)
@@ -0,0 +1,54 @@
+import random
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.models import Listing
+from listings.rollups import check_stats
+
+
+class Command(BaseCommand):
+    help = "Compares the daily rollups with the raw bookings and payments."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--from", dest="start", type=date.fromisoformat, help="Default: a year ago"
+        )
+        parser.add_argument(
+            "--to", dest="end", type=date.fromisoformat, help="Default: a year ahead"
+        )
+        parser.add_argument(
+            "--sample", type=int, help="Only check this many random listings."
+        )
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--show", type=int, default=20)
+
+    def handle(self, *args, **options):
+        today = date.today()
+        start = options["start"] or today - timedelta(days=365)
+        end = options["end"] or today + timedelta(days=365)
+        if end <= start:
+            raise CommandError("--to must be after --from")
+
+        listing_ids = list(Listing.objects.order_by("pk").values_list("pk", flat=True))
+        if options["sample"] and options["sample"] < len(listing_ids):
+            listing_ids = random.Random(options["seed"]).sample(
+                listing_ids, options["sample"]
+            )
+
+        mismatches = check_stats(listing_ids, start, end)
+        for listing_id, day, stored, expected in mismatches[: options["show"]]:
+            self.stdout.write(
+                f"{listing_id} {day}: stored={stored} expected={expected}"
+            )
+
+        if mismatches:
+            raise CommandError(
+                f"{len(mismatches)} nights differ from the raw data "
+                f"across {len(listing_ids)} listings"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rollups of {len(listing_ids)} listings match from {start} to {end}"
+            )
+        )
@@ -0,0 +1,58 @@
+import sys
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.exports import EXPORTS, FORMATS, export_filename, stream_export
+
+
+class Command(BaseCommand):
+    help = "Streams every booking or payment to a NDJSON or CSV file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(EXPORTS))
+        parser.add_argument("--format", dest="fmt", choices=FORMATS, default="ndjson")
+        parser.add_argument(
+            "--from", dest="start", type=date.fromisoformat, help="Created on or after"
+        )
+        parser.add_argument(
+            "--to", dest="end", type=date.fromisoformat, help="Created before"
+        )
+        parser.add_argument("--status")
+        parser.add_argument("--gzip", action="store_true")
+        parser.add_argument(
+            "--output",
+            help="File to write, '-' for stdout. Default: a name from the filters.",
+        )
+
+    def handle(self, *args, **options):
+        kind, fmt = options["kind"], options["fmt"]
+        start, end = options["start"], options["end"]
+        if start and end and end <= start:
+            raise CommandError("--to must be after --from")
+
+        model, _ = EXPORTS[kind]
+        choices = dict(model._meta.get_field("status").choices)
+        if options["status"] and options["status"] not in choices:
+            raise CommandError(f"--status must be one of {', '.join(choices)}")
+
+        blocks = stream_export(
+            kind, fmt, start, end, options["status"], options["gzip"]
+        )
+        output = options["output"] or export_filename(
+            kind, fmt, start, end, options["gzip"]
+        )
+        if output == "-":
+            for block in blocks:
+                sys.stdout.buffer.write(block)
+            sys.stdout.buffer.flush()
+            return
+
+        written = 0
+        with open(output, "wb") as f:
+            for block in blocks:
+                f.write(block)
+                written += len(block)
+        self.stdout.write(
+            self.style.SUCCESS(f"Exported {kind} to {output} ({written} bytes)")
+        )
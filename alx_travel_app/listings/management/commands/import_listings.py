@@ -0,0 +1,74 @@
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.imports import FORMATS, create_import, detect_format, import_listings
+from listings.models import User
+from listings.tasks import import_listings_file
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports a host's listings from a CSV or NDJSON file, upserting on external_id."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--host", required=True, help="The host's user id.")
+        parser.add_argument(
+            "--format", dest="fmt", choices=FORMATS, help="Default: from the file name"
+        )
+        parser.add_argument("--chunk-size", type=int)
+        parser.add_argument(
+            "--report", help="Error report path. Default: <path>.errors.ndjson"
+        )
+        parser.add_argument(
+            "--async",
+            dest="run_async",
+            action="store_true",
+            help="Store the file and queue a Celery job instead.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["fmt"] or detect_format(path)
+        if fmt is None:
+            raise CommandError(
+                "Cannot tell the format from the file name, use --format"
+            )
+        try:
+            host = User.objects.get(pk=options["host"])
+        except (User.DoesNotExist, ValueError):
+            raise CommandError(f"No host with id {options['host']}")
+
+        if options["run_async"]:
+            with open(path, "rb") as f:
+                job = create_import(host.pk, File(f), fmt)
+            import_listings_file.delay(str(job.pk))
+            self.stdout.write(f"Queued import {job.pk}")
+            return
+
+        def progress(counts):
+            self.stdout.write(
+                f"{counts['rows']} rows: {counts['created']} created, "
+                f"{counts['updated']} updated, {counts['failed']} failed"
+            )
+
+        report_path = options["report"] or f"{path}.errors.ndjson"
+        with open(path, "rb") as source, open(report_path, "w") as report:
+            counts = import_listings(
+                source,
+                fmt,
+                host.pk,
+                report,
+                chunk_size=options["chunk_size"],
+                progress=progress if options["verbosity"] > 1 else None,
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {counts['rows']} rows: {counts['created']} created, "
+                f"{counts['updated']} updated, {counts['failed']} failed"
+            )
+        )
+        if counts["failed"]:
+            self.stdout.write(f"Errors written to {report_path}")
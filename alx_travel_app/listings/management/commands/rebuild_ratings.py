@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from listings.models import Listing, Review
+
+RATING_FIELDS = ["rating_count", "rating_sum"] + [f"rating_{i}" for i in range(1, 6)]
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the denormalized review aggregates on every listing."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+
+        # One grouped scan over reviews instead of an aggregate per listing
+        totals = Review.objects.values("listing_id").annotate(
+            rating_count=Count("pk"),
+            rating_sum=Sum("rating"),
+            **{f"rating_{i}": Count("pk", filter=Q(rating=i)) for i in range(1, 6)},
+        )
+        by_listing = {row.pop("listing_id"): row for row in totals.iterator()}
+
+        updated = 0
+        now = timezone.now()
+        empty = dict.fromkeys(RATING_FIELDS, 0)
+        listings = Listing.objects.only("pk", *RATING_FIELDS).order_by("pk")
+
+        batch = []
+        for listing in listings.iterator(chunk_size=batch_size):
+            row = by_listing.get(listing.pk, empty)
+            if all(getattr(listing, f) == row[f] for f in RATING_FIELDS):
+                continue
+
+            for field in RATING_FIELDS:
+                setattr(listing, field, row[field])
+            listing.updated_at = now
+            batch.append(listing)
+
+            if len(batch) >= batch_size:
+                updated += self._flush(batch)
+                batch = []
+
+        if batch:
+            updated += self._flush(batch)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt review aggregates for {updated} listings")
+        )
+
+    def _flush(self, batch):
+        with transaction.atomic():
+            Listing.objects.bulk_update(batch, RATING_FIELDS + ["updated_at"])
+            Listing.objects.filter(pk__in=[l.pk for l in batch]).update(
+                rating_avg=Listing.rating_avg_expression()
+            )
+        return len(batch)
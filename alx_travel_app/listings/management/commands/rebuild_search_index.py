@@ -0,0 +1,38 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from listings.models import Listing, ListingSearchTerm, SearchVocabulary
+from listings.search import DOCUMENT_COUNT_CACHE_KEY, index_listings
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the listing full-text search index from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        ListingSearchTerm.objects.all().delete()
+        SearchVocabulary.objects.all().delete()
+
+        listings = Listing.objects.only(
+            "pk", "name", "location", "description"
+        ).order_by("pk")
+
+        indexed = postings = 0
+        batch = []
+        for listing in listings.iterator(chunk_size=batch_size):
+            batch.append(listing)
+            if len(batch) >= batch_size:
+                postings += index_listings(batch, batch_size=batch_size)
+                indexed += len(batch)
+                batch = []
+        if batch:
+            postings += index_listings(batch, batch_size=batch_size)
+            indexed += len(batch)
+
+        cache.delete(DOCUMENT_COUNT_CACHE_KEY)
+        self.stdout.write(
+            self.style.SUCCESS(f"Indexed {indexed} listings ({postings} postings)")
+        )
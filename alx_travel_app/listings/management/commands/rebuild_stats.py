@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from listings.rollups import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the daily occupancy and revenue rollups from scratch."
+
+    def handle(self, *args, **options):
+        began = time.perf_counter()
+        result = rebuild_stats()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {result['rows']} daily stats rows for "
+                f"{result['listings']} listings in {time.perf_counter() - began:.1f}s"
+            )
+        )
@@ -1,46 +1,343 @@
+import random
+import time
 import uuid
+from collections import Counter
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
-from listings.models import Listing
-from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+
+from listings import geo
+from listings.caching import bump_generation
+from listings.models import Booking, Listing, ListingSearchTerm, Payment, Review, User
+from listings.search import build_postings, update_vocabulary
 
-User = get_user_model()
+CITIES = [
+    "Nairobi",
+    "Mombasa",
+    "Naivasha",
+    "Kisumu",
+    "Nakuru",
+    "Malindi",
+    "Diani",
+    "Lamu",
+    "Eldoret",
+    "Nanyuki",
+]
+# Approximate city centers; listings are scattered a few km around them
+CITY_COORDINATES = {
+    "Nairobi": (-1.2921, 36.8219),
+    "Mombasa": (-4.0435, 39.6682),
+    "Naivasha": (-0.7172, 36.4310),
+    "Kisumu": (-0.0917, 34.7680),
+    "Nakuru": (-0.3031, 36.0800),
+    "Malindi": (-3.2192, 40.1169),
+    "Diani": (-4.2797, 39.5947),
+    "Lamu": (-2.2717, 40.9020),
+    "Eldoret": (0.5143, 35.2698),
+    "Nanyuki": (0.0167, 37.0722),
+}
+# Fixed, so running the sample seed again finds its host instead of adding one
+SAMPLE_HOST_ID = uuid.UUID("5eed5eed-0000-4000-8000-000000000001")
+KINDS = ["Apartment", "Villa", "Cabin", "Cottage", "Studio", "Loft", "House"]
+ADJECTIVES = ["Cozy", "Luxurious", "Quiet", "Modern", "Rustic", "Sunny", "Spacious"]
+FEATURES = [
+    "ocean views",
+    "a private garden",
+    "fast wifi",
+    "a rooftop terrace",
+    "a fireplace",
+    "a swimming pool",
+    "secure parking",
+    "a fully equipped kitchen",
+]
+COMMENTS = [
+    "Great stay, would come back.",
+    "Clean and close to everything.",
+    "The host was very helpful.",
+    "Lovely place but a bit noisy.",
+    "Not as described.",
+]
+BOOKING_STATUSES = ["confirmed", "pending", "canceled"]
+# Ratings lean positive, as they do on real booking sites
+RATING_WEIGHTS = [0.04, 0.06, 0.15, 0.35, 0.40]
 
 
 class Command(BaseCommand):
-    help = "Seeds the database with sample listings."
+    help = (
+        "Seeds the database with sample listings, or with a large deterministic "
+        "synthetic dataset when volumes are given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listings", type=int, default=0)
+        parser.add_argument("--bookings", type=int, default=0)
+        parser.add_argument("--reviews", type=int, default=0)
+        parser.add_argument("--payments", type=int, default=0)
+        parser.add_argument(
+            "--users", type=int, help="Defaults to one user per 10 listings."
+        )
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--skew",
+            type=float,
+            default=1.1,
+            help="Zipf exponent of listing popularity (0 = uniform).",
+        )
+        parser.add_argument(
+            "--skip-search-index",
+            action="store_true",
+            help="Do not build search postings for the generated listings.",
+        )
+
+    def handle(self, *args, **options):
+        volumes = ("listings", "bookings", "reviews", "payments")
+        if not any(options[name] for name in volumes):
+            return self.seed_samples()
+
+        if options["bookings"] and not options["listings"]:
+            self.stderr.write("--bookings needs --listings")
+            return
+        if options["payments"] > options["bookings"]:
+            self.stderr.write("--payments cannot exceed --bookings")
+            return
+
+        if connection.vendor == "sqlite" and not connection.in_atomic_block:
+            # Durability is not needed for a throwaway dataset
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA synchronous = OFF")
+                cursor.execute("PRAGMA journal_mode = WAL")
+
+        self.rng = random.Random(options["seed"])
+        # Coordinates have their own stream, so a seed's other data is the
+        # same as before listings had coordinates
+        self.coordinates_rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        began = time.perf_counter()
 
-    def handle(self, *args, **kwargs):
-        user, created = User.objects.get_or_create(
-            username="test_host", defaults={"email": "test@example.com"}
+        users = self.seed_users(options["users"] or max(10, options["listings"] // 10))
+        listings = self.seed_listings(
+            options["listings"], users, not options["skip_search_index"]
         )
 
+        # Popularity rank is random so it is not tied to insertion order
+        ranks = list(range(len(listings)))
+        self.rng.shuffle(ranks)
+        cum_weights = list(
+            accumulate(1 / (rank + 1) ** options["skew"] for rank in ranks)
+        )
+
+        self.seed_bookings(
+            options["bookings"], options["payments"], listings, users, cum_weights
+        )
+        self.seed_reviews(options["reviews"], listings, users, cum_weights)
+
+        if options["reviews"]:
+            call_command("rebuild_ratings", stdout=self.stdout)
+        bump_generation()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Seeding finished in {time.perf_counter() - began:.1f}s"
+            )
+        )
+
+    def seed_samples(self):
+        user, _ = User.objects.get_or_create(user_id=SAMPLE_HOST_ID)
+
         sample_listings = [
             {
                 "name": "Cozy Apartment in Nairobi",
                 "description": "A lovely one-bedroom apartment in the heart of Nairobi.",
                 "location": "Nairobi, Kenya",
                 "price_per_night": 50.00,
-                "host": user,
             },
             {
                 "name": "Beachfront Villa in Mombasa",
                 "description": "Luxurious villa with stunning ocean views.",
                 "location": "Mombasa, Kenya",
                 "price_per_night": 150.00,
-                "host": user,
             },
             {
                 "name": "Cabin Retreat in Naivasha",
                 "description": "Quiet and peaceful getaway surrounded by nature.",
                 "location": "Naivasha, Kenya",
                 "price_per_night": 75.00,
-                "host": user,
             },
         ]
 
         for data in sample_listings:
-            Listing.objects.get_or_create(listing_id=uuid.uuid4(), **data)
+            Listing.objects.get_or_create(
+                host=user, name=data.pop("name"), defaults=data
+            )
 
         self.stdout.write(
             self.style.SUCCESS(f"Successfully seeded {len(sample_listings)} listings!")
         )
+
+    def uuid(self):
+        """Deterministic UUID4 drawn from the seeded generator"""
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def insert(self, label, total, rows):
+        """bulk_creates a stream of (model, obj) rows in batches"""
+        began = time.perf_counter()
+        batches = {}
+        inserted = 0
+
+        def flush():
+            # Parents are yielded before their children, so dict order is
+            # also a safe foreign-key order
+            with transaction.atomic():
+                for model, batch in batches.items():
+                    model.objects.bulk_create(batch)
+            batches.clear()
+
+        for model, obj in rows:
+            batch = batches.setdefault(model, [])
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                flush()
+            if model._meta.label == label:
+                inserted += 1
+                if inserted % (self.batch_size * 20) == 0 and inserted < total:
+                    self.report(label, inserted, began, total)
+        flush()
+
+        self.report(label, inserted, began, total, done=True)
+
+    def report(self, label, count, began, total, done=False):
+        elapsed = time.perf_counter() - began
+        rate = count / elapsed if elapsed else 0
+        line = f"{label}: {count}/{total} rows, {rate:,.0f} rows/s"
+        self.stdout.write(self.style.SUCCESS(line) if done else line)
+
+    def seed_users(self, count):
+        ids = [self.uuid() for _ in range(count)]
+        self.insert("listings.User", count, ((User, User(user_id=pk)) for pk in ids))
+        return ids
+
+    def seed_listings(self, count, users, index):
+        ids = []
+        prices = []
+        vocabulary = Counter()
+
+        def rows():
+            rng = self.rng
+            for _ in range(count):
+                city = rng.choice(CITIES)
+                kind = rng.choice(KINDS)
+                price = Decimal(rng.randint(20, 400))
+                lat, lng = CITY_COORDINATES[city]
+                scatter = self.coordinates_rng.gauss
+                lat, lng = scatter(lat, 0.05), scatter(lng, 0.05)
+                listing = Listing(
+                    listing_id=self.uuid(),
+                    host_id=rng.choice(users),
+                    name=f"{rng.choice(ADJECTIVES)} {kind} in {city}",
+                    description=(
+                        f"{kind} with {rng.choice(FEATURES)} and "
+                        f"{rng.choice(FEATURES)}, close to {rng.choice(CITIES)}."
+                    ),
+                    location=f"{city}, Kenya",
+                    price_per_night=price,
+                    max_guests=rng.randint(1, 8),
+                    latitude=lat,
+                    longitude=lng,
+                    geohash=geo.encode(lat, lng),
+                )
+                ids.append(listing.listing_id)
+                prices.append(price)
+                yield Listing, listing
+
+                if index:
+                    for posting in build_postings(listing):
+                        vocabulary[posting.term] += 1
+                        yield ListingSearchTerm, posting
+
+        self.insert("listings.Listing", count, rows())
+        update_vocabulary(vocabulary)
+        self.prices = prices
+        return ids
+
+    def seed_bookings(self, count, payments, listings, users, cum_weights):
+        if not count:
+            return
+
+        today = date.today()
+        # Next free night per listing keeps each listing's bookings disjoint
+        next_free = [self.rng.randint(-365, 0) for _ in listings]
+        payment_statuses = list(Payment.PaymentStatus.values)
+
+        def rows():
+            rng = self.rng
+            remaining_payments = payments
+            drawn = seen = 0
+            while drawn < count:
+                picks = rng.choices(
+                    range(len(listings)),
+                    cum_weights=cum_weights,
+                    k=min(self.batch_size, count - drawn),
+                )
+                for i in picks:
+                    start = next_free[i] + rng.randint(0, 3)
+                    nights = rng.randint(1, 7)
+                    next_free[i] = start + nights
+
+                    start_date = today + timedelta(days=start)
+                    total = self.prices[i] * nights
+                    booking = Booking(
+                        booking_id=self.uuid(),
+                        listing_id=listings[i],
+                        user_id=rng.choice(users),
+                        start_date=start_date,
+                        end_date=start_date + timedelta(days=nights),
+                        total_price=total,
+                        status=rng.choices(BOOKING_STATUSES, cum_weights=[7, 9, 10])[0],
+                    )
+                    yield Booking, booking
+
+                    # Selection sampling: exactly `payments` bookings get one
+                    left = count - seen
+                    seen += 1
+                    if rng.random() * left < remaining_payments:
+                        remaining_payments -= 1
+                        yield Payment, Payment(
+                            payment_id=self.uuid(),
+                            booking_id=booking.booking_id,
+                            booking_reference=str(booking.booking_id),
+                            amount=total,
+                            status=rng.choice(payment_statuses),
+                        )
+                drawn += len(picks)
+
+        self.insert("listings.Booking", count, rows())
+
+    def seed_reviews(self, count, listings, users, cum_weights):
+        if not count:
+            return
+
+        def rows():
+            rng = self.rng
+            drawn = 0
+            while drawn < count:
+                picks = rng.choices(
+                    range(len(listings)),
+                    cum_weights=cum_weights,
+                    k=min(self.batch_size, count - drawn),
+                )
+                for i in picks:
+                    yield Review, Review(
+                        review_id=self.uuid(),
+                        listing_id=listings[i],
+                        user_id=rng.choice(users),
+                        rating=rng.choices(range(1, 6), RATING_WEIGHTS)[0],
+                        comment=rng.choice(COMMENTS),
+                    )
+                drawn += len(picks)
+
+        self.insert("listings.Review", count, rows())
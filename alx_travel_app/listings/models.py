@@ -1,24 +1,198 @@
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models.functions import Cast
+from django.utils import timezone
 import uuid
 from django_chapa.models import ChapaTransactionMixin
 
 
 class User(models.Model):
     user_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # Where booking confirmations go
+    email = models.EmailField(blank=True)
+
+
+class ListingQuerySet(models.QuerySet):
+    def available(self, check_in, check_out, guests=None):
+        """Listings with no pending/confirmed booking overlapping the range"""
+        overlapping = Booking.objects.filter(listing=models.OuterRef("pk")).overlapping(
+            check_in, check_out
+        )
+
+        qs = self.filter(~models.Exists(overlapping))
+        if guests:
+            qs = qs.filter(max_guests__gte=guests)
+        return qs
+
+    def apply_review_delta(self, removed=None, added=None):
+        """Moves one rating out of/into the denormalized review aggregates.
+
+        Runs as two UPDATE statements so concurrent writers never lose
+        increments; rating_avg is recomputed from the updated columns.
+        """
+        changes = {}
+        if removed is not None:
+            changes[f"rating_{removed}"] = models.F(f"rating_{removed}") - 1
+        if added is not None:
+            key = f"rating_{added}"
+            changes[key] = changes.get(key, models.F(key)) + 1
+
+        count_delta = (added is not None) - (removed is not None)
+        sum_delta = (added or 0) - (removed or 0)
+
+        with transaction.atomic():
+            self.update(
+                rating_count=models.F("rating_count") + count_delta,
+                rating_sum=models.F("rating_sum") + sum_delta,
+                # Keeps ETags/Last-Modified in step with the new aggregates
+                updated_at=timezone.now(),
+                **changes,
+            )
+            self.update(rating_avg=Listing.rating_avg_expression())
 
 
 class Listing(models.Model):
     listing_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     host = models.ForeignKey(User, on_delete=models.CASCADE, related_name="listings")
+    # The host's own id for the listing; bulk imports upsert on it
+    external_id = models.CharField(max_length=100, null=True, blank=True)
     name = models.CharField(max_length=255)
     description = models.TextField()
     location = models.CharField(max_length=255)
     price_per_night = models.DecimalField(max_digits=10, decimal_places=2)
+    # Friday and Saturday nights; falls back to price_per_night when unset
+    weekend_price_per_night = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True
+    )
+    max_guests = models.PositiveIntegerField(default=1)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    # Geohash of latitude/longitude, kept by listings.signals (see listings.geo)
+    geohash = models.CharField(max_length=12, blank=True, default="")
+
+    # Denormalized review aggregates, maintained by listings.signals
+    rating_avg = models.FloatField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ListingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["created_at", "listing_id"], name="listing_created_idx"
+            ),
+            models.Index(fields=["rating_avg"], name="listing_rating_idx"),
+            models.Index(fields=["geohash"], name="listing_geohash_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["host", "external_id"], name="unique_listing_external_id"
+            ),
+        ]
+
+    # Written only by apply_review_delta and rebuild_ratings, never by save()
+    AGGREGATE_FIELDS = frozenset(
+        ["rating_avg", "rating_count", "rating_sum"]
+        + [f"rating_{i}" for i in range(1, 6)]
+    )
+
+    def save(self, *args, **kwargs):
+        """Saves the listing without writing back the review aggregates.
+
+        A listing loaded before a review came in still holds the old
+        aggregates, and a full save would overwrite the delta with them.
+        """
+        if (
+            not self._state.adding
+            and not kwargs.get("force_insert")
+            and kwargs.get("update_fields") is None
+        ):
+            skipped = self.AGGREGATE_FIELDS | self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                f.attname
+                for f in self._meta.concrete_fields
+                if not f.primary_key and f.attname not in skipped
+            ]
+        super().save(*args, **kwargs)
+
+    @property
+    def rating_histogram(self):
+        return {str(i): getattr(self, f"rating_{i}") for i in range(1, 6)}
+
+    @staticmethod
+    def rating_avg_expression():
+        return models.Case(
+            models.When(rating_count=0, then=models.Value(0.0)),
+            default=models.ExpressionWrapper(
+                Cast("rating_sum", models.FloatField()) / models.F("rating_count"),
+                output_field=models.FloatField(),
+            ),
+            output_field=models.FloatField(),
+        )
+
+
+class ListingRate(models.Model):
+    """Nightly price override for [start_date, end_date); the newest one wins"""
+
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="rates")
+    start_date = models.DateField()
+    end_date = models.DateField()
+    price_per_night = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["listing", "start_date", "end_date"],
+                name="listing_rate_range_idx",
+            ),
+        ]
+
+
+class StayDiscount(models.Model):
+    """Percent off the whole stay once it reaches min_nights"""
+
+    listing = models.ForeignKey(
+        Listing, on_delete=models.CASCADE, related_name="stay_discounts"
+    )
+    min_nights = models.PositiveIntegerField()
+    percent = models.DecimalField(max_digits=5, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["listing", "min_nights"], name="unique_stay_discount"
+            ),
+        ]
+
+
+class BookingQuerySet(models.QuerySet):
+    def overlapping(self, check_in, check_out):
+        """Active bookings whose [start_date, end_date) intersects the range"""
+        return self.filter(
+            status__in=Booking.ACTIVE_STATUSES,
+            start_date__lt=check_out,
+            end_date__gt=check_in,
+        )
+
+    def with_related(self):
+        """Joins listing and guest so templates/tasks don't lazy-load them"""
+        return self.select_related("listing", "user")
+
 
 class Booking(models.Model):
+    # Statuses that hold the listing's nights
+    ACTIVE_STATUSES = ("pending", "confirmed")
+
     booking_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     listing = models.ForeignKey(
         Listing, on_delete=models.CASCADE, related_name="bookings"
@@ -36,6 +210,29 @@ class Booking(models.Model):
         ],
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = BookingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Covers the availability overlap lookup per listing
+            models.Index(
+                fields=["listing", "start_date", "end_date", "status"],
+                name="booking_listing_range_idx",
+            ),
+            models.Index(
+                fields=["created_at", "booking_id"], name="booking_created_idx"
+            ),
+            # Watermark scans of listings.rollups
+            models.Index(fields=["updated_at"], name="booking_updated_idx"),
+        ]
+
+
+class PaymentQuerySet(models.QuerySet):
+    def with_booking(self):
+        """Joins booking, its listing and guest in the same query"""
+        return self.select_related("booking__listing", "booking__user")
 
 
 class Payment(ChapaTransactionMixin):
@@ -45,13 +242,12 @@ class Payment(ChapaTransactionMixin):
         FAILED = "failed", "Failed"
         CANCELLED = "canceled", "Canceled"
 
-    payment_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # The primary key is the mixin's id; payment_id is the public reference
+    payment_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
     booking = models.ForeignKey(
         Booking, on_delete=models.CASCADE, related_name="payments"
     )
-    booking_reference = models.CharField(
-        default=booking.listing.booking_id, editable=False
-    )
+    booking_reference = models.CharField(max_length=64, blank=True, editable=False)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     currency = models.CharField(max_length=3, default="KSH")
     status = models.CharField(
@@ -59,14 +255,28 @@ class Payment(ChapaTransactionMixin):
     )
     payment_method = models.CharField(max_length=50, null=True)
     transaction_id = models.UUIDField(default=uuid.uuid4, editable=False)
+    # Last time the reconciler asked Chapa about this payment
+    last_verified_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = PaymentQuerySet.as_manager()
+
     def __str__(self):
         return f"Payment {self.payment_id}-{self.booking.listing.name}"
 
     class Meta:
         swappable = "CHAPA_TRANSACTION_MODEL"
+        indexes = [
+            models.Index(
+                fields=["created_at", "payment_id"], name="payment_created_idx"
+            ),
+            models.Index(
+                fields=["status", "created_at", "payment_id"],
+                name="payment_status_created_idx",
+            ),
+            models.Index(fields=["updated_at"], name="payment_updated_idx"),
+        ]
 
 
 class Review(models.Model):
@@ -85,3 +295,195 @@ class Review(models.Model):
                 check=models.Q(rating__gte=1, rating__lte=5), name="rating_range"
             )
         ]
+
+
+class ListingSearchTerm(models.Model):
+    """One posting per (term, listing) in the listing search inverted index"""
+
+    term = models.CharField(max_length=64)
+    listing = models.ForeignKey(
+        Listing, on_delete=models.CASCADE, related_name="search_terms"
+    )
+    # Field-weighted term frequency and its length-normalized BM25 weight
+    frequency = models.PositiveIntegerField()
+    impact = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["term", "listing"], name="unique_search_term_listing"
+            )
+        ]
+        indexes = [
+            # Postings are read best-first per term
+            models.Index(fields=["term", "-impact"], name="search_term_impact_idx")
+        ]
+
+
+class SearchVocabulary(models.Model):
+    """Indexed terms with the number of listings that contain them"""
+
+    term = models.CharField(max_length=64, primary_key=True)
+    document_count = models.PositiveIntegerField(default=0)
+
+
+class QueuedEmail(models.Model):
+    """Outgoing email buffered for batched delivery (see listings.mail)"""
+
+    class EmailStatus(models.TextChoices):
+        PENDING = "pending", "Pending"
+        SENT = "sent", "Sent"
+        FAILED = "failed", "Failed"
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    to = models.JSONField(default=list)
+    status = models.CharField(
+        max_length=10, choices=EmailStatus.choices, default=EmailStatus.PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    # Earliest time the flusher may (re)try this message
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["status", "next_attempt_at"], name="queued_email_due_idx"
+            )
+        ]
+
+
+class OutboxMessage(models.Model):
+    """Celery task call written with the rows it is about (see listings.outbox)"""
+
+    class MessageStatus(models.TextChoices):
+        PENDING = "pending", "Pending"
+        SENT = "sent", "Sent"
+        FAILED = "failed", "Failed"
+
+    task = models.CharField(max_length=255)
+    args = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    kwargs = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(
+        max_length=10, choices=MessageStatus.choices, default=MessageStatus.PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    # Earliest time the relay may (re)publish this message
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_due_idx")
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """Outcome of a POST sent with an Idempotency-Key (see listings.idempotency)"""
+
+    # sha256 of the caller and the header value
+    key = models.CharField(max_length=64, unique=True)
+    # sha256 of the method, path and body the key was first used with
+    fingerprint = models.CharField(max_length=64)
+    # Both stay null while the first request is in flight
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    # A request still in flight past this is presumed dead and taken over
+    locked_until = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=["expires_at"], name="idempotency_expires_idx")]
+
+
+class ChapaWebhookEvent(models.Model):
+    """Raw Chapa webhook deliveries; the payload is never modified"""
+
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=64, blank=True, default="")
+    tx_ref = models.CharField(max_length=255, blank=True, default="")
+    status = models.CharField(max_length=32, blank=True, default="")
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    # Why a processed event changed nothing, e.g. an unknown tx_ref
+    error = models.CharField(max_length=255, blank=True, default="")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["processed_at", "id"], name="webhook_pending_idx")
+        ]
+
+
+class ListingDailyStats(models.Model):
+    """Per-night occupancy and revenue of a listing, see listings.rollups"""
+
+    listing = models.ForeignKey(
+        Listing, on_delete=models.CASCADE, related_name="daily_stats"
+    )
+    date = models.DateField()
+    # 1 when a confirmed booking holds the night
+    booked = models.PositiveSmallIntegerField(default=0)
+    # Booking total and completed payments spread evenly over the nights
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["listing", "date"], name="unique_listing_daily_stats"
+            ),
+        ]
+
+
+class StatsDirtyRange(models.Model):
+    """Nights to recompute that no longer match a changed row (moved or
+    deleted bookings), queued by listings.signals"""
+
+    listing_id = models.UUIDField()
+    start_date = models.DateField()
+    end_date = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class Watermark(models.Model):
+    """Last point an incremental job has processed up to"""
+
+    name = models.CharField(max_length=64, primary_key=True)
+    value = models.DateTimeField()
+
+
+class ListingImport(models.Model):
+    """One bulk listing import, see listings.imports"""
+
+    class ImportStatus(models.TextChoices):
+        PENDING = "pending", "Pending"
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    import_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    host = models.ForeignKey(User, on_delete=models.CASCADE, related_name="imports")
+    format = models.CharField(max_length=10)
+    # Storage names of the uploaded file and of the per-row error report
+    source = models.CharField(max_length=255)
+    report = models.CharField(max_length=255, blank=True, default="")
+    status = models.CharField(
+        max_length=10, choices=ImportStatus.choices, default=ImportStatus.PENDING
+    )
+    rows = models.PositiveIntegerField(default=0)
+    created = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    # Why the whole import stopped, e.g. an unreadable file
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
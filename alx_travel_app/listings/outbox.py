@@ -0,0 +1,161 @@
+"""
+Transactional outbox for Celery task dispatch.
+
+Views call enqueue() inside the transaction that writes the booking or
+payment, so the task call is stored with the rows it is about and vanishes
+with them on rollback. Nothing touches the broker during the request: once
+the transaction commits, an on_commit hook hands the new messages to a
+background publisher thread, and the relay_outbox task drains anything left
+behind (broker down, process killed) in batches. A message is marked sent
+only after the broker accepted it, so delivery is at least once and tasks
+must tolerate an occasional repeat.
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from celery.exceptions import NotRegistered
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from alx_travel_app.celery import app
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+# Claimed rows are hidden from other relays for this long; if a relay dies
+# mid-publish they become due again once the lease runs out.
+CLAIM_LEASE = timedelta(minutes=1)
+
+
+def enqueue(task, *args, **kwargs):
+    """Stores a task call like task.delay() would send, to publish after commit"""
+    message = OutboxMessage.objects.create(task=task.name, args=args, kwargs=kwargs)
+    transaction.on_commit(lambda: publish_later([message.pk]))
+    return message
+
+
+_publisher = None
+_publisher_pid = None
+_publisher_lock = threading.Lock()
+
+
+def publish_later(ids):
+    """Publishes the messages on the process's background publisher thread"""
+    global _publisher, _publisher_pid
+    with _publisher_lock:
+        if _publisher is None or _publisher_pid != os.getpid():
+            # One thread: the request never waits, and a slow broker backs up
+            # here instead of in front of every booking
+            _publisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="outbox")
+            _publisher_pid = os.getpid()
+        _publisher.submit(_publish_ids, ids)
+
+
+def _publish_ids(ids):
+    try:
+        relay(ids=ids)
+    except Exception:
+        # The relay task picks the messages up once their lease runs out
+        logger.exception("Could not publish outbox messages %s", ids)
+    finally:
+        connection.close()
+
+
+def retry_delay(attempts):
+    """Exponential backoff between publish attempts, capped"""
+    delay = settings.OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.OUTBOX_MAX_RETRY_DELAY))
+
+
+def claim_batch(batch_size, ids=None):
+    """Leases up to batch_size due messages to the calling relay"""
+    now = timezone.now()
+    queryset = OutboxMessage.objects.filter(
+        status=OutboxMessage.MessageStatus.PENDING, next_attempt_at__lte=now
+    )
+    if ids is not None:
+        queryset = queryset.filter(pk__in=ids)
+
+    with transaction.atomic():
+        batch = list(
+            queryset.select_for_update(skip_locked=True).order_by("next_attempt_at")[
+                :batch_size
+            ]
+        )
+        OutboxMessage.objects.filter(pk__in=[row.pk for row in batch]).update(
+            next_attempt_at=now + CLAIM_LEASE
+        )
+    return batch
+
+
+def publish(row):
+    """Sends one message to the broker; returns None or the error"""
+    try:
+        task = app.tasks[row.task]
+    except NotRegistered:
+        return NotRegistered(row.task)
+    try:
+        # The message id doubles as the task id, so repeats are recognizable
+        task.apply_async(args=row.args, kwargs=row.kwargs, task_id=f"outbox-{row.pk}")
+    except Exception as e:
+        return e
+    return None
+
+
+def record_results(batch, results):
+    now = timezone.now()
+    for row, error in zip(batch, results):
+        if error is None:
+            row.status = OutboxMessage.MessageStatus.SENT
+            row.sent_at = now
+            continue
+
+        row.attempts += 1
+        row.last_error = repr(error)
+        row.next_attempt_at = now + retry_delay(row.attempts)
+        if isinstance(error, NotRegistered):
+            # No retry can fix a task name the workers don't know
+            row.status = OutboxMessage.MessageStatus.FAILED
+            logger.error("Dropping outbox message %s: %r", row.pk, error)
+
+    OutboxMessage.objects.bulk_update(
+        batch, ["status", "sent_at", "attempts", "last_error", "next_attempt_at"]
+    )
+
+
+def relay(batch_size=None, concurrency=None, max_batches=None, ids=None):
+    """Publishes due messages in batches; returns sent/failed counts.
+
+    At most `concurrency` publishes are in flight at once. ids limits the
+    relay to those messages (the on_commit path).
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    concurrency = concurrency or settings.OUTBOX_PUBLISH_CONCURRENCY
+    if ids is not None:
+        concurrency = min(concurrency, len(ids))
+    sent = failed = batches = 0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while max_batches is None or batches < max_batches:
+            batch = claim_batch(batch_size, ids)
+            if not batch:
+                break
+
+            results = list(pool.map(publish, batch))
+            record_results(batch, results)
+
+            errors = sum(1 for error in results if error is not None)
+            sent += len(batch) - errors
+            failed += errors
+            batches += 1
+            if errors == len(batch):
+                # The broker is likely down; leave the rest for the next run
+                break
+
+    return {"sent": sent, "failed": failed, "batches": batches}
@@ -0,0 +1,16 @@
+from django.conf import settings
+
+from rest_framework.pagination import CursorPagination
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """Keyset pagination over (created_at, pk) with opaque cursors.
+
+    The cursor encodes the last created_at seen, so every page is a single
+    indexed range scan and no COUNT(*) is issued.
+    """
+
+    ordering = ("-created_at", "-pk")
+    page_size = settings.API_PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = settings.API_MAX_PAGE_SIZE
@@ -0,0 +1,150 @@
+"""
+Server-side price quotes.
+
+A PriceBook loads the pricing rules of many listings for one date window in
+three queries (listings, overlapping rate overrides, stay discounts). Each
+quote is then computed from night counts per price segment rather than by
+walking the stay night by night, so pricing a search page of listings costs
+the same handful of queries whatever the stay length.
+"""
+
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from .models import Listing, ListingRate, StayDiscount
+
+# date.weekday() of the nights charged at the weekend price (Fri, Sat)
+WEEKEND_DAYS = frozenset({4, 5})
+CENTS = Decimal("0.01")
+
+
+def count_weekend_nights(start, end):
+    """Number of Friday and Saturday nights in [start, end)"""
+    nights = (end - start).days
+    if nights <= 0:
+        return 0
+
+    full_weeks, rest = divmod(nights, 7)
+    count = full_weeks * len(WEEKEND_DAYS)
+    first = start.weekday()
+    count += sum((first + i) % 7 in WEEKEND_DAYS for i in range(rest))
+    return count
+
+
+def _flatten(overrides):
+    """Turns overrides (oldest first) into disjoint (start, end, price) segments"""
+    segments = []
+    for start, end, price in overrides:
+        kept = []
+        for s, e, p in segments:
+            # Keep the parts of older segments the new override doesn't cover
+            if s < start:
+                kept.append((s, min(e, start), p))
+            if e > end:
+                kept.append((max(s, end), e, p))
+        kept.append((start, end, price))
+        segments = kept
+    return segments
+
+
+class PriceBook:
+    """Pricing rules of a set of listings for one date window"""
+
+    def __init__(self, listing_ids, start, end):
+        listing_ids = set(listing_ids)
+        self.prices = {
+            pk: (price, weekend)
+            for pk, price, weekend in Listing.objects.filter(
+                pk__in=listing_ids
+            ).values_list("pk", "price_per_night", "weekend_price_per_night")
+        }
+
+        self.segments = {}
+        self.discounts = defaultdict(list)
+        if not self.prices:
+            return
+
+        overrides = defaultdict(list)
+        rates = (
+            ListingRate.objects.filter(
+                listing_id__in=self.prices.keys(),
+                start_date__lt=end,
+                end_date__gt=start,
+            )
+            .order_by("created_at", "pk")
+            .values_list("listing_id", "start_date", "end_date", "price_per_night")
+        )
+        for listing_id, rate_start, rate_end, price in rates:
+            overrides[listing_id].append((rate_start, rate_end, price))
+        self.segments = {pk: _flatten(rows) for pk, rows in overrides.items()}
+
+        for listing_id, min_nights, percent in (
+            StayDiscount.objects.filter(listing_id__in=self.prices.keys())
+            .order_by("-min_nights")
+            .values_list("listing_id", "min_nights", "percent")
+        ):
+            self.discounts[listing_id].append((min_nights, percent))
+
+    def __contains__(self, listing_id):
+        return listing_id in self.prices
+
+    def quote(self, listing_id, check_in, check_out):
+        """Prices [check_in, check_out) for one listing"""
+        base, weekend = self.prices[listing_id]
+        if weekend is None:
+            weekend = base
+        nights = (check_out - check_in).days
+
+        subtotal = Decimal(0)
+        covered = covered_weekend = 0
+        for start, end, price in self.segments.get(listing_id, ()):
+            start, end = max(start, check_in), min(end, check_out)
+            if start >= end:
+                continue
+            segment_nights = (end - start).days
+            subtotal += price * segment_nights
+            covered += segment_nights
+            covered_weekend += count_weekend_nights(start, end)
+
+        weekend_nights = count_weekend_nights(check_in, check_out) - covered_weekend
+        weekday_nights = nights - covered - weekend_nights
+        subtotal += base * weekday_nights + weekend * weekend_nights
+
+        percent = next(
+            (
+                percent
+                for min_nights, percent in self.discounts.get(listing_id, ())
+                if nights >= min_nights
+            ),
+            Decimal(0),
+        )
+        discount = (subtotal * percent / 100).quantize(CENTS, ROUND_HALF_UP)
+        subtotal = subtotal.quantize(CENTS, ROUND_HALF_UP)
+        return {
+            "listing_id": listing_id,
+            "check_in": check_in,
+            "check_out": check_out,
+            "nights": nights,
+            "subtotal": subtotal,
+            "discount": discount,
+            "total_price": subtotal - discount,
+        }
+
+
+def quote_listings(listing_ids, check_in, check_out):
+    """Quotes for every existing listing in listing_ids, in request order"""
+    listing_ids = list(dict.fromkeys(listing_ids))
+    book = PriceBook(listing_ids, check_in, check_out)
+    return [
+        book.quote(listing_id, check_in, check_out)
+        for listing_id in listing_ids
+        if listing_id in book
+    ]
+
+
+def quote_stay(listing_id, check_in, check_out):
+    """Total price of one stay, or None when the listing doesn't exist"""
+    book = PriceBook([listing_id], check_in, check_out)
+    if listing_id not in book:
+        return None
+    return book.quote(listing_id, check_in, check_out)["total_price"]
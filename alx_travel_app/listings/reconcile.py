@@ -0,0 +1,131 @@
+"""
+Reconciliation of pending payments against Chapa.
+
+Pending payments are walked by (created_at, pk) keyset. Each page is claimed
+by stamping last_verified_at under select_for_update(skip_locked=True), so
+several workers can run the task at once without verifying the same rows,
+then verified against Chapa on a bounded thread pool and written back with
+filtered updates.
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .chapa import ChapaError, get_client
+from .models import Booking, Payment
+
+logger = logging.getLogger(__name__)
+
+
+def claim_page(after, page_size, stale_before, recheck_before):
+    """Claims the next page of pending payments after the keyset position"""
+    queryset = Payment.objects.filter(
+        status=Payment.PaymentStatus.PENDING, created_at__lte=stale_before
+    ).filter(Q(last_verified_at__isnull=True) | Q(last_verified_at__lt=recheck_before))
+    if after is not None:
+        created_at, pk = after
+        queryset = queryset.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+        )
+
+    with transaction.atomic():
+        page = list(
+            queryset.select_for_update(skip_locked=True)
+            .order_by("created_at", "pk")
+            .only("pk", "payment_id", "created_at", "booking_id", "status")[:page_size]
+        )
+        Payment.objects.filter(pk__in=[p.pk for p in page]).update(
+            last_verified_at=timezone.now()
+        )
+    return page
+
+
+def verify_payment(payment):
+    """Returns (payment, chapa status or None)"""
+    try:
+        response = get_client().verify(payment.payment_id)
+        if response.status_code != 200:
+            return payment, None
+        data = response.json().get("data") or {}
+        return payment, (data.get("status") or "").lower()
+    except (ChapaError, ValueError) as e:
+        logger.warning("Could not verify payment %s: %s", payment.pk, e)
+        return payment, None
+
+
+def apply_results(results):
+    """Writes verified statuses back; returns (completed, failed).
+
+    Only payments still pending change: a webhook may have settled one since
+    it was claimed. Only pending bookings are confirmed, so a canceled one is
+    never revived past the overlap check of listings.reservations.
+    """
+    now = timezone.now()
+    completed, failed = [], []
+    for payment, chapa_status in results:
+        if chapa_status == "success":
+            completed.append(payment.pk)
+        elif chapa_status in ("failed", "failed/cancelled", "cancelled"):
+            failed.append(payment.pk)
+
+    pending = Payment.objects.filter(status=Payment.PaymentStatus.PENDING)
+    with transaction.atomic():
+        booking_ids = list(
+            pending.filter(pk__in=completed)
+            .select_for_update()
+            .values_list("booking_id", flat=True)
+        )
+        completed_count = pending.filter(pk__in=completed).update(
+            status=Payment.PaymentStatus.COMPLETED, updated_at=now
+        )
+        failed_count = pending.filter(pk__in=failed).update(
+            status=Payment.PaymentStatus.FAILED, updated_at=now
+        )
+        Booking.objects.filter(booking_id__in=booking_ids, status="pending").update(
+            status="confirmed", updated_at=now
+        )
+    return completed_count, failed_count
+
+
+def run_reconciliation(page_size=None, concurrency=None, max_pages=None):
+    """Verifies stale pending payments; returns counters and throughput"""
+    page_size = page_size or settings.PAYMENT_RECONCILE_PAGE_SIZE
+    concurrency = concurrency or settings.PAYMENT_RECONCILE_CONCURRENCY
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=settings.PAYMENT_RECONCILE_GRACE)
+    recheck_before = now - timedelta(seconds=settings.PAYMENT_RECONCILE_INTERVAL)
+
+    began = time.perf_counter()
+    checked = completed = failed = pages = 0
+    after = None
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while max_pages is None or pages < max_pages:
+            page = claim_page(after, page_size, stale_before, recheck_before)
+            if not page:
+                break
+
+            results = list(pool.map(verify_payment, page))
+            page_completed, page_failed = apply_results(results)
+
+            checked += len(page)
+            completed += page_completed
+            failed += page_failed
+            pages += 1
+            after = (page[-1].created_at, page[-1].pk)
+
+    elapsed = time.perf_counter() - began
+    return {
+        "checked": checked,
+        "completed": completed,
+        "failed": failed,
+        "seconds": round(elapsed, 3),
+        "per_second": round(checked / elapsed, 1) if elapsed else 0.0,
+    }
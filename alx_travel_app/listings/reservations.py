@@ -0,0 +1,49 @@
+"""
+Race-free booking writes.
+
+A booking that holds nights is only saved after its listing row is locked
+with select_for_update and the nights are checked against the listing's
+active bookings, all in one transaction. Two requests for the same nights
+therefore run one after the other: the second sees the first's booking once
+it commits and is refused with a 409. listings.bulk takes the same lock, so
+single and bulk creation are serialized together. The check relies on READ
+COMMITTED, Django's default on MySQL and PostgreSQL.
+"""
+
+from django.db import transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import Booking, Listing
+
+
+class BookingConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "The listing is already booked for some of these nights."
+    default_code = "conflict"
+
+
+def lock_listing(listing_id):
+    """Blocks until no other transaction holds the listing row"""
+    list(
+        Listing.objects.select_for_update()
+        .filter(pk=listing_id)
+        .values_list("pk", flat=True)
+    )
+
+
+def reserve(listing_id, start_date, end_date, save, exclude=None):
+    """Runs save() once the nights are known to be free; returns its result.
+
+    exclude is the booking being updated, whose own nights don't conflict.
+    """
+    with transaction.atomic():
+        lock_listing(listing_id)
+        overlapping = Booking.objects.filter(listing_id=listing_id).overlapping(
+            start_date, end_date
+        )
+        if exclude is not None:
+            overlapping = overlapping.exclude(pk=exclude)
+        if overlapping.exists():
+            raise BookingConflict()
+        return save()
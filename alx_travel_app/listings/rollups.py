@@ -0,0 +1,285 @@
+"""
+Daily occupancy and revenue rollups per listing.
+
+ListingDailyStats holds one row per listing and booked night. A refresh only
+recomputes the nights touched since the last run: the date ranges of
+bookings and payments whose updated_at passed the watermark, plus ranges
+queued in StatsDirtyRange for bookings that were moved or deleted (those no
+longer have a row pointing at the old nights).
+"""
+
+from datetime import timedelta
+from decimal import ROUND_DOWN, Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min, Q, Sum
+from django.utils import timezone
+
+from .models import (
+    Booking,
+    Listing,
+    ListingDailyStats,
+    Payment,
+    StatsDirtyRange,
+    Watermark,
+)
+
+WATERMARK = "listing_daily_stats"
+CENTS = Decimal("0.01")
+# Listings recomputed per round of queries
+CHUNK_SIZE = 200
+
+
+def allocate(amount, nights):
+    """Splits amount over nights; the first night takes the rounding cents"""
+    share = (amount / nights).quantize(CENTS, ROUND_DOWN)
+    return [amount - share * (nights - 1)] + [share] * (nights - 1)
+
+
+def compute_days(spans):
+    """Expected rollup rows for {listing_id: (start, end)}, keyed by
+    (listing_id, date)"""
+    if not spans:
+        return {}
+
+    start = min(s for s, _ in spans.values())
+    end = max(e for _, e in spans.values())
+    bookings = Booking.objects.filter(
+        listing_id__in=spans.keys(),
+        status="confirmed",
+        start_date__lt=end,
+        end_date__gt=start,
+    )
+    paid = dict(
+        Payment.objects.filter(
+            booking__in=bookings, status=Payment.PaymentStatus.COMPLETED
+        )
+        .values("booking_id")
+        .annotate(total=Sum("amount"))
+        .values_list("booking_id", "total")
+    )
+
+    rows = {}
+    for booking_id, listing_id, check_in, check_out, total in bookings.values_list(
+        "pk", "listing_id", "start_date", "end_date", "total_price"
+    ):
+        span_start, span_end = spans[listing_id]
+        nights = (check_out - check_in).days
+        if nights <= 0:
+            continue
+        revenue = allocate(total, nights)
+        payments = allocate(paid.get(booking_id, Decimal(0)), nights)
+        for night in range(nights):
+            day = check_in + timedelta(days=night)
+            if not span_start <= day < span_end:
+                continue
+            row = rows.setdefault((listing_id, day), [0, Decimal(0), Decimal(0)])
+            row[0] = 1
+            row[1] += revenue[night]
+            row[2] += payments[night]
+    return rows
+
+
+def _stored(spans):
+    condition = Q()
+    for listing_id, (start, end) in spans.items():
+        condition |= Q(listing_id=listing_id, date__gte=start, date__lt=end)
+    return ListingDailyStats.objects.filter(condition)
+
+
+def _chunks(spans):
+    items = list(spans.items())
+    for i in range(0, len(items), CHUNK_SIZE):
+        yield dict(items[i : i + CHUNK_SIZE])
+
+
+def recompute(spans):
+    """Rewrites the rollups of {listing_id: (start, end)}; returns rows written"""
+    written = 0
+    for chunk in _chunks(spans):
+        rows = compute_days(chunk)
+        with transaction.atomic():
+            _stored(chunk).delete()
+            ListingDailyStats.objects.bulk_create(
+                [
+                    ListingDailyStats(
+                        listing_id=listing_id,
+                        date=day,
+                        booked=booked,
+                        revenue=revenue,
+                        paid=paid,
+                    )
+                    for (listing_id, day), (booked, revenue, paid) in rows.items()
+                ]
+            )
+        written += len(rows)
+    return written
+
+
+def _widen(spans, listing_id, start, end):
+    if listing_id in spans:
+        s, e = spans[listing_id]
+        start, end = min(s, start), max(e, end)
+    spans[listing_id] = (start, end)
+
+
+def refresh_stats():
+    """Recomputes the nights touched since the last refresh"""
+    now = timezone.now()
+    with transaction.atomic():
+        # The row lock keeps concurrent refreshes from interleaving
+        mark, created = Watermark.objects.select_for_update().get_or_create(
+            name=WATERMARK, defaults={"value": now}
+        )
+
+        bookings = Booking.objects.all()
+        payments = Payment.objects.all()
+        if not created:
+            # Rows committed late can carry an updated_at before the mark
+            since = mark.value - timedelta(seconds=settings.STATS_WATERMARK_LAG)
+            bookings = bookings.filter(updated_at__gte=since)
+            payments = payments.filter(updated_at__gte=since)
+
+        spans = {}
+        for listing_id, start, end in bookings.values_list(
+            "listing_id", "start_date", "end_date"
+        ).iterator():
+            _widen(spans, listing_id, start, end)
+        for listing_id, start, end in payments.values_list(
+            "booking__listing_id", "booking__start_date", "booking__end_date"
+        ).iterator():
+            _widen(spans, listing_id, start, end)
+
+        dirty = list(
+            StatsDirtyRange.objects.values_list(
+                "pk", "listing_id", "start_date", "end_date"
+            )
+        )
+        for _, listing_id, start, end in dirty:
+            _widen(spans, listing_id, start, end)
+
+        written = recompute(spans)
+
+        StatsDirtyRange.objects.filter(pk__in=[row[0] for row in dirty]).delete()
+        mark.value = now
+        mark.save(update_fields=["value"])
+    return {"listings": len(spans), "rows": written}
+
+
+def rebuild_stats():
+    """Recomputes every rollup from scratch"""
+    now = timezone.now()
+    with transaction.atomic():
+        ListingDailyStats.objects.all().delete()
+        StatsDirtyRange.objects.all().delete()
+
+        spans = {
+            row["listing_id"]: (row["start"], row["end"])
+            for row in Booking.objects.filter(status="confirmed")
+            .values("listing_id")
+            .annotate(start=Min("start_date"), end=Max("end_date"))
+        }
+        written = recompute(spans)
+
+        Watermark.objects.update_or_create(name=WATERMARK, defaults={"value": now})
+    return {"listings": len(spans), "rows": written}
+
+
+def check_stats(listing_ids, start, end):
+    """Compares stored rollups with the raw bookings and payments.
+
+    Returns (listing_id, date, stored, expected) for every mismatching night.
+    """
+    mismatches = []
+    for chunk in _chunks({listing_id: (start, end) for listing_id in listing_ids}):
+        expected = {
+            key: (booked, revenue, paid)
+            for key, (booked, revenue, paid) in compute_days(chunk).items()
+        }
+        stored = {
+            (listing_id, day): (booked, revenue, paid)
+            for listing_id, day, booked, revenue, paid in _stored(chunk).values_list(
+                "listing_id", "date", "booked", "revenue", "paid"
+            )
+        }
+        for key in expected.keys() | stored.keys():
+            if expected.get(key) != stored.get(key):
+                mismatches.append((*key, stored.get(key), expected.get(key)))
+    return sorted(mismatches, key=lambda row: (str(row[0]), row[1]))
+
+
+def host_stats(host_id, start, end):
+    """Occupancy, ADR and revenue of a host's listings over [start, end),
+    read from the rollups only"""
+    days = (end - start).days
+    listings = list(
+        Listing.objects.filter(host_id=host_id)
+        .order_by("created_at", "pk")
+        .values_list("pk", "name")
+    )
+    rollups = ListingDailyStats.objects.filter(
+        listing__host_id=host_id, date__gte=start, date__lt=end
+    )
+    per_listing = {
+        row["listing_id"]: row
+        for row in rollups.values("listing_id").annotate(
+            booked=Sum("booked"), revenue=Sum("revenue"), paid=Sum("paid")
+        )
+    }
+    daily = list(
+        rollups.values("date")
+        .annotate(booked=Sum("booked"), revenue=Sum("revenue"), paid=Sum("paid"))
+        .order_by("date")
+    )
+
+    def summary(booked, revenue, paid, available):
+        return {
+            "booked_nights": booked,
+            "occupancy_rate": round(booked / available, 4) if available else 0.0,
+            "adr": (revenue / booked).quantize(CENTS) if booked else Decimal(0),
+            "revenue": revenue,
+            "paid": paid,
+        }
+
+    results = []
+    for listing_id, name in listings:
+        row = per_listing.get(listing_id, {})
+        results.append(
+            {
+                "listing_id": listing_id,
+                "name": name,
+                **summary(
+                    row.get("booked", 0),
+                    row.get("revenue", Decimal(0)),
+                    row.get("paid", Decimal(0)),
+                    days,
+                ),
+            }
+        )
+
+    totals = summary(
+        sum(row["booked"] for row in per_listing.values()),
+        sum((row["revenue"] for row in per_listing.values()), Decimal(0)),
+        sum((row["paid"] for row in per_listing.values()), Decimal(0)),
+        days * len(listings),
+    )
+    return {
+        "from": start,
+        "to": end,
+        "days": days,
+        "totals": totals,
+        "listings": results,
+        "daily": [
+            {
+                "date": row["date"],
+                "booked_nights": row["booked"],
+                "occupancy_rate": (
+                    round(row["booked"] / len(listings), 4) if listings else 0.0
+                ),
+                "revenue": row["revenue"],
+                "paid": row["paid"],
+            }
+            for row in daily
+        ],
+    }
@@ -0,0 +1,254 @@
+"""
+Inverted-index full-text search over listing name, location and description.
+
+Postings live in ListingSearchTerm and are rebuilt whenever a listing is
+saved. Each posting stores its BM25 term weight ("impact"), so a query reads
+the best postings of each query term through the (term, -impact) index
+first, and only reads deeper when a listing further down a list could still
+make the results. This works the same on SQLite and MySQL without FULLTEXT
+support.
+"""
+
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .models import Listing, ListingSearchTerm, SearchVocabulary
+
+# Field weights applied to the term frequency
+FIELD_WEIGHTS = {"name": 3, "location": 2, "description": 1}
+
+# BM25 parameters. Impacts are normalized against a fixed reference length
+# instead of the live average, so postings stay valid as the corpus grows.
+K1 = 1.2
+B = 0.75
+REFERENCE_DOC_LENGTH = 60
+
+MAX_TERM_LENGTH = 64
+MAX_PREFIX_EXPANSIONS = 10
+POSTINGS_PER_TERM = 500
+
+DOCUMENT_COUNT_CACHE_KEY = "listings:search:documents"
+DOCUMENT_COUNT_CACHE_TIMEOUT = 300
+
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from in is it of on or the to with".split()
+)
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fold(text):
+    """Casefolds text and strips accents, so "Café" and "cafe" are one term.
+
+    MySQL's default collations compare terms this way, so unfolded variants
+    would collide on the unique (term, listing) constraint.
+    """
+    decomposed = unicodedata.normalize("NFKD", (text or "").casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text):
+    """Folds text and splits it into index terms"""
+    return [
+        token[:MAX_TERM_LENGTH]
+        for token in TOKEN_RE.findall(fold(text))
+        if token not in STOP_WORDS
+    ]
+
+
+def term_impact(frequency, doc_length):
+    norm = K1 * (1 - B + B * doc_length / REFERENCE_DOC_LENGTH)
+    return frequency * (K1 + 1) / (frequency + norm)
+
+
+def build_postings(listing):
+    """Returns unsaved ListingSearchTerm rows for a listing"""
+    counts = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        for token in tokenize(getattr(listing, field)):
+            counts[token] += weight
+
+    doc_length = sum(counts.values())
+    return [
+        ListingSearchTerm(
+            term=term,
+            listing_id=listing.pk,
+            frequency=freq,
+            impact=term_impact(freq, doc_length),
+        )
+        for term, freq in counts.items()
+    ]
+
+
+def update_vocabulary(deltas):
+    """Applies {term: +/-n} changes to the per-term document counts"""
+    deltas = {term: delta for term, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    SearchVocabulary.objects.bulk_create(
+        [SearchVocabulary(term=term) for term, delta in deltas.items() if delta > 0],
+        ignore_conflicts=True,
+    )
+
+    # One UPDATE per distinct delta rather than one per term
+    by_delta = defaultdict(list)
+    for term, delta in deltas.items():
+        by_delta[delta].append(term)
+    for delta, terms in by_delta.items():
+        SearchVocabulary.objects.filter(term__in=terms).update(
+            document_count=F("document_count") + delta
+        )
+
+
+def index_listings(listings, batch_size=1000):
+    """Replaces the postings of the given listings"""
+    listings = list(listings)
+    postings = [p for listing in listings for p in build_postings(listing)]
+    listing_ids = [listing.pk for listing in listings]
+
+    with transaction.atomic():
+        stale = ListingSearchTerm.objects.filter(listing_id__in=listing_ids)
+        deltas = Counter(p.term for p in postings)
+        deltas.subtract(stale.values_list("term", flat=True))
+
+        stale.delete()
+        ListingSearchTerm.objects.bulk_create(postings, batch_size=batch_size)
+        update_vocabulary(deltas)
+    return len(postings)
+
+
+def unindex_listing(listing_id):
+    """Drops a listing's postings and their vocabulary counts"""
+    with transaction.atomic():
+        stale = ListingSearchTerm.objects.filter(listing_id=listing_id)
+        deltas = Counter()
+        deltas.subtract(stale.values_list("term", flat=True))
+        stale.delete()
+        update_vocabulary(deltas)
+
+
+def document_count():
+    """Number of indexed listings, cached"""
+    count = cache.get(DOCUMENT_COUNT_CACHE_KEY)
+    if count is None:
+        count = Listing.objects.count()
+        cache.set(DOCUMENT_COUNT_CACHE_KEY, count, DOCUMENT_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def _prefix_upper_bound(prefix):
+    """Upper bound for an indexable `term >= prefix AND term < bound` scan"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def expand_terms(tokens, prefix=True):
+    """Maps query tokens to indexed terms and their document counts.
+
+    The last token is treated as a prefix so results show up while typing.
+    """
+    exact = set(tokens[:-1] if prefix else tokens)
+    vocabulary = SearchVocabulary.objects.filter(document_count__gt=0)
+
+    terms = dict(
+        vocabulary.filter(term__in=exact).values_list("term", "document_count")
+    )
+    if prefix and tokens:
+        last = tokens[-1]
+        terms.update(
+            vocabulary.filter(term__gte=last, term__lt=_prefix_upper_bound(last))
+            .order_by("-document_count")
+            .values_list("term", "document_count")[:MAX_PREFIX_EXPANSIONS]
+        )
+    return terms
+
+
+def _top_postings(term, depth):
+    return list(
+        ListingSearchTerm.objects.filter(term=term)
+        .order_by("-impact")
+        .values_list("listing_id", "impact")[:depth]
+    )
+
+
+def search(query, limit=20, prefix=True):
+    """Returns [(listing_id, score)] ranked by BM25, best first.
+
+    The top POSTINGS_PER_TERM postings of each term are read first. A listing
+    missing from a truncated list can score at most that list's last impact
+    for its term, so the read is deepened until nothing left unread could
+    rank among the results; the ranking is the same as a full scan.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+
+    terms = expand_terms(tokens, prefix=prefix)
+    if not terms:
+        return []
+
+    docs = max(document_count(), max(terms.values()))
+    idfs = {
+        term: math.log(1 + (docs - df + 0.5) / (df + 0.5)) for term, df in terms.items()
+    }
+    depth = max(POSTINGS_PER_TERM, limit)
+
+    while True:
+        scores = defaultdict(float)
+        read = defaultdict(set)
+        # Highest score an unread posting of a truncated term can add
+        ceilings = {}
+        for term, idf in idfs.items():
+            postings = _top_postings(term, depth)
+            if len(postings) == depth:
+                ceilings[term] = idf * postings[-1][1]
+            for listing_id, impact in postings:
+                scores[listing_id] += idf * impact
+                read[listing_id].add(term)
+        if not ceilings:
+            break
+
+        # Scores so far are lower bounds; complete every listing whose upper
+        # bound reaches the limit-th of them
+        floor = sorted(scores.values(), reverse=True)[limit - 1]
+        partial = [
+            pk
+            for pk, score in scores.items()
+            if score + sum(c for t, c in ceilings.items() if t not in read[pk]) >= floor
+            and not read[pk] >= ceilings.keys()
+        ]
+        missing = ListingSearchTerm.objects.filter(
+            listing_id__in=partial, term__in=ceilings
+        ).values_list("listing_id", "term", "impact")
+        for listing_id, term, impact in missing:
+            if term not in read[listing_id]:
+                scores[listing_id] += idfs[term] * impact
+
+        # A listing in no list read so far scores at most the ceilings' sum
+        kth = sorted(scores.values(), reverse=True)[limit - 1]
+        if sum(ceilings.values()) <= kth:
+            break
+        depth *= 4
+
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], str(item[0])))
+    return ranked[:limit]
+
+
+def search_listings(query, limit=20, prefix=True):
+    """Returns ranked Listing instances with a `search_score` attribute"""
+    ranked = search(query, limit=limit, prefix=prefix)
+    listings = Listing.objects.in_bulk([pk for pk, _ in ranked])
+
+    results = []
+    for pk, score in ranked:
+        listing = listings.get(pk)
+        if listing is not None:
+            listing.search_score = score
+            results.append(listing)
+    return results
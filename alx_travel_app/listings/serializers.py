@@ -1,46 +1,97 @@
 from rest_framework import serializers
-from .models import Listing, Booking, Payment
+from .fieldsets import SparseFieldsSerializerMixin
+from .models import Listing, ListingImport, Booking, Payment, User
 
 
-class ListingSerializer(serializers.ModelSerializer):
+class ListingSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     listing_id = serializers.UUIDField(read_only=True)
-    host = serializers.UUIDField(read_only=True)
+    host = serializers.UUIDField(source="host_id", read_only=True)
     name = serializers.CharField()
     description = serializers.CharField()
     location = serializers.CharField()
     price_per_night = serializers.DecimalField(max_digits=10, decimal_places=2)
-    created_at = serializers.DateTimeField(auto_now_add=True)
-    updated_at = serializers.DateTimeField(auto_now=True)
+    max_guests = serializers.IntegerField(min_value=1, required=False)
+    latitude = serializers.FloatField(
+        min_value=-90, max_value=90, required=False, allow_null=True
+    )
+    longitude = serializers.FloatField(
+        min_value=-180, max_value=180, required=False, allow_null=True
+    )
+    rating_avg = serializers.FloatField(read_only=True)
+    rating_count = serializers.IntegerField(read_only=True)
+    rating_histogram = serializers.DictField(
+        child=serializers.IntegerField(), read_only=True
+    )
+    created_at = serializers.DateTimeField(read_only=True)
+    updated_at = serializers.DateTimeField(read_only=True)
 
     class Meta:
         model = Listing
-        fields = "__all__"
+        exclude = [
+            "geohash",
+            "rating_sum",
+            "rating_1",
+            "rating_2",
+            "rating_3",
+            "rating_4",
+            "rating_5",
+        ]
+
+        # The review aggregates are kept by listings.signals, never by clients
+        read_only_fields = ["listing_id", "host", "rating_avg", "rating_count"]
+
+    source_columns = {"rating_histogram": [f"rating_{i}" for i in range(1, 6)]}
 
-        read_only_fields = ["listing_id", "host"]
+    def values_rating_histogram(self, row):
+        return {str(i): row[f"rating_{i}"] for i in range(1, 6)}
 
+    def validate(self, attrs):
+        latitude = attrs.get("latitude", getattr(self.instance, "latitude", None))
+        longitude = attrs.get("longitude", getattr(self.instance, "longitude", None))
+        if (latitude is None) != (longitude is None):
+            raise serializers.ValidationError(
+                "latitude and longitude must be given together."
+            )
+        return attrs
 
-class BookingSerializer(serializers.ModelSerializer):
-    booking_id = serializers.UUIDField(primary_key=True)
-    listing = serializers.UUIDField(foreign_key=True)
-    user = serializers.UUIDField(foreign_key=True)
+
+class ListingImportSerializer(ListingSerializer):
+    """One row of a bulk listing import"""
+
+    external_id = serializers.CharField(max_length=100)
+
+
+class BookingSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
+    booking_id = serializers.UUIDField(read_only=True)
+    listing = serializers.PrimaryKeyRelatedField(queryset=Listing.objects.all())
+    user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
     start_date = serializers.DateField()
     end_date = serializers.DateField()
-    total_price = serializers.DecimalField(max_digits=10, decimal_places=2)
-    status = serializers.CharField(
-        max_length=10,
+    # Priced on the server from the listing's rates, see listings.pricing
+    total_price = serializers.DecimalField(
+        max_digits=10, decimal_places=2, read_only=True
+    )
+    status = serializers.ChoiceField(
         choices=[
             ("pending", "Pending"),
             ("confirmed", "Confirmed"),
             ("canceled", "Canceled"),
         ],
     )
-    created_at = serializers.DateTimeField(auto_now_add=True)
+    created_at = serializers.DateTimeField(read_only=True)
 
     class Meta:
         model = Booking
         fields = "__all__"
 
-        read_only_fields = ["booking_id", "listing", "user"]
+        read_only_fields = ["booking_id", "total_price"]
+
+    def validate(self, attrs):
+        start = attrs.get("start_date", getattr(self.instance, "start_date", None))
+        end = attrs.get("end_date", getattr(self.instance, "end_date", None))
+        if start and end and end <= start:
+            raise serializers.ValidationError({"end_date": "Must be after start_date."})
+        return attrs
 
 
 class PaymentSerializer(serializers.ModelSerializer):
@@ -53,7 +104,7 @@ class PaymentSerializer(serializers.ModelSerializer):
             "booking",
             "booking_reference",
             "amount",
-            "currenty",
+            "currency",
             "status",
             "payment_method",
             "transaction_id",
@@ -62,3 +113,39 @@ class PaymentSerializer(serializers.ModelSerializer):
             "responses",
         ]
         read_only_fields = ["payment_id", "created_at", "updated_at"]
+
+
+class BulkBookingItemSerializer(serializers.Serializer):
+    """One entry of a bulk booking request"""
+
+    listing = serializers.UUIDField()
+    user = serializers.UUIDField()
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    status = serializers.ChoiceField(
+        choices=["pending", "confirmed"], default="pending"
+    )
+    email = serializers.EmailField(required=False)
+
+    def validate(self, attrs):
+        if attrs["end_date"] <= attrs["start_date"]:
+            raise serializers.ValidationError({"end_date": "Must be after start_date."})
+        return attrs
+
+
+class QuoteSerializer(serializers.Serializer):
+    """Server-side price of one stay at one listing"""
+
+    listing_id = serializers.UUIDField()
+    check_in = serializers.DateField()
+    check_out = serializers.DateField()
+    nights = serializers.IntegerField()
+    subtotal = serializers.DecimalField(max_digits=12, decimal_places=2)
+    discount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    total_price = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class ListingImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ListingImport
+        exclude = ["source", "report"]
@@ -0,0 +1,144 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import geo
+from .caching import bump_generation, bump_listing_version
+from .models import Booking, Listing, Payment, Review, StatsDirtyRange
+from .search import index_listings, unindex_listing
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, **kwargs):
+    """Keeps the stored rating/listing so an edit can be applied as a delta"""
+    instance._previous = None
+    if instance._state.adding:
+        return
+
+    instance._previous = (
+        Review.objects.filter(pk=instance.pk)
+        .values_list("listing_id", "rating")
+        .first()
+    )
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+
+    previous = getattr(instance, "_previous", None)
+    if created or previous is None:
+        Listing.objects.filter(pk=instance.listing_id).apply_review_delta(
+            added=instance.rating
+        )
+        return
+
+    listing_id, rating = previous
+    if listing_id == instance.listing_id:
+        if rating != instance.rating:
+            Listing.objects.filter(pk=listing_id).apply_review_delta(
+                removed=rating, added=instance.rating
+            )
+        return
+
+    Listing.objects.filter(pk=listing_id).apply_review_delta(removed=rating)
+    Listing.objects.filter(pk=instance.listing_id).apply_review_delta(
+        added=instance.rating
+    )
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_delete(sender, instance, **kwargs):
+    Listing.objects.filter(pk=instance.listing_id).apply_review_delta(
+        removed=instance.rating
+    )
+
+
+@receiver(pre_save, sender=Payment)
+def set_booking_reference(sender, instance, **kwargs):
+    if not instance.booking_reference and instance.booking_id:
+        instance.booking_reference = str(instance.booking_id)
+
+
+@receiver(pre_save, sender=Listing)
+def update_geohash(sender, instance, **kwargs):
+    if instance.latitude is None or instance.longitude is None:
+        instance.geohash = ""
+    else:
+        instance.geohash = geo.encode(instance.latitude, instance.longitude)
+
+
+@receiver(post_save, sender=Listing)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    index_listings([instance])
+
+
+@receiver(pre_delete, sender=Listing)
+def remove_from_search_index(sender, instance, **kwargs):
+    unindex_listing(instance.pk)
+
+
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_listing_cache(sender, instance, **kwargs):
+    listing_id = instance.pk if sender is Listing else instance.listing_id
+
+    def bump():
+        bump_listing_version(listing_id)
+        bump_generation()
+
+    # Bumping before the commit would let a concurrent read cache the old
+    # rows under the new key
+    transaction.on_commit(bump)
+
+
+@receiver(pre_save, sender=Booking)
+def queue_moved_booking_nights(sender, instance, raw=False, **kwargs):
+    """A booking moved to other nights or listing leaves stale rollups behind"""
+    if raw or instance._state.adding:
+        return
+
+    previous = (
+        Booking.objects.filter(pk=instance.pk)
+        .values_list("listing_id", "start_date", "end_date")
+        .first()
+    )
+    if previous and previous != (
+        instance.listing_id,
+        instance.start_date,
+        instance.end_date,
+    ):
+        listing_id, start_date, end_date = previous
+        StatsDirtyRange.objects.create(
+            listing_id=listing_id, start_date=start_date, end_date=end_date
+        )
+
+
+@receiver(post_delete, sender=Booking)
+def queue_deleted_booking_nights(sender, instance, **kwargs):
+    StatsDirtyRange.objects.create(
+        listing_id=instance.listing_id,
+        start_date=instance.start_date,
+        end_date=instance.end_date,
+    )
+
+
+@receiver(post_delete, sender=Payment)
+def queue_deleted_payment_nights(sender, instance, **kwargs):
+    booking = (
+        Booking.objects.filter(pk=instance.booking_id)
+        .values_list("listing_id", "start_date", "end_date")
+        .first()
+    )
+    if booking:
+        listing_id, start_date, end_date = booking
+        StatsDirtyRange.objects.create(
+            listing_id=listing_id, start_date=start_date, end_date=end_date
+        )
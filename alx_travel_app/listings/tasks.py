@@ -1,10 +1,16 @@
-from django.core.mail import send_mail
 from django.conf import settings
 
 from alx_travel_app.celery import shared_task
 
 
+from .idempotency import purge_expired
+from .imports import run_import
+from .mail import flush_queue, queue_mail, queue_mass_mail
 from .models import Payment, Booking
+from .outbox import relay
+from .reconcile import run_reconciliation
+from .rollups import refresh_stats
+from .webhooks import apply_pending_events
 
 
 @shared_task
@@ -19,12 +25,11 @@ def send_confirm_booking_email(booking_id, email, title):
         Welcome
     """
 
-    send_mail(
+    queue_mail(
         subject=subject,
         message=msg,
-        from_email=settings.DEFAULT_FROM_MAIL,
+        from_email=settings.DEFAULT_FROM_EMAIL,
         recipient_list=[email],
-        fail_silently=False,
     )
 
     return f"Confirmation email send for {email}"
@@ -34,7 +39,7 @@ def send_confirm_booking_email(booking_id, email, title):
 def send_confirm_payment_mail(payment_id, email):
     """Sends payment confirmation mail to user"""
     try:
-        payment = Payment.objects.get(payment_id=payment_id)
+        payment = Payment.objects.with_booking().get(payment_id=payment_id)
         booking = payment.booking
         subject = f"Payment confirmation - {booking.listing.name}"
         msg = f"""
@@ -51,12 +56,11 @@ def send_confirm_payment_mail(payment_id, email):
             Regards,
         """
 
-        send_mail(
+        queue_mail(
             subject=subject,
             message=msg,
-            from_email=settings.DEFAULT_FROM_MAIL,
+            from_email=settings.DEFAULT_FROM_EMAIL,
             recipient_list=[email],
-            fail_silently=False,
         )
 
         return f"Payment ocnfirmation mail sent to {email}"
@@ -69,7 +73,7 @@ def send_confirm_payment_mail(payment_id, email):
 @shared_task
 def send_payment_checkout_mail(payment_id, email, checkout_url):
     try:
-        payment = Payment.objects.get(payment_id=payment_id)
+        payment = Payment.objects.with_booking().get(payment_id=payment_id)
         booking = payment.booking
         subject = f"Complete your payment for - {booking.listing.name}"
         msg = f"""
@@ -88,12 +92,11 @@ def send_payment_checkout_mail(payment_id, email, checkout_url):
             Regards,
             
         """
-        send_mail(
+        queue_mail(
             subject=subject,
             message=msg,
             from_email=settings.DEFAULT_FROM_EMAIL,
             recipient_list=[email],
-            fail_silently=False,
         )
     except Payment.DoesNotExist:
         return f"Payment {payment_id} does not found"
@@ -104,7 +107,7 @@ def send_payment_checkout_mail(payment_id, email, checkout_url):
 @shared_task
 def send_booking_confirmation(email, booking_id):
     try:
-        booking = Booking.objects.get(booking_id=booking_id)
+        booking = Booking.objects.with_related().get(booking_id=booking_id)
         listing = booking.listing
         subject = "Booking Confirmation"
         msg = f"""
@@ -118,14 +121,117 @@ def send_booking_confirmation(email, booking_id):
             Regards,
             
         """
-        send_mail(
+        queue_mail(
             subject=subject,
             message=msg,
             from_email="norelpy@bookingapp.com",
             recipient_list=[email],
-            fail_silently=False,
         )
     except Booking.DoesNotExist:
         return f"Booking {booking_id} was not found"
     except Exception as e:
         return f"ERROR: sending booking confirm email : {str(e)}"
+
+
+@shared_task
+def flush_mail_queue(batch_size=None):
+    """Delivers buffered emails in chunks over shared SMTP connections"""
+    result = flush_queue(batch_size=batch_size)
+    return (
+        f"Sent {result['sent']} emails in {result['batches']} batches, "
+        f"{result['failed']} failed"
+    )
+
+
+@shared_task
+def apply_chapa_webhook_events(max_batches=20):
+    """Folds stored Chapa webhook events into payment and booking statuses"""
+    applied = 0
+    for _ in range(max_batches):
+        count = apply_pending_events()
+        if not count:
+            break
+        applied += count
+    return f"Applied {applied} Chapa webhook events"
+
+
+@shared_task
+def reconcile_pending_payments():
+    """Verifies stale pending payments against Chapa in bulk"""
+    result = run_reconciliation()
+    return (
+        f"Checked {result['checked']} payments ({result['completed']} completed, "
+        f"{result['failed']} failed) at {result['per_second']}/s"
+    )
+
+
+@shared_task
+def send_booking_confirmations(recipients):
+    """Queues confirmation emails for a batch of [email, booking_id] pairs"""
+    emails = dict((str(booking_id), email) for email, booking_id in recipients)
+    bookings = Booking.objects.select_related("listing").filter(
+        booking_id__in=emails.keys()
+    )
+
+    messages = []
+    for booking in bookings:
+        msg = f"""
+            Hello, your booking for {booking.listing.name} has been confirmed.
+
+            Details:
+            * Property      : {booking.listing.name}
+            * Check-In      : {booking.start_date}
+            * Check-Out     : {booking.end_date}
+
+            Regards,
+
+        """
+        messages.append(
+            (
+                "Booking Confirmation",
+                msg,
+                "norelpy@bookingapp.com",
+                [emails[str(booking.booking_id)]],
+            )
+        )
+
+    queue_mass_mail(messages)
+    return f"Queued {len(messages)} booking confirmation emails"
+
+
+@shared_task
+def refresh_listing_stats():
+    """Brings the daily occupancy/revenue rollups up to date"""
+    result = refresh_stats()
+    return (
+        f"Refreshed {result['rows']} daily stats rows "
+        f"for {result['listings']} listings"
+    )
+
+
+@shared_task
+def import_listings_file(import_id):
+    """Runs a stored bulk listing import"""
+    counts = run_import(import_id)
+    if counts is None:
+        return f"Listing import {import_id} failed"
+    return (
+        f"Imported {counts['rows']} rows ({counts['created']} created, "
+        f"{counts['updated']} updated, {counts['failed']} failed)"
+    )
+
+
+@shared_task
+def relay_outbox(max_batches=20):
+    """Publishes outbox messages the on_commit publisher left behind"""
+    result = relay(max_batches=max_batches)
+    return (
+        f"Published {result['sent']} outbox messages in {result['batches']} "
+        f"batches, {result['failed']} failed"
+    )
+
+
+@shared_task
+def purge_idempotency_keys():
+    """Deletes stored Idempotency-Key responses past their TTL"""
+    return f"Purged {purge_expired()} idempotency keys"
@@ -1,3 +1,2192 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import hashlib
+import hmac
+import io
+import json
+import os
+import tempfile
+import threading
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
+from uuid import uuid4
 
-# Create your tests here.
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend as LocmemBackend
+from django.test import (
+    Client,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import (
+    Booking,
+    ChapaWebhookEvent,
+    IdempotencyKey,
+    Listing,
+    ListingDailyStats,
+    ListingImport,
+    ListingRate,
+    ListingSearchTerm,
+    OutboxMessage,
+    Payment,
+    QueuedEmail,
+    Review,
+    SearchVocabulary,
+    StayDiscount,
+    User,
+)
+from .caching import cache_stats
+from .chapa import ChapaClient, ChapaError, ChapaUnavailable, CircuitBreaker
+from .chapa_async import AsyncChapaClient
+from .conditional import make_etag
+from .geo import (
+    TooManyMatches,
+    covering_cells,
+    encode,
+    haversine_km,
+    within_radius,
+)
+from .imports import import_listings, run_import
+from .mail import flush_queue, queue_mail
+from .pricing import count_weekend_nights, quote_listings
+from .rollups import check_stats, refresh_stats
+from .management.commands.bench_endpoints import compare
+from .management.commands.bench_task_queues import MemoryBroker, task_topology
+from .middleware import QueryBudgetExceeded
+from .outbox import enqueue, relay
+from .reservations import BookingConflict, reserve
+from .search import search, tokenize
+from .serializers import ListingSerializer
+from .reconcile import apply_results, run_reconciliation
+from .reservations import BookingConflict
+from .views import ListingViewSet
+from . import geo, tasks
+from .tasks import (
+    apply_chapa_webhook_events,
+    send_booking_confirmation,
+    send_booking_confirmations,
+    send_confirm_booking_email,
+)
+
+
+def make_listing(host, **kwargs):
+    data = {
+        "host": host,
+        "name": "Cozy Apartment in Nairobi",
+        "description": "A lovely one-bedroom apartment.",
+        "location": "Nairobi, Kenya",
+        "price_per_night": 50,
+        "max_guests": 2,
+    }
+    data.update(kwargs)
+    return Listing.objects.create(**data)
+
+
+def make_booking(listing, user, start_date, end_date, status="confirmed"):
+    return Booking.objects.create(
+        listing=listing,
+        user=user,
+        start_date=start_date,
+        end_date=end_date,
+        total_price=100,
+        status=status,
+    )
+
+
+def make_payment(booking, **kwargs):
+    data = {"booking": booking, "amount": booking.total_price}
+    data.update(kwargs)
+    return Payment.objects.create(**data)
+
+
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create()
+        self.listing = make_listing(self.user)
+        make_booking(self.listing, self.user, date(2025, 8, 10), date(2025, 8, 15))
+
+    def available(self, check_in, check_out, guests=None):
+        return list(Listing.objects.available(check_in, check_out, guests))
+
+    def test_overlapping_booking_hides_listing(self):
+        self.assertEqual(self.available(date(2025, 8, 12), date(2025, 8, 20)), [])
+        self.assertEqual(self.available(date(2025, 8, 5), date(2025, 8, 11)), [])
+
+    def test_adjacent_ranges_do_not_overlap(self):
+        self.assertEqual(
+            self.available(date(2025, 8, 15), date(2025, 8, 18)), [self.listing]
+        )
+        self.assertEqual(
+            self.available(date(2025, 8, 7), date(2025, 8, 10)), [self.listing]
+        )
+
+    def test_canceled_booking_does_not_block(self):
+        Booking.objects.update(status="canceled")
+        self.assertEqual(
+            self.available(date(2025, 8, 12), date(2025, 8, 13)), [self.listing]
+        )
+
+    def test_guests_filter(self):
+        self.assertEqual(self.available(date(2025, 9, 1), date(2025, 9, 3), 4), [])
+
+    def test_list_endpoint_filters_and_validates(self):
+        url = "/api/listings/"
+        res = self.client.get(
+            url, {"check_in": "2025-08-12", "check_out": "2025-08-14"}
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()["results"], [])
+
+        res = self.client.get(url, {"check_in": "2025-08-12"})
+        self.assertEqual(res.status_code, 400)
+
+        res = self.client.get(
+            url, {"check_in": "2025-08-14", "check_out": "2025-08-12"}
+        )
+        self.assertEqual(res.status_code, 400)
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create()
+        for i in range(5):
+            make_listing(self.user, name=f"Listing {i}")
+
+    def test_pages_walk_every_row_once(self):
+        seen = []
+        url = "/api/listings/?page_size=2"
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                body = self.client.get(url).json()
+            self.assertNotIn("count", body)
+            self.assertFalse(any("COUNT(" in q["sql"] for q in ctx.captured_queries))
+            seen.extend(item["listing_id"] for item in body["results"])
+            url = body["next"]
+
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+
+class ReviewAggregateTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create()
+        self.listing = make_listing(self.user)
+
+    def review(self, rating):
+        return Review.objects.create(
+            listing=self.listing, user=self.user, rating=rating, comment="Nice"
+        )
+
+    def assertAggregates(self, count, avg, histogram):
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.rating_count, count)
+        self.assertAlmostEqual(self.listing.rating_avg, avg)
+        self.assertEqual(self.listing.rating_histogram, histogram)
+
+    def test_create_edit_delete(self):
+        first = self.review(5)
+        self.review(3)
+        self.assertAggregates(2, 4.0, {"1": 0, "2": 0, "3": 1, "4": 0, "5": 1})
+
+        first.rating = 1
+        first.save()
+        self.assertAggregates(2, 2.0, {"1": 1, "2": 0, "3": 1, "4": 0, "5": 0})
+
+        first.delete()
+        self.assertAggregates(1, 3.0, {"1": 0, "2": 0, "3": 1, "4": 0, "5": 0})
+
+    def test_saving_a_stale_listing_keeps_new_reviews(self):
+        stale = Listing.objects.get(pk=self.listing.pk)
+        self.review(4)
+
+        serializer = ListingSerializer(
+            stale, data={"name": "Renamed", "rating_count": 9}, partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        self.assertAggregates(1, 4.0, {"1": 0, "2": 0, "3": 0, "4": 1, "5": 0})
+        self.assertEqual(self.listing.name, "Renamed")
+
+    def test_rebuild_command_repairs_drift(self):
+        self.review(4)
+        self.review(5)
+        Listing.objects.update(rating_count=0, rating_sum=0, rating_avg=0, rating_4=0)
+
+        call_command("rebuild_ratings", stdout=StringIO())
+        self.assertAggregates(2, 4.5, {"1": 0, "2": 0, "3": 0, "4": 1, "5": 1})
+
+    def test_filter_and_ordering(self):
+        other = make_listing(self.user, name="Cabin Retreat in Naivasha")
+        self.review(2)
+        Review.objects.create(listing=other, user=self.user, rating=5, comment="")
+
+        body = self.client.get(
+            "/api/listings/", {"min_rating": "4", "ordering": "-rating_avg"}
+        ).json()
+        self.assertEqual([r["listing_id"] for r in body["results"]], [str(other.pk)])
+
+        body = self.client.get("/api/listings/", {"ordering": "-rating_avg"}).json()
+        self.assertEqual(
+            [r["rating_avg"] for r in body["results"]],
+            [5.0, 2.0],
+        )
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create()
+        self.nairobi = make_listing(self.user)
+        self.villa = make_listing(
+            self.user,
+            name="Beachfront Villa in Mombasa",
+            description="Luxurious villa with stunning ocean views.",
+            location="Mombasa, Kenya",
+        )
+
+    def test_tokenize_drops_stop_words(self):
+        self.assertEqual(tokenize("A Villa in the Sun!"), ["villa", "sun"])
+
+    def test_index_follows_save_and_delete(self):
+        self.villa.name = "Beach House"
+        self.villa.save()
+        terms = set(
+            ListingSearchTerm.objects.filter(listing=self.villa).values_list(
+                "term", flat=True
+            )
+        )
+        self.assertIn("house", terms)
+        self.assertIn("villa", terms)  # still in the description
+
+        self.assertEqual(SearchVocabulary.objects.get(term="kenya").document_count, 2)
+
+        self.villa.delete()
+        self.assertFalse(ListingSearchTerm.objects.filter(term="mombasa").exists())
+        self.assertEqual(SearchVocabulary.objects.get(term="kenya").document_count, 1)
+        self.assertEqual(SearchVocabulary.objects.get(term="mombasa").document_count, 0)
+
+    def test_ranking_and_prefix(self):
+        self.assertEqual([pk for pk, _ in search("villa")], [self.villa.pk])
+        self.assertEqual([pk for pk, _ in search("mom")], [self.villa.pk])
+        self.assertEqual(search("mom", prefix=False), [])
+
+        ranked = [pk for pk, _ in search("kenya nairobi")]
+        self.assertEqual(ranked, [self.nairobi.pk, self.villa.pk])
+
+    def test_search_endpoint(self):
+        res = self.client.get("/api/listings/search/", {"q": "beachfront"})
+        self.assertEqual(res.status_code, 200)
+        results = res.json()["results"]
+        self.assertEqual(results[0]["listing_id"], str(self.villa.pk))
+        self.assertIn("score", results[0])
+
+        self.assertEqual(self.client.get("/api/listings/search/").status_code, 400)
+
+    def test_tokenize_folds_case_and_accents(self):
+        self.assertEqual(tokenize("Café ÉTÉ Straße"), ["cafe", "ete", "strasse"])
+
+        self.villa.name = "Café Villa"
+        self.villa.save()
+        self.nairobi.name = "Cafe Flat"
+        self.nairobi.save()
+        self.assertEqual(SearchVocabulary.objects.get(term="cafe").document_count, 2)
+        self.assertEqual(len(search("CAFÉ")), 2)
+
+    def test_truncated_postings_keep_the_full_ranking(self):
+        def add(name):
+            return make_listing(
+                self.user, name=name, location="Kisumu", description="Lakeside"
+            )
+
+        for n in range(3):
+            add("alpha")
+            add("beta")
+        both = add("alpha beta")
+
+        full = search("alpha beta", limit=3, prefix=False)
+        self.assertEqual(full[0][0], both.pk)
+        with mock.patch(f"{search.__module__}.POSTINGS_PER_TERM", 1):
+            self.assertEqual(search("alpha beta", limit=1, prefix=False), full[:1])
+            self.assertEqual(search("alpha beta", limit=3, prefix=False), full)
+
+
+@override_settings(
+    LISTINGS_CACHE_ENABLED=True,
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class ListingCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create()
+        self.listing = make_listing(self.user)
+        self.url = f"/api/listings/{self.listing.pk}/"
+
+    def test_detail_hit_then_invalidated_by_review(self):
+        self.assertEqual(self.client.get(self.url)["X-Cache"], "MISS")
+        with self.assertNumQueries(0):
+            res = self.client.get(self.url)
+        self.assertEqual(res["X-Cache"], "HIT")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(
+                listing=self.listing, user=self.user, rating=4, comment=""
+            )
+            # Cached entries stay addressed until the write commits
+            self.assertEqual(self.client.get(self.url)["X-Cache"], "HIT")
+        res = self.client.get(self.url)
+        self.assertEqual(res["X-Cache"], "MISS")
+        self.assertEqual(res.json()["rating_count"], 1)
+        self.assertEqual(cache_stats(), {"hits": 2, "misses": 2})
+
+    def test_booking_invalidates_availability_list(self):
+        params = {"check_in": "2025-08-12", "check_out": "2025-08-14"}
+        self.assertEqual(
+            len(self.client.get("/api/listings/", params).json()["results"]), 1
+        )
+        self.assertEqual(self.client.get("/api/listings/", params)["X-Cache"], "HIT")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_booking(self.listing, self.user, date(2025, 8, 10), date(2025, 8, 15))
+        res = self.client.get("/api/listings/", params)
+        self.assertEqual(res["X-Cache"], "MISS")
+        self.assertEqual(res.json()["results"], [])
+
+    @override_settings(LISTINGS_CACHE_ENABLED=False)
+    def test_disabled(self):
+        self.client.get(self.url)
+        res = self.client.get(self.url)
+        self.assertNotIn("X-Cache", res)
+        self.assertEqual(cache_stats(), {"hits": 0, "misses": 0})
+
+
+class CountingBackend(LocmemBackend):
+    """Locmem backend that counts opened connections and can fail sends"""
+
+    opened = 0
+    fail_for = set()
+
+    def open(self):
+        CountingBackend.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        for message in messages:
+            if set(message.to) & self.fail_for:
+                raise ConnectionError("recipient refused")
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND="listings.tests.CountingBackend", EMAIL_BATCH_SIZE=10)
+class BatchedMailTests(TestCase):
+    def setUp(self):
+        CountingBackend.opened = 0
+        CountingBackend.fail_for = set()
+
+    def test_tasks_buffer_instead_of_sending(self):
+        send_confirm_booking_email("ref-1", "guest@example.com", "Villa")
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(QueuedEmail.objects.get().to, ["guest@example.com"])
+
+    def test_one_connection_per_chunk(self):
+        for i in range(25):
+            queue_mail("Hello", "Body", [f"guest{i}@example.com"])
+
+        result = flush_queue()
+        self.assertEqual(result, {"sent": 25, "failed": 0, "batches": 3})
+        self.assertEqual(len(mail.outbox), 25)
+        self.assertEqual(CountingBackend.opened, 3)
+        self.assertFalse(
+            QueuedEmail.objects.exclude(status=QueuedEmail.EmailStatus.SENT).exists()
+        )
+
+    def test_failed_message_is_retried_alone(self):
+        queue_mail("Hello", "Body", ["ok@example.com"])
+        bad = queue_mail("Hello", "Body", ["bad@example.com"])
+        CountingBackend.fail_for = {"bad@example.com"}
+
+        self.assertEqual(flush_queue()["failed"], 1)
+        bad.refresh_from_db()
+        self.assertEqual(bad.status, QueuedEmail.EmailStatus.PENDING)
+        self.assertEqual(bad.attempts, 1)
+        self.assertIn("refused", bad.last_error)
+
+        # Not due yet, then due once the backoff has elapsed
+        self.assertEqual(flush_queue()["batches"], 0)
+        CountingBackend.fail_for = set()
+        QueuedEmail.objects.filter(pk=bad.pk).update(next_attempt_at=bad.created_at)
+        self.assertEqual(flush_queue()["sent"], 1)
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class StubChapaHandler(BaseHTTPRequestHandler):
+    """Replies with the next scripted (status, body) of the server"""
+
+    def _reply(self):
+        server = self.server
+        server.requests.append((self.command, self.path))
+        if self.path in server.routes:
+            status_code, body = server.routes[self.path]
+        elif server.script:
+            status_code, body = server.script.pop(0)
+        else:
+            status_code, body = server.default
+        payload = json.dumps(body).encode()
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+class StubChapaServer(ThreadingHTTPServer):
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubChapaHandler)
+        self.requests = []
+        self.script = []
+        self.routes = {}
+        self.default = (200, {"status": "success", "data": {}})
+        self.connections = 0
+
+    def get_request(self):
+        self.connections += 1
+        return super().get_request()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+StubChapaHandler.protocol_version = "HTTP/1.1"
+
+
+class ChapaClientTests(SimpleTestCase):
+    def setUp(self):
+        self.server = StubChapaServer()
+        thread = threading.Thread(
+            target=self.server.serve_forever, args=(0.05,), daemon=True
+        )
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def chapa(self, **kwargs):
+        options = {
+            "base_url": self.server.url,
+            "secret_key": "test",
+            "api_version": "v1",
+            "max_retries": 2,
+            "backoff": 0,
+            "breaker": CircuitBreaker(threshold=3, reset_timeout=60),
+        }
+        options.update(kwargs)
+        return ChapaClient(**options)
+
+    def test_reuses_one_keep_alive_connection(self):
+        client = self.chapa()
+        for _ in range(5):
+            self.assertEqual(client.verify("tx-1").status_code, 200)
+
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(
+            self.server.requests[0], ("GET", "/v1/transaction/verify/tx-1")
+        )
+        self.assertEqual(client.metrics.snapshot()["verify"]["calls"], 5)
+
+    def test_verify_retries_server_errors(self):
+        self.server.script = [(502, {}), (503, {})]
+        response = self.chapa().verify("tx-1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_initialize_is_not_retried(self):
+        self.server.script = [(500, {"msg": "boom"})]
+        response = self.chapa().initialize({"amount": "10"})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_read_timeout_is_bounded(self):
+        client = self.chapa(read_timeout=0.2, max_retries=0)
+        gate = threading.Event()
+        self.addCleanup(gate.set)
+        self.server.RequestHandlerClass = type(
+            "SlowHandler", (StubChapaHandler,), {"do_GET": lambda h: gate.wait(2)}
+        )
+        with self.assertRaises(ChapaError):
+            client.verify("tx-1")
+        self.assertEqual(client.metrics.snapshot()["verify"]["errors"], 1)
+
+    def test_circuit_opens_and_fails_fast(self):
+        now = [0.0]
+        breaker = CircuitBreaker(threshold=3, reset_timeout=30, clock=lambda: now[0])
+        client = self.chapa(max_retries=0, breaker=breaker)
+        self.server.default = (500, {})
+
+        for _ in range(3):
+            client.verify("tx-1")
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        with self.assertRaises(ChapaUnavailable):
+            client.verify("tx-1")
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(client.metrics.snapshot()["verify"]["rejected"], 1)
+
+        # Half-open trial succeeds and closes the circuit
+        now[0] = 31
+        self.server.default = (200, {"status": "success"})
+        self.assertEqual(client.verify("tx-1").status_code, 200)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_async_client_pools_connections(self):
+        self.server.script = [(502, {})]
+        client = AsyncChapaClient.for_client(self.chapa(pool_size=2))
+
+        async def run():
+            try:
+                return await asyncio.gather(
+                    *(client.verify(f"tx-{n}") for n in range(6))
+                )
+            finally:
+                await client.aclose()
+
+        responses = asyncio.run(run())
+        self.assertEqual([r.status_code for r in responses], [200] * 6)
+        # One 502 retried, on at most two connections
+        self.assertEqual(len(self.server.requests), 7)
+        self.assertLessEqual(self.server.connections, 2)
+        self.assertEqual(client.metrics.snapshot()["verify"]["calls"], 7)
+
+    def test_async_initialize_is_not_retried(self):
+        self.server.script = [(500, {"msg": "boom"})]
+        client = AsyncChapaClient.for_client(self.chapa())
+
+        async def run():
+            try:
+                return await client.initialize({"amount": "10"})
+            finally:
+                await client.aclose()
+
+        response = asyncio.run(run())
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json(), {"msg": "boom"})
+        self.assertEqual(len(self.server.requests), 1)
+
+
+@override_settings(CHAPA_WEBHOOK_SECRET="whsec")
+class ChapaWebhookTests(TestCase):
+    url = "/api/chapa-webhook/"
+
+    def setUp(self):
+        user = User.objects.create()
+        listing = make_listing(user)
+        self.booking = make_booking(
+            listing, user, date(2025, 8, 1), date(2025, 8, 3), status="pending"
+        )
+        self.payment = make_payment(self.booking)
+
+    def post(self, payload, secret="whsec"):
+        body = json.dumps(payload).encode()
+        signature = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        return self.client.post(
+            self.url,
+            body,
+            content_type="application/json",
+            HTTP_X_CHAPA_SIGNATURE=signature,
+        )
+
+    def event(self, status="success", reference="APabc"):
+        return {
+            "event": f"charge.{status}",
+            "tx_ref": str(self.payment.payment_id),
+            "reference": reference,
+            "status": status,
+        }
+
+    def test_rejects_bad_signature(self):
+        self.assertEqual(self.post(self.event(), secret="wrong").status_code, 401)
+        self.assertFalse(ChapaWebhookEvent.objects.exists())
+
+    @override_settings(CHAPA_WEBHOOK_SECRET="")
+    def test_rejects_everything_without_a_secret(self):
+        self.assertEqual(self.post(self.event(), secret="").status_code, 401)
+        self.assertFalse(ChapaWebhookEvent.objects.exists())
+
+    def test_duplicates_are_noops(self):
+        self.assertEqual(self.post(self.event()).status_code, 200)
+        self.assertEqual(self.post(self.event()).status_code, 200)
+        self.assertEqual(ChapaWebhookEvent.objects.count(), 1)
+
+    def test_events_applied_in_batches(self):
+        self.post(self.event())
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.PaymentStatus.PENDING)
+
+        apply_chapa_webhook_events()
+        self.payment.refresh_from_db()
+        self.booking.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.PaymentStatus.COMPLETED)
+        self.assertEqual(self.booking.status, "confirmed")
+        self.assertFalse(
+            ChapaWebhookEvent.objects.filter(processed_at__isnull=True).exists()
+        )
+
+    def test_failure_does_not_downgrade_completed_payment(self):
+        self.post(self.event())
+        apply_chapa_webhook_events()
+        self.post(self.event(status="failed", reference="APdef"))
+        apply_chapa_webhook_events()
+
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.PaymentStatus.COMPLETED)
+
+    def test_malformed_tx_ref_does_not_block_the_batch(self):
+        for tx_ref in (None, "not-a-uuid", str(uuid4())):
+            self.post({**self.event(reference=f"AP{tx_ref}"), "tx_ref": tx_ref})
+        self.post(self.event())
+
+        with self.assertLogs("listings.webhooks", "WARNING"):
+            self.assertEqual(
+                apply_chapa_webhook_events(), "Applied 4 Chapa webhook events"
+            )
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.PaymentStatus.COMPLETED)
+
+        events = ChapaWebhookEvent.objects.order_by("id")
+        self.assertFalse(events.filter(processed_at__isnull=True).exists())
+        self.assertEqual(
+            list(events.values_list("error", flat=True)),
+            [
+                "tx_ref is not a payment id",
+                "tx_ref is not a payment id",
+                "no payment has this tx_ref",
+                "",
+            ],
+        )
+
+
+class ReconcilePaymentsTests(TestCase):
+    def setUp(self):
+        self.server = StubChapaServer()
+        thread = threading.Thread(
+            target=self.server.serve_forever, args=(0.05,), daemon=True
+        )
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        client = ChapaClient(base_url=self.server.url, max_retries=0)
+        patcher = mock.patch("listings.reconcile.get_client", return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        user = User.objects.create()
+        listing = make_listing(user)
+        self.payments = []
+        for day in range(1, 6):
+            booking = make_booking(
+                listing,
+                user,
+                date(2025, 9, day * 3),
+                date(2025, 9, day * 3 + 2),
+                status="pending",
+            )
+            self.payments.append(make_payment(booking))
+        Payment.objects.update(created_at=timezone.now() - timedelta(hours=1))
+
+    def respond(self, payment, chapa_status):
+        path = f"/v1/transaction/verify/{payment.payment_id}"
+        self.server.routes[path] = (200, {"data": {"status": chapa_status}})
+
+    def test_applies_results_across_pages(self):
+        self.respond(self.payments[0], "success")
+        self.respond(self.payments[1], "failed")
+        self.server.default = (200, {"data": {"status": "pending"}})
+
+        result = run_reconciliation(page_size=2, concurrency=3)
+        self.assertEqual(
+            (result["checked"], result["completed"], result["failed"]), (5, 1, 1)
+        )
+        self.assertEqual(len(self.server.requests), 5)
+
+        statuses = dict(Payment.objects.values_list("payment_id", "status"))
+        self.assertEqual(statuses[self.payments[0].payment_id], "completed")
+        self.assertEqual(statuses[self.payments[1].payment_id], "failed")
+        self.assertEqual(statuses[self.payments[2].payment_id], "pending")
+        self.payments[0].booking.refresh_from_db()
+        self.assertEqual(self.payments[0].booking.status, "confirmed")
+
+    def test_claimed_rows_are_skipped_until_recheck_interval(self):
+        self.server.default = (200, {"data": {"status": "pending"}})
+        self.assertEqual(run_reconciliation()["checked"], 5)
+        self.assertEqual(run_reconciliation()["checked"], 0)
+
+    def test_fresh_payments_wait_for_grace_period(self):
+        Payment.objects.update(created_at=timezone.now())
+        self.assertEqual(run_reconciliation()["checked"], 0)
+
+    def test_only_pending_rows_change(self):
+        settled, canceled = self.payments[0], self.payments[1]
+        page = list(Payment.objects.filter(pk__in=[settled.pk, canceled.pk]))
+        # Settled by a webhook, or canceled, after the page was claimed
+        Payment.objects.filter(pk=settled.pk).update(status="completed")
+        Booking.objects.filter(pk=canceled.booking_id).update(status="canceled")
+
+        results = [(p, "failed" if p.pk == settled.pk else "success") for p in page]
+        self.assertEqual(apply_results(results), (1, 0))
+
+        statuses = dict(Payment.objects.values_list("pk", "status"))
+        self.assertEqual(statuses[settled.pk], "completed")
+        self.assertEqual(statuses[canceled.pk], "completed")
+        canceled.booking.refresh_from_db()
+        self.assertEqual(canceled.booking.status, "canceled")
+
+
+class AsyncPaymentViewTests(TestCase):
+    def setUp(self):
+        self.server = StubChapaServer()
+        thread = threading.Thread(
+            target=self.server.serve_forever, args=(0.05,), daemon=True
+        )
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        client = ChapaClient(base_url=self.server.url, max_retries=0)
+        patcher = mock.patch("listings.chapa_async.get_client", return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        user = User.objects.create()
+        booking = make_booking(
+            make_listing(user), user, date(2025, 9, 1), date(2025, 9, 3), "pending"
+        )
+        self.payment = make_payment(booking)
+        self.staff = get_user_model().objects.create(
+            username="staff", email="staff@example.com", is_staff=True
+        )
+
+    def url(self, action):
+        return f"/api/async/payments/{self.payment.pk}/{action}/"
+
+    async def test_verify_applies_chapa_status(self):
+        path = f"/v1/transaction/verify/{self.payment.payment_id}"
+        self.server.routes[path] = (200, {"data": {"status": "success"}})
+        await self.async_client.aforce_login(self.staff)
+
+        with mock.patch.object(
+            AsyncChapaClient,
+            "aclose",
+            autospec=True,
+            side_effect=AsyncChapaClient.aclose,
+        ) as aclose:
+            response = await self.async_client.get(self.url("verify"))
+        # The request's client, and its connections, are closed with it
+        aclose.assert_awaited_once()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "completed")
+        await self.payment.arefresh_from_db()
+        self.assertEqual(self.payment.status, Payment.PaymentStatus.COMPLETED)
+
+    async def test_initialize_returns_checkout_url(self):
+        self.server.default = (
+            200,
+            {"status": "success", "data": {"checkout_url": "https://chapa.co/c/1"}},
+        )
+        await self.async_client.aforce_login(self.staff)
+
+        response = await self.async_client.post(self.url("initialize"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["checkout_url"], "https://chapa.co/c/1")
+        self.assertEqual(self.server.requests, [("POST", "/v1/transaction/initialize")])
+        await self.payment.arefresh_from_db()
+        self.assertEqual(self.payment.email, "staff@example.com")
+        self.assertEqual(self.payment.checkout_url, "https://chapa.co/c/1")
+        message = await OutboxMessage.objects.aget()
+        self.assertEqual(message.task, "listings.tasks.send_payment_checkout_mail")
+        self.assertEqual(message.args[2], "https://chapa.co/c/1")
+
+    async def test_initialize_honors_idempotency_key(self):
+        self.server.default = (
+            200,
+            {"status": "success", "data": {"checkout_url": "https://chapa.co/c/1"}},
+        )
+        await self.async_client.aforce_login(self.staff)
+
+        responses = [
+            await self.async_client.post(
+                self.url("initialize"), headers={"Idempotency-Key": "checkout-1"}
+            )
+            for _ in range(2)
+        ]
+        self.assertEqual([r.status_code for r in responses], [200, 200])
+        self.assertEqual(responses[0].json(), responses[1].json())
+        self.assertEqual(responses[1]["Idempotent-Replayed"], "true")
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(await OutboxMessage.objects.acount(), 1)
+
+    async def test_initialize_failure_marks_payment_failed(self):
+        self.server.default = (400, {"msg": "Invalid currency"})
+        await self.async_client.aforce_login(self.staff)
+
+        response = await self.async_client.post(self.url("initialize"))
+        self.assertEqual(response.status_code, 500)
+        self.assertIn("Invalid currency", response.json()["err"])
+        await self.payment.arefresh_from_db()
+        self.assertEqual(self.payment.status, Payment.PaymentStatus.FAILED)
+
+    async def test_complete_checks_ownership(self):
+        response = await self.async_client.get(self.url("complete"))
+        self.assertEqual(response.status_code, 403)
+
+        guest = await get_user_model().objects.acreate(username="guest")
+        await self.async_client.aforce_login(guest)
+        response = await self.async_client.get(self.url("complete"))
+        self.assertEqual(response.status_code, 403)
+
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(self.url("complete"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["booking"], str(self.payment.booking_id))
+
+    async def test_unknown_payment_is_not_found(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(f"/api/async/payments/{uuid4()}/verify/")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.server.requests, [])
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="guest@example.com")
+        self.listing = make_listing(self.user)
+
+    def test_rolled_back_rows_take_their_messages_along(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    enqueue(send_booking_confirmation, "a@example.com", uuid4())
+                    raise RuntimeError
+        self.assertFalse(OutboxMessage.objects.exists())
+        self.assertEqual(callbacks, [])
+
+    @mock.patch("listings.outbox.publish_later")
+    def test_booking_is_published_after_commit(self, publish_later):
+        data = {
+            "listing": str(self.listing.pk),
+            "user": str(self.user.pk),
+            "start_date": "2025-10-01",
+            "end_date": "2025-10-03",
+            "status": "pending",
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(
+                "/api/booking/", data, content_type="application/json"
+            )
+            # Nothing is published before the transaction commits
+            publish_later.assert_not_called()
+        self.assertEqual(res.status_code, 201)
+
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.task, "listings.tasks.send_booking_confirmation")
+        self.assertEqual(message.args[1], res.json()["booking_id"])
+        publish_later.assert_called_once_with([message.pk])
+
+    def test_relay_publishes_in_batches(self):
+        messages = [
+            enqueue(send_booking_confirmation, f"{n}@example.com", uuid4())
+            for n in range(5)
+        ]
+        with mock.patch.object(send_booking_confirmation, "apply_async") as send:
+            result = relay(batch_size=2, concurrency=2)
+        self.assertEqual(result, {"sent": 5, "failed": 0, "batches": 3})
+        self.assertEqual(
+            sorted(call.kwargs["task_id"] for call in send.call_args_list),
+            sorted(f"outbox-{message.pk}" for message in messages),
+        )
+        self.assertEqual(
+            set(OutboxMessage.objects.values_list("status", flat=True)), {"sent"}
+        )
+
+    def test_failed_publish_is_retried_later(self):
+        message = enqueue(send_booking_confirmation, "a@example.com", uuid4())
+        with mock.patch.object(
+            send_booking_confirmation, "apply_async", side_effect=OSError("down")
+        ):
+            self.assertEqual(relay()["failed"], 1)
+            # Backing off, so the next run leaves it alone
+            self.assertEqual(relay()["batches"], 0)
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.MessageStatus.PENDING)
+        self.assertEqual(message.attempts, 1)
+        self.assertGreater(message.next_attempt_at, timezone.now())
+
+        OutboxMessage.objects.update(next_attempt_at=timezone.now())
+        with mock.patch.object(send_booking_confirmation, "apply_async"):
+            self.assertEqual(relay()["sent"], 1)
+
+    def test_unknown_task_is_dropped(self):
+        OutboxMessage.objects.create(task="listings.tasks.missing")
+        self.assertEqual(relay()["failed"], 1)
+        self.assertEqual(
+            OutboxMessage.objects.get().status, OutboxMessage.MessageStatus.FAILED
+        )
+
+
+class IdempotencyKeyTests(TestCase):
+    url = "/api/booking/"
+
+    def setUp(self):
+        self.user = User.objects.create(email="guest@example.com")
+        self.listing = make_listing(self.user)
+
+    def post(self, key, start="2025-10-01", end="2025-10-03"):
+        data = {
+            "listing": str(self.listing.pk),
+            "user": str(self.user.pk),
+            "start_date": start,
+            "end_date": end,
+            "status": "pending",
+        }
+        return self.client.post(
+            self.url,
+            data,
+            content_type="application/json",
+            headers={"Idempotency-Key": key},
+        )
+
+    def test_repeat_replays_the_first_response(self):
+        first = self.post("retry-1")
+        self.assertEqual(first.status_code, 201)
+
+        # One lookup; no booking, pricing or outbox queries
+        with self.assertNumQueries(1):
+            again = self.post("retry-1")
+        self.assertEqual(again.status_code, 201)
+        self.assertEqual(again.json(), first.json())
+        self.assertEqual(again["Idempotent-Replayed"], "true")
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+        self.assertEqual(
+            self.post("retry-2", "2025-10-05", "2025-10-06").status_code, 201
+        )
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_key_reused_for_another_request_is_refused(self):
+        self.post("retry-1")
+        res = self.post("retry-1", "2025-11-01", "2025-11-02")
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_duplicate_waits_for_the_request_in_flight(self):
+        row = IdempotencyKey.objects.create(
+            key="pending",
+            fingerprint="pending",
+            locked_until=timezone.now() + timedelta(minutes=1),
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+        # Key and fingerprint both digest to "pending"
+        with mock.patch("listings.idempotency._digest", return_value="pending"):
+            with override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0.1):
+                res = self.post("retry-1")
+            self.assertEqual(res.status_code, 409)
+            self.assertEqual(res["Retry-After"], "1")
+
+            # The first request finishes while the duplicate polls
+            def finish(_):
+                IdempotencyKey.objects.filter(pk=row.pk).update(
+                    status_code=201, body={"booking_id": "first"}
+                )
+
+            with mock.patch("listings.idempotency.time.sleep", side_effect=finish):
+                res = self.post("retry-1")
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.json(), {"booking_id": "first"})
+        self.assertEqual(Booking.objects.count(), 0)
+
+    def test_abandoned_key_is_taken_over(self):
+        with mock.patch("listings.idempotency._digest", return_value="stale"):
+            IdempotencyKey.objects.create(
+                key="stale",
+                fingerprint="stale",
+                locked_until=timezone.now() - timedelta(seconds=1),
+                expires_at=timezone.now() + timedelta(days=1),
+            )
+            res = self.post("retry-1")
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 201)
+
+    @mock.patch("listings.views.get_client")
+    def test_initialize_calls_chapa_once(self, get_client):
+        booking = make_booking(
+            self.listing, self.user, date(2025, 9, 1), date(2025, 9, 3), "pending"
+        )
+        payment = make_payment(booking)
+        get_client.return_value.initialize.return_value.status_code = 500
+        get_client.return_value.initialize.return_value.json.return_value = {
+            "msg": "Try again"
+        }
+
+        api = APIClient()
+        api.force_authenticate(
+            get_user_model().objects.create(username="guest", email="g@example.com")
+        )
+        url = f"/api/payments/{payment.pk}/initialize/"
+        headers = {"HTTP_IDEMPOTENCY_KEY": "pay-1"}
+
+        # Server errors are not stored, so the retry reaches Chapa
+        self.assertEqual(api.post(url, format="json", **headers).status_code, 500)
+        get_client.return_value.initialize.return_value.status_code = 200
+        get_client.return_value.initialize.return_value.json.return_value = {
+            "data": {"checkout_url": "https://chapa.co/c/1"}
+        }
+        first = api.post(url, format="json", **headers)
+        again = api.post(url, format="json", **headers)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(again.json(), first.json())
+        self.assertEqual(get_client.return_value.initialize.call_count, 2)
+        payload = get_client.return_value.initialize.call_args.args[0]
+        self.assertEqual(payload["email"], "g@example.com")
+        self.assertEqual(payload["tx_ref"], str(payment.payment_id))
+
+
+class BookingReservationTests(TestCase):
+    url = "/api/booking/"
+
+    def setUp(self):
+        self.user = User.objects.create(email="guest@example.com")
+        self.listing = make_listing(self.user)
+        self.booking = make_booking(
+            self.listing, self.user, date(2025, 10, 10), date(2025, 10, 12)
+        )
+
+    def post(self, start, end, status="pending"):
+        data = {
+            "listing": str(self.listing.pk),
+            "user": str(self.user.pk),
+            "start_date": start,
+            "end_date": end,
+            "status": status,
+        }
+        return self.client.post(self.url, data, content_type="application/json")
+
+    def test_overlapping_booking_is_a_conflict(self):
+        res = self.post("2025-10-11", "2025-10-14")
+        self.assertEqual(res.status_code, 409)
+        self.assertEqual(res.json()["detail"], BookingConflict.default_detail)
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_adjacent_and_canceled_bookings_are_accepted(self):
+        self.assertEqual(self.post("2025-10-12", "2025-10-14").status_code, 201)
+        # A canceled booking holds no nights, so it never conflicts
+        self.assertEqual(
+            self.post("2025-10-10", "2025-10-12", status="canceled").status_code, 201
+        )
+        self.assertEqual(OutboxMessage.objects.count(), 2)
+
+    def test_update_ignores_its_own_nights(self):
+        other = make_booking(
+            self.listing, self.user, date(2025, 10, 20), date(2025, 10, 22)
+        )
+        url = f"{self.url}{self.booking.pk}/"
+        res = self.client.patch(
+            url, {"end_date": "2025-10-13"}, content_type="application/json"
+        )
+        self.assertEqual(res.status_code, 200)
+
+        res = self.client.patch(
+            url, {"end_date": "2025-10-21"}, content_type="application/json"
+        )
+        self.assertEqual(res.status_code, 409)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.end_date, date(2025, 10, 13))
+
+        # Canceling the other booking frees its nights
+        other.status = "canceled"
+        other.save()
+        res = self.client.patch(
+            url, {"end_date": "2025-10-21"}, content_type="application/json"
+        )
+        self.assertEqual(res.status_code, 200)
+
+
+class ReserveTests(TestCase):
+    """The reserve() check itself; ConcurrentBookingTests races it for real"""
+
+    def setUp(self):
+        self.user = User.objects.create()
+        self.listing = make_listing(self.user)
+
+    def book(self, start_date, end_date):
+        return lambda: make_booking(
+            self.listing, self.user, start_date, end_date, status="pending"
+        )
+
+    def test_overlap_is_refused_inside_the_callers_transaction(self):
+        save = mock.Mock(side_effect=self.book(date(2025, 10, 12), date(2025, 10, 14)))
+        with transaction.atomic():
+            first = reserve(
+                self.listing.pk,
+                date(2025, 10, 10),
+                date(2025, 10, 13),
+                self.book(date(2025, 10, 10), date(2025, 10, 13)),
+            )
+            with self.assertRaises(BookingConflict):
+                reserve(self.listing.pk, date(2025, 10, 12), date(2025, 10, 14), save)
+            save.assert_not_called()
+
+            # Back-to-back stays share no night, and the transaction goes on
+            reserve(
+                self.listing.pk,
+                date(2025, 10, 13),
+                date(2025, 10, 15),
+                self.book(date(2025, 10, 13), date(2025, 10, 15)),
+            )
+
+        self.assertEqual(Booking.objects.filter(listing=self.listing).count(), 2)
+        # A booking being moved doesn't conflict with its own nights
+        reserve(
+            self.listing.pk,
+            date(2025, 10, 9),
+            date(2025, 10, 12),
+            lambda: None,
+            exclude=first.pk,
+        )
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class ConcurrentBookingTests(TransactionTestCase):
+    def test_concurrent_requests_never_overlap(self):
+        user = User.objects.create()
+        listing = make_listing(user)
+        barrier = threading.Barrier(8)
+        statuses = []
+
+        def book(offset):
+            client = Client()
+            barrier.wait()
+            try:
+                # Every request wants the 12th, in ranges that all overlap
+                res = client.post(
+                    "/api/booking/",
+                    {
+                        "listing": str(listing.pk),
+                        "user": str(user.pk),
+                        "start_date": f"2025-10-{10 + offset % 3:02d}",
+                        "end_date": f"2025-10-{13 + offset % 2:02d}",
+                        "status": "pending",
+                    },
+                    content_type="application/json",
+                )
+                statuses.append(res.status_code)
+            finally:
+                connection.close()
+
+        with mock.patch("listings.outbox.publish_later"):
+            threads = [threading.Thread(target=book, args=(n,)) for n in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(sorted(statuses), [201] + [409] * 7)
+        self.assertEqual(Booking.objects.filter(listing=listing).count(), 1)
+
+
+class BulkBookingTests(TestCase):
+    url = "/api/booking/bulk/"
+
+    def setUp(self):
+        self.user = User.objects.create()
+        self.listing = make_listing(self.user)
+        self.other = make_listing(self.user, name="Cabin Retreat in Naivasha")
+        make_booking(self.listing, self.user, date(2025, 10, 10), date(2025, 10, 12))
+
+    def item(self, listing, start, end, **kwargs):
+        data = {
+            "listing": str(listing.pk),
+            "user": str(self.user.pk),
+            "start_date": start,
+            "end_date": end,
+        }
+        data.update(kwargs)
+        return data
+
+    def test_reports_each_item(self):
+        items = [
+            self.item(self.listing, "2025-10-01", "2025-10-05", email="a@example.com"),
+            self.item(self.listing, "2025-10-04", "2025-10-06"),  # overlaps item 0
+            self.item(self.listing, "2025-10-11", "2025-10-13"),  # overlaps stored
+            self.item(self.other, "2025-10-01", "2025-10-05", email="b@example.com"),
+            self.item(self.other, "2025-10-05", "2025-10-03"),  # invalid range
+            {**self.item(self.other, "2025-11-01", "2025-11-02"), "user": str(uuid4())},
+        ]
+        res = self.client.post(self.url, items, content_type="application/json")
+        self.assertEqual(res.status_code, 200)
+
+        body = res.json()
+        self.assertEqual(
+            [r["status"] for r in body["results"]],
+            ["created", "conflict", "conflict", "created", "invalid", "invalid"],
+        )
+        self.assertEqual((body["created"], body["failed"]), (2, 4))
+        self.assertEqual(Booking.objects.count(), 3)
+        # Totals are priced on the server: 4 nights at 50
+        created = Booking.objects.get(pk=body["results"][0]["booking_id"])
+        self.assertEqual(created.total_price, 200)
+
+        # One outbox message for the batch's confirmation emails
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.task, "listings.tasks.send_booking_confirmations")
+        self.assertEqual(
+            sorted(email for email, _ in message.args[0]),
+            ["a@example.com", "b@example.com"],
+        )
+
+    def test_queries_do_not_grow_with_batch_size(self):
+        items = [
+            self.item(self.other, f"2025-12-{day:02d}", f"2025-12-{day + 1:02d}")
+            for day in range(1, 29)
+        ]
+        # savepoint, listing lock, 3 pricing reads, users, one range query,
+        # one insert, release
+        with self.assertNumQueries(9):
+            res = self.client.post(self.url, items, content_type="application/json")
+        self.assertEqual(res.json()["created"], 28)
+
+    def test_rejects_non_list(self):
+        res = self.client.post(self.url, {}, content_type="application/json")
+        self.assertEqual(res.status_code, 400)
+
+    def test_confirmation_task_queues_batch(self):
+        booking = Booking.objects.get()
+        send_booking_confirmations([["guest@example.com", str(booking.pk)]])
+        self.assertEqual(QueuedEmail.objects.get().to, ["guest@example.com"])
+
+
+@override_settings(QUERY_BUDGET_RAISE=True, LISTINGS_CACHE_ENABLED=False)
+class QueryBudgetTests(TestCase):
+    """Every endpoint runs a fixed number of queries regardless of row count"""
+
+    def setUp(self):
+        self.user = User.objects.create()
+        for i in range(3):
+            listing = make_listing(self.user, name=f"Listing {i}")
+            booking = make_booking(
+                listing, self.user, date(2025, 8, 1), date(2025, 8, 3)
+            )
+            self.payment = make_payment(booking)
+        self.listing, self.booking = listing, booking
+
+        self.staff = get_user_model().objects.create(username="staff", is_staff=True)
+        self.api = APIClient()
+        self.api.force_authenticate(self.staff)
+
+    def test_listing_endpoints(self):
+        with self.assertNumQueries(1):
+            self.client.get("/api/listings/")
+        with self.assertNumQueries(1):
+            self.client.get(f"/api/listings/{self.listing.pk}/")
+        with self.assertNumQueries(1):
+            self.client.get(
+                "/api/listings/",
+                {"check_in": "2025-08-01", "check_out": "2025-08-02", "min_rating": 1},
+            )
+        # vocabulary lookups, document count, one postings read per term and
+        # one listing fetch
+        cache.clear()
+        with self.assertNumQueries(6):
+            self.client.get("/api/listings/search/", {"q": "nairobi apartm"})
+
+    def test_booking_endpoints(self):
+        with self.assertNumQueries(1):
+            self.client.get("/api/booking/")
+        with self.assertNumQueries(1):
+            self.client.get(f"/api/booking/{self.booking.pk}/")
+
+    def test_payment_endpoints(self):
+        with self.assertNumQueries(1):
+            self.api.get("/api/payments/")
+        with self.assertNumQueries(1):
+            self.api.get(f"/api/payments/{self.payment.pk}/")
+        with self.assertNumQueries(1):
+            self.api.get(f"/api/payments/{self.payment.id}/complete/")
+
+    def test_logged_in_requests_stay_within_budget(self):
+        self.staff.set_password("secret")
+        self.staff.save()
+        self.assertTrue(self.client.login(username="staff", password="secret"))
+
+        # Budgets leave out the session and user lookups of a login
+        for path, queries in (
+            ("/api/payments/", 1),
+            (f"/api/payments/{self.payment.pk}/", 1),
+            (f"/api/payments/{self.payment.id}/complete/", 1),
+            ("/api/listings/", 1),
+            ("/api/chapa/metrics/", 0),
+        ):
+            with self.assertNumQueries(queries + 2):
+                self.assertEqual(self.client.get(path).status_code, 200, path)
+        res = self.client.get("/api/exports/bookings.ndjson")
+        self.assertEqual(res.status_code, 200)
+        b"".join(res.streaming_content)
+
+    @mock.patch("listings.views.get_client")
+    def test_verify_endpoint(self, get_client):
+        get_client.return_value.verify.return_value.status_code = 404
+        get_client.return_value.verify.return_value.json.return_value = {}
+        with self.assertNumQueries(1):
+            self.api.get(f"/api/payments/{self.payment.pk}/verify/")
+
+    def test_over_budget_raises(self):
+        with mock.patch.object(ListingViewSet, "query_budget", {"list": 0}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get("/api/listings/")
+
+
+class SeedCommandTests(TestCase):
+    def seed(self, **options):
+        options = {
+            "listings": 30,
+            "bookings": 400,
+            "reviews": 60,
+            "payments": 50,
+            **options,
+        }
+        call_command("seed", seed=3, batch_size=64, stdout=StringIO(), **options)
+
+    def test_volumes_and_disjoint_bookings(self):
+        self.seed()
+
+        self.assertEqual(Listing.objects.count(), 30)
+        self.assertEqual(Booking.objects.count(), 400)
+        self.assertEqual(Review.objects.count(), 60)
+        self.assertEqual(Payment.objects.count(), 50)
+
+        last_end = {}
+        for booking in Booking.objects.order_by("listing_id", "start_date"):
+            previous = last_end.get(booking.listing_id)
+            self.assertTrue(previous is None or previous <= booking.start_date)
+            last_end[booking.listing_id] = booking.end_date
+
+        counts = sorted(
+            Booking.objects.values_list("listing_id")
+            .annotate(n=Count("pk"))
+            .values_list("n", flat=True)
+        )
+        self.assertGreater(counts[-1], 5 * counts[len(counts) // 2])
+
+    def test_samples_are_seeded_once(self):
+        call_command("seed", stdout=StringIO())
+        call_command("seed", stdout=StringIO())
+
+        self.assertEqual(User.objects.count(), 1)
+        self.assertEqual(Listing.objects.count(), 3)
+
+    def test_same_seed_generates_same_data(self):
+        self.seed()
+        first = list(Booking.objects.order_by("pk").values_list("pk", "start_date"))
+
+        User.objects.all().delete()
+        self.seed()
+
+        self.assertEqual(
+            list(Booking.objects.order_by("pk").values_list("pk", "start_date")), first
+        )
+
+
+class EndpointBenchmarkTests(TestCase):
+    def test_records_every_endpoint(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "baseline.json")
+            call_command(
+                "bench_endpoints",
+                listings=5,
+                bookings=20,
+                reviews=5,
+                payments=5,
+                requests=3,
+                warmup=0,
+                memory_requests=1,
+                output=path,
+                stdout=StringIO(),
+            )
+            with open(path) as f:
+                report = json.load(f)
+
+            self.assertIn("payments-verify", report["endpoints"])
+            for name, result in report["endpoints"].items():
+                self.assertEqual(result["errors"], 0, name)
+                self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+
+            # The run itself leaves nothing behind
+            self.assertFalse(Listing.objects.exists())
+
+    def test_compare_flags_only_real_regressions(self):
+        baseline = {"list": {"p50_ms": 10.0, "p95_ms": 20.0, "queries": 1}}
+        current = {
+            "list": {"p50_ms": 10.5, "p95_ms": 30.0, "queries": 2},
+            "new": {"p50_ms": 99.0},
+        }
+
+        self.assertEqual(
+            compare(baseline, current, 20, 1.0, 64),
+            [("list", "p95_ms", 20.0, 30.0), ("list", "queries", 1, 2)],
+        )
+
+
+class PricingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create()
+        # 100 on weekdays, 150 on Friday and Saturday nights
+        self.listing = make_listing(
+            self.user, price_per_night=100, weekend_price_per_night=150
+        )
+
+    def quote(self, check_in, check_out, listing=None):
+        listing = listing or self.listing
+        return quote_listings([listing.pk], check_in, check_out)[0]
+
+    def test_counts_weekend_nights(self):
+        # 2025-09-01 is a Monday
+        for days in range(0, 30):
+            start = date(2025, 9, 1) + timedelta(days=days % 7)
+            end = start + timedelta(days=days)
+            expected = sum(
+                (start + timedelta(days=i)).weekday() in (4, 5) for i in range(days)
+            )
+            self.assertEqual(count_weekend_nights(start, end), expected)
+
+    def test_weekend_nights_use_weekend_price(self):
+        # Thu, Fri, Sat, Sun nights
+        quote = self.quote(date(2025, 9, 4), date(2025, 9, 8))
+        self.assertEqual(quote["nights"], 4)
+        self.assertEqual(quote["total_price"], 100 + 150 + 150 + 100)
+
+    def test_newest_override_wins(self):
+        ListingRate.objects.create(
+            listing=self.listing,
+            start_date=date(2025, 9, 1),
+            end_date=date(2025, 9, 10),
+            price_per_night=80,
+        )
+        ListingRate.objects.create(
+            listing=self.listing,
+            start_date=date(2025, 9, 3),
+            end_date=date(2025, 9, 5),
+            price_per_night=200,
+        )
+        # Aug 31 base (Sun), Sep 1-2 at 80, Sep 3-4 at 200, Sep 5-9 at 80,
+        # Sep 10 base (Wed)
+        quote = self.quote(date(2025, 8, 31), date(2025, 9, 11))
+        self.assertEqual(quote["total_price"], 100 + 2 * 80 + 2 * 200 + 5 * 80 + 100)
+
+    def test_longest_qualifying_stay_discount(self):
+        StayDiscount.objects.create(listing=self.listing, min_nights=7, percent=10)
+        StayDiscount.objects.create(listing=self.listing, min_nights=28, percent=25)
+
+        short = self.quote(date(2025, 9, 1), date(2025, 9, 4))
+        self.assertEqual(short["discount"], 0)
+
+        week = self.quote(date(2025, 9, 1), date(2025, 9, 8))
+        self.assertEqual(week["subtotal"], 5 * 100 + 2 * 150)
+        self.assertEqual(week["discount"], 80)
+        self.assertEqual(week["total_price"], 720)
+
+    def test_quote_endpoint_prices_many_listings_at_once(self):
+        listings = [self.listing] + [
+            make_listing(self.user, price_per_night=60 + i) for i in range(20)
+        ]
+        ids = ",".join(str(listing.pk) for listing in listings)
+        params = {"check_in": "2025-09-01", "check_out": "2025-09-04", "listings": ids}
+
+        # listings, rate overrides, stay discounts
+        with self.assertNumQueries(3):
+            res = self.client.get("/api/listings/quote/", params)
+        self.assertEqual(res.status_code, 200)
+
+        results = res.json()["results"]
+        self.assertEqual(len(results), 21)
+        self.assertEqual(results[0]["total_price"], "300.00")
+        self.assertEqual(results[1]["total_price"], "180.00")
+
+    def test_quote_endpoint_validates_params(self):
+        url = "/api/listings/quote/"
+        listing = str(self.listing.pk)
+        for params in [
+            {"check_in": "2025-09-04", "check_out": "2025-09-01", "listings": listing},
+            {"check_in": "2025-09-01", "listings": listing},
+            {"check_in": "2025-09-01", "check_out": "2025-09-04"},
+            {"check_in": "2025-09-01", "check_out": "2025-09-04", "listings": "x"},
+        ]:
+            self.assertEqual(self.client.get(url, params).status_code, 400, params)
+
+    def test_booking_update_is_repriced(self):
+        booking = make_booking(
+            self.listing, self.user, date(2025, 9, 1), date(2025, 9, 2)
+        )
+        res = self.client.patch(
+            f"/api/booking/{booking.pk}/",
+            {"end_date": "2025-09-03", "total_price": "1.00"},
+            content_type="application/json",
+        )
+        self.assertEqual(res.status_code, 200, res.content)
+
+        booking.refresh_from_db()
+        self.assertEqual(booking.total_price, 200)
+
+    def test_status_update_keeps_the_booked_price(self):
+        booking = make_booking(
+            self.listing, self.user, date(2025, 9, 1), date(2025, 9, 2), "pending"
+        )
+        ListingRate.objects.create(
+            listing=self.listing,
+            start_date=date(2025, 9, 1),
+            end_date=date(2025, 9, 2),
+            price_per_night=300,
+        )
+        res = self.client.patch(
+            f"/api/booking/{booking.pk}/",
+            {"status": "confirmed"},
+            content_type="application/json",
+        )
+        self.assertEqual(res.status_code, 200, res.content)
+
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, "confirmed")
+        self.assertEqual(booking.total_price, 100)
+
+
+@override_settings(STATS_WATERMARK_LAG=0)
+class DailyStatsTests(TestCase):
+    def setUp(self):
+        self.host = User.objects.create()
+        self.listing = make_listing(self.host)
+        self.other = make_listing(self.host, name="Cabin Retreat in Naivasha")
+        # 3 nights for 100, paid in full
+        self.booking = make_booking(
+            self.listing, self.host, date(2025, 9, 1), date(2025, 9, 4)
+        )
+        make_payment(self.booking, status=Payment.PaymentStatus.COMPLETED)
+        make_booking(
+            self.other, self.host, date(2025, 9, 2), date(2025, 9, 3), status="pending"
+        )
+
+    def stored(self, listing=None):
+        return list(
+            ListingDailyStats.objects.filter(listing=listing or self.listing)
+            .order_by("date")
+            .values_list("date", "booked", "revenue", "paid")
+        )
+
+    def test_refresh_spreads_bookings_over_nights(self):
+        refresh_stats()
+        self.assertEqual(
+            [
+                (day.day, booked, str(revenue))
+                for day, booked, revenue, _ in self.stored()
+            ],
+            [(1, 1, "33.34"), (2, 1, "33.33"), (3, 1, "33.33")],
+        )
+        self.assertEqual(sum(paid for *_, paid in self.stored()), 100)
+        # Pending bookings don't count as occupied
+        self.assertEqual(self.stored(self.other), [])
+
+    def test_host_stats_read_rollups(self):
+        refresh_stats()
+        url = f"/api/hosts/{self.host.pk}/stats/"
+        params = {"from": "2025-09-01", "to": "2025-09-11"}
+        self.assertEqual(self.client.get(url, params).status_code, 403)
+        api = APIClient()
+        api.force_authenticate(get_user_model().objects.create(username="guest"))
+        self.assertEqual(api.get(url, params).status_code, 403)
+
+        api.force_authenticate(
+            get_user_model().objects.create(username="staff", is_staff=True)
+        )
+        with self.assertNumQueries(4):
+            res = api.get(url, params)
+        self.assertEqual(res.status_code, 200)
+
+        body = res.json()
+        self.assertEqual(body["days"], 10)
+        first = body["listings"][0]
+        self.assertEqual(first["booked_nights"], 3)
+        self.assertEqual(first["occupancy_rate"], 0.3)
+        self.assertEqual(first["adr"], 33.33)
+        self.assertEqual(body["totals"]["occupancy_rate"], 0.15)
+        self.assertEqual(len(body["daily"]), 3)
+
+        bad = api.get(url, {"from": "2025-09-11", "to": "2025-09-01"})
+        self.assertEqual(bad.status_code, 400)
+
+    def test_incremental_refresh_only_touches_changed_rows(self):
+        self.assertEqual(refresh_stats()["listings"], 2)
+        self.assertEqual(refresh_stats()["listings"], 0)
+
+        make_booking(self.other, self.host, date(2025, 9, 10), date(2025, 9, 12))
+        self.assertEqual(refresh_stats(), {"listings": 1, "rows": 2})
+        self.assertEqual(len(self.stored()), 3)
+
+    def test_moved_and_deleted_bookings_clear_old_nights(self):
+        refresh_stats()
+
+        self.booking.start_date = date(2025, 9, 20)
+        self.booking.end_date = date(2025, 9, 21)
+        self.booking.save()
+        refresh_stats()
+        self.assertEqual([day.day for day, *_ in self.stored()], [20])
+
+        self.booking.delete()
+        refresh_stats()
+        self.assertEqual(self.stored(), [])
+
+    def test_check_detects_drift_and_rebuild_fixes_it(self):
+        refresh_stats()
+        listings = [self.listing.pk, self.other.pk]
+        start, end = date(2025, 8, 1), date(2025, 10, 1)
+        self.assertEqual(check_stats(listings, start, end), [])
+
+        ListingDailyStats.objects.filter(date=date(2025, 9, 2)).update(revenue=1)
+        self.assertEqual(len(check_stats(listings, start, end)), 1)
+        options = {"start": start, "end": end, "stdout": StringIO()}
+        with self.assertRaises(CommandError):
+            call_command("check_stats", **options)
+
+        call_command("rebuild_stats", stdout=StringIO())
+        call_command("check_stats", **options)
+
+
+@override_settings(LISTINGS_CACHE_ENABLED=False)
+class ConditionalRequestTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create()
+        self.listing = make_listing(self.user)
+        self.booking = make_booking(
+            self.listing, self.user, date(2025, 8, 1), date(2025, 8, 3)
+        )
+
+    def test_unchanged_list_is_not_modified_after_one_query(self):
+        # A plain GET reads its ETag off the page it serves
+        with self.assertNumQueries(1):
+            etag = self.client.get("/api/listings/")["ETag"]
+
+        with mock.patch.object(
+            ListingViewSet, "values_list_response"
+        ) as render, self.assertNumQueries(1):
+            res = self.client.get("/api/listings/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.content, b"")
+        render.assert_not_called()
+
+        # Without updated_at in the page, the ETag is looked up
+        res = self.client.get("/api/listings/", {"fields": "listing_id,name"})
+        res = self.client.get(
+            "/api/listings/",
+            {"fields": "listing_id,name"},
+            HTTP_IF_NONE_MATCH=res["ETag"],
+        )
+        self.assertEqual(res.status_code, 304)
+
+        # Different filters are a different representation
+        res = self.client.get(
+            "/api/listings/", {"min_rating": 1}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(res.status_code, 200)
+
+        make_listing(self.user, name="Beachfront Villa in Mombasa")
+        res = self.client.get("/api/listings/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res["ETag"], etag)
+
+    def test_availability_etag_follows_bookings(self):
+        other = make_listing(self.user, name="Beachfront Villa in Mombasa")
+        params = {"check_in": "2025-08-01", "check_out": "2025-08-02"}
+        etag = self.client.get("/api/listings/", params)["ETag"]
+
+        # Same number of bookings and listings, other nights taken
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.filter(pk=self.booking.pk).update(status="canceled")
+            make_booking(other, self.user, date(2025, 8, 1), date(2025, 8, 3))
+        res = self.client.get("/api/listings/", params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [item["listing_id"] for item in res.json()["results"]],
+            [str(self.listing.pk)],
+        )
+
+    def test_list_etag_changes_on_delete_and_review(self):
+        etag = self.client.get("/api/booking/")["ETag"]
+        self.booking.delete()
+        self.assertNotEqual(self.client.get("/api/booking/")["ETag"], etag)
+
+        etag = self.client.get(f"/api/listings/{self.listing.pk}/")["ETag"]
+        Review.objects.create(listing=self.listing, user=self.user, rating=5)
+        res = self.client.get(
+            f"/api/listings/{self.listing.pk}/", HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(res.status_code, 200)
+
+    def test_detail_if_modified_since(self):
+        url = f"/api/booking/{self.booking.pk}/"
+        last_modified = self.client.get(url)["Last-Modified"]
+
+        with self.assertNumQueries(1):
+            res = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(res.status_code, 304)
+
+        self.assertEqual(self.client.get("/api/booking/not-a-uuid/").status_code, 404)
+
+    def test_if_match_guards_updates(self):
+        url = f"/api/listings/{self.listing.pk}/"
+        etag = self.client.get(url)["ETag"]
+
+        res = self.client.patch(
+            url,
+            {"name": "Renamed"},
+            content_type="application/json",
+            HTTP_IF_MATCH=etag,
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res["ETag"], etag)
+
+        # A second writer holding the old ETag loses
+        res = self.client.patch(
+            url, {"name": "Stale"}, content_type="application/json", HTTP_IF_MATCH=etag
+        )
+        self.assertEqual(res.status_code, 412)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.name, "Renamed")
+
+        res = self.client.delete(url, HTTP_IF_MATCH=make_etag("detail", "stale"))
+        self.assertEqual(res.status_code, 412)
+        self.assertTrue(Listing.objects.filter(pk=self.listing.pk).exists())
+
+    def test_if_none_match_star_rejects_update_of_existing(self):
+        res = self.client.patch(
+            f"/api/booking/{self.booking.pk}/",
+            {"status": "canceled"},
+            content_type="application/json",
+            HTTP_IF_NONE_MATCH="*",
+        )
+        self.assertEqual(res.status_code, 412)
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create()
+        self.listing = make_listing(self.user)
+        Review.objects.create(listing=self.listing, user=self.user, rating=4)
+        make_booking(self.listing, self.user, date(2025, 8, 1), date(2025, 8, 3))
+
+    def test_values_path_matches_model_serialization(self):
+        for path in ("/api/listings/", "/api/booking/"):
+            with override_settings(API_VALUES_LIST=False):
+                expected = self.client.get(path).json()
+            cache.clear()
+            with override_settings(API_VALUES_LIST=True):
+                actual = self.client.get(path).json()
+            self.assertEqual(actual, expected)
+
+    def test_fields_narrow_output_and_sql(self):
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get("/api/listings/", {"fields": "listing_id,name"})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(set(res.json()["results"][0]), {"listing_id", "name"})
+        select = [q["sql"] for q in queries if "description" in q["sql"]]
+        self.assertEqual(select, [])
+
+        with override_settings(API_VALUES_LIST=False):
+            res = self.client.get("/api/booking/", {"exclude": "total_price,status"})
+        item = res.json()["results"][0]
+        self.assertNotIn("total_price", item)
+        self.assertIn("start_date", item)
+
+    def test_unknown_field_is_rejected(self):
+        res = self.client.get("/api/listings/", {"fields": "name,secret"})
+        self.assertEqual(res.status_code, 400)
+        self.assertIn("secret", res.json()["fields"])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        user = User.objects.create()
+        listing = make_listing(user)
+        self.bookings = [
+            make_booking(listing, user, date(2025, 8, d), date(2025, 8, d + 1))
+            for d in range(1, 6)
+        ]
+        Booking.objects.filter(pk=self.bookings[0].pk).update(
+            created_at=timezone.make_aware(timezone.datetime(2025, 1, 1)),
+            status="canceled",
+        )
+        make_payment(self.bookings[1], status="completed")
+
+        self.staff = get_user_model().objects.create(username="staff", is_staff=True)
+        self.api = APIClient()
+        self.api.force_authenticate(self.staff)
+
+    def read(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_ndjson_export_applies_filters(self):
+        res = self.api.get("/api/exports/bookings.ndjson")
+        self.assertEqual(res["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in self.read(res).splitlines()]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]["booking_id"], str(self.bookings[0].pk))
+        self.assertEqual(rows[0]["total_price"], "100.00")
+
+        res = self.api.get(
+            "/api/exports/bookings.ndjson",
+            {"from": date.today().isoformat(), "status": "confirmed"},
+        )
+        self.assertEqual(len(self.read(res).splitlines()), 4)
+
+        res = self.api.get("/api/exports/payments.ndjson", {"status": "completed"})
+        (row,) = [json.loads(line) for line in self.read(res).splitlines()]
+        self.assertEqual(row["booking_id"], str(self.bookings[1].pk))
+
+    def test_gzip_csv_matches_plain_csv(self):
+        plain = self.read(self.api.get("/api/exports/bookings.csv"))
+        res = self.api.get("/api/exports/bookings.csv", {"gzip": "1"})
+        self.assertEqual(res["Content-Type"], "application/gzip")
+        self.assertIn("bookings.csv.gz", res["Content-Disposition"])
+        self.assertEqual(gzip.decompress(self.read(res)), plain)
+
+        header, *rows = list(csv.reader(plain.decode().splitlines()))
+        self.assertEqual(header[0], "booking_id")
+        self.assertEqual(len(rows), 5)
+
+    def test_export_rejects_bad_requests(self):
+        self.assertEqual(
+            self.api.get("/api/exports/bookings.csv", {"status": "lost"}).status_code,
+            400,
+        )
+        self.api.force_authenticate(get_user_model().objects.create(username="guest"))
+        self.assertEqual(self.api.get("/api/exports/bookings.csv").status_code, 403)
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_export_command_writes_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bookings.ndjson.gz")
+            call_command(
+                "export", "bookings", "--gzip", "--output", path, stdout=StringIO()
+            )
+            with gzip.open(path, "rt") as f:
+                self.assertEqual(len(f.readlines()), 5)
+
+        with self.assertRaises(CommandError):
+            call_command("export", "payments", "--status", "lost", stdout=StringIO())
+
+
+class ListingImportTests(TestCase):
+    def setUp(self):
+        self.host = User.objects.create()
+        self.existing = make_listing(self.host, external_id="A-1", price_per_night=10)
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media = override_settings(MEDIA_ROOT=self.media.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.staff = get_user_model().objects.create(username="staff", is_staff=True)
+        self.api = APIClient()
+        self.api.force_authenticate(self.staff)
+
+    def ndjson(self, *rows):
+        return "\n".join(
+            row if isinstance(row, str) else json.dumps(row) for row in rows
+        ).encode()
+
+    def row(self, external_id, **kwargs):
+        data = {
+            "external_id": external_id,
+            "name": f"Listing {external_id}",
+            "description": "Imported.",
+            "location": "Nairobi, Kenya",
+            "price_per_night": "80.00",
+        }
+        data.update(kwargs)
+        return data
+
+    def test_upserts_in_chunks_and_reports_bad_rows(self):
+        data = self.ndjson(
+            self.row("A-1", price_per_night="99.00"),
+            self.row("A-2"),
+            self.row("A-3", price_per_night="cheap"),
+            "{not json",
+            self.row("A-4", max_guests=4),
+            self.row("A-2", name="Renamed"),
+        )
+        report = StringIO()
+        progress = []
+        counts = import_listings(
+            io.BytesIO(data),
+            "ndjson",
+            self.host.pk,
+            report,
+            chunk_size=2,
+            progress=lambda c: progress.append(dict(c)),
+        )
+
+        self.assertEqual(counts, {"rows": 6, "created": 2, "updated": 2, "failed": 2})
+        self.assertEqual([c["rows"] for c in progress], [2, 4, 6])
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.price_per_night, 99)
+        self.assertEqual(
+            Listing.objects.get(host=self.host, external_id="A-2").name, "Renamed"
+        )
+        self.assertEqual(Listing.objects.filter(host=self.host).count(), 3)
+
+        errors = [json.loads(line) for line in report.getvalue().splitlines()]
+        self.assertEqual([e["line"] for e in errors], [3, 4])
+        self.assertIn("price_per_night", errors[0]["errors"])
+        self.assertEqual(
+            [pk for pk, _ in search("renamed")],
+            [Listing.objects.get(external_id="A-2").pk],
+        )
+
+    def test_csv_upload_endpoint_and_report(self):
+        data = (
+            "external_id,name,description,location,price_per_night,max_guests\n"
+            "B-1,Garden Cottage,Quiet.,Naivasha,60,\n"
+            "B-2,,Missing name.,Naivasha,60,2\n"
+        ).encode()
+        res = self.api.post(
+            "/api/listing-imports/",
+            {
+                "file": SimpleUploadedFile("listings.csv", data),
+                "host": str(self.host.pk),
+            },
+            format="multipart",
+        )
+        self.assertEqual(res.status_code, 201)
+        job = res.json()
+        self.assertEqual(job["status"], "done")
+        self.assertEqual((job["created"], job["failed"]), (1, 1))
+        self.assertEqual(Listing.objects.get(external_id="B-1").max_guests, 1)
+
+        res = self.api.get(f"/api/listing-imports/{job['import_id']}/errors/")
+        (error,) = [json.loads(l) for l in b"".join(res.streaming_content).splitlines()]
+        self.assertEqual((error["line"], error["external_id"]), (3, "B-2"))
+
+    def test_rows_only_update_the_columns_they_give(self):
+        Listing.objects.filter(pk=self.existing.pk).update(max_guests=3)
+        data = self.ndjson(self.row("A-1"), self.row("A-2", max_guests=4))
+        import_listings(io.BytesIO(data), "ndjson", self.host.pk, StringIO())
+
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.max_guests, 3)
+        self.assertEqual(Listing.objects.get(external_id="A-2").max_guests, 4)
+
+    def test_upsert_names_a_conflict_target_only_where_supported(self):
+        data = self.ndjson(self.row("A-1"))
+        for supported in (True, False):
+            with mock.patch.object(
+                connection.features,
+                "supports_update_conflicts_with_target",
+                supported,
+            ), mock.patch.object(Listing.objects, "bulk_create") as bulk_create:
+                import_listings(io.BytesIO(data), "ndjson", self.host.pk, StringIO())
+            self.assertEqual("unique_fields" in bulk_create.call_args.kwargs, supported)
+
+    def test_database_errors_fail_the_job(self):
+        path = os.path.join(self.media.name, "imports", "x.ndjson")
+        os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(self.ndjson(self.row("D-1")))
+        job = ListingImport.objects.create(
+            host=self.host, format="ndjson", source="imports/x.ndjson"
+        )
+        with mock.patch.object(
+            Listing.objects, "bulk_create", side_effect=DatabaseError("boom")
+        ):
+            with self.assertRaises(DatabaseError):
+                run_import(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ("failed", "boom"))
+
+    @mock.patch("listings.views.import_listings_file.delay")
+    def test_async_upload_and_command(self, delay):
+        res = self.api.post(
+            "/api/listing-imports/",
+            {
+                "file": SimpleUploadedFile("x.ndjson", self.ndjson(self.row("C-1"))),
+                "host": str(self.host.pk),
+                "async": "true",
+            },
+            format="multipart",
+        )
+        self.assertEqual(res.status_code, 202)
+        delay.assert_called_once_with(res.json()["import_id"])
+        run_import(res.json()["import_id"])
+        job = self.api.get(f"/api/listing-imports/{res.json()['import_id']}/").json()
+        self.assertEqual((job["status"], job["created"]), ("done", 1))
+
+        path = os.path.join(self.media.name, "more.ndjson")
+        with open(path, "wb") as f:
+            f.write(self.ndjson(self.row("C-1", name="Updated"), self.row("C-2")))
+        out = StringIO()
+        call_command("import_listings", path, "--host", str(self.host.pk), stdout=out)
+        self.assertIn("1 created, 1 updated, 0 failed", out.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command("import_listings", path, "--host", str(uuid4()))
+
+
+class GeoSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        host = User.objects.create()
+        self.nairobi = make_listing(host, latitude=-1.2921, longitude=36.8219)
+        self.westlands = make_listing(host, latitude=-1.2676, longitude=36.8108)
+        self.naivasha = make_listing(host, latitude=-0.7172, longitude=36.4310)
+        self.mombasa = make_listing(host, latitude=-4.0435, longitude=39.6682)
+        self.east = make_listing(host, latitude=-17.8, longitude=179.9)
+        self.west = make_listing(host, latitude=-17.7, longitude=-179.9)
+        make_listing(host, name="Somewhere in Kenya")
+
+    def ids(self, params):
+        res = self.client.get("/api/listings/", params)
+        self.assertEqual(res.status_code, 200, res.content)
+        return {item["listing_id"] for item in res.json()["results"]}
+
+    def test_geohash_and_covering_cells(self):
+        self.assertEqual(encode(57.64911, 10.40744, 11), "u4pruydqqvj")
+        self.assertEqual(self.nairobi.geohash, encode(-1.2921, 36.8219))
+        self.assertEqual(self.nairobi.geohash[:4], "kzf0")
+
+        cells = covering_cells([(-1.4, 36.7, -1.2, 36.9)], max_cells=8)
+        self.assertLessEqual(len(cells), 8)
+        self.assertTrue(any(self.nairobi.geohash.startswith(c) for c in cells))
+        (distance,) = haversine_km(-1.2921, 36.8219, [-4.0435], [39.6682])
+        self.assertAlmostEqual(distance, 440, delta=2)
+
+    def test_near_filters_by_distance(self):
+        # Candidates in the covering cells, then the page
+        with self.assertNumQueries(2):
+            ids = self.ids({"near": "-1.2921,36.8219", "radius_km": 10})
+        self.assertEqual(ids, {str(self.nairobi.pk), str(self.westlands.pk)})
+
+        ids = self.ids({"near": "-1.2921,36.8219", "radius_km": 100})
+        self.assertIn(str(self.naivasha.pk), ids)
+        self.assertNotIn(str(self.mombasa.pk), ids)
+
+        ids = self.ids({"near": "-17.75,180", "radius_km": 20})
+        self.assertEqual(ids, {str(self.east.pk), str(self.west.pk)})
+
+    def test_radius_search_stops_past_the_match_cap(self):
+        with mock.patch.object(geo, "CHUNK_SIZE", 1), mock.patch.object(
+            geo, "haversine_km", wraps=haversine_km
+        ) as measure:
+            with self.assertRaises(TooManyMatches):
+                within_radius(
+                    Listing.objects.all(), -1.2921, 36.8219, 100, max_matches=1
+                )
+        # Three candidates in range; the third is never read
+        self.assertEqual(measure.call_count, 2)
+
+        with override_settings(GEO_MAX_MATCHES=2):
+            res = self.client.get(
+                "/api/listings/", {"near": "-1.2921,36.8219", "radius_km": 100}
+            )
+        self.assertEqual(res.status_code, 400)
+        self.assertIn("radius_km", res.json())
+
+    def test_bbox_filters_and_crosses_antimeridian(self):
+        ids = self.ids({"bbox": "-1.3,36.8,-1.26,36.83"})
+        self.assertEqual(ids, {str(self.nairobi.pk), str(self.westlands.pk)})
+
+        ids = self.ids({"bbox": "-18,179,-17,-179"})
+        self.assertEqual(ids, {str(self.east.pk), str(self.west.pk)})
+
+        listing = Listing.objects.get(pk=self.mombasa.pk)
+        listing.latitude, listing.longitude = -1.29, 36.82
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.save()
+        ids = self.ids({"bbox": "-1.3,36.8,-1.26,36.83"})
+        self.assertIn(str(self.mombasa.pk), ids)
+
+    def test_rejects_bad_parameters(self):
+        for params in (
+            {"near": "-1.29,36.82"},
+            {"near": "-1.29", "radius_km": 5},
+            {"near": "-91,36.82", "radius_km": 5},
+            {"near": "-1.29,36.82", "radius_km": 5000},
+            {"bbox": "1,2,3"},
+            {"bbox": "-1,36,-2,37"},
+        ):
+            res = self.client.get("/api/listings/", params)
+            self.assertEqual(res.status_code, 400, params)
+
+        res = self.client.post(
+            "/api/listings/",
+            {
+                "name": "Half located",
+                "description": "x",
+                "location": "x",
+                "price_per_night": 10,
+                "latitude": 1,
+            },
+        )
+        self.assertEqual(res.status_code, 400)
+        self.assertIn("latitude and longitude", res.content.decode())
+
+
+class TaskRoutingTests(SimpleTestCase):
+    def test_routes_name_tasks_and_declared_queues(self):
+        for name, route in settings.CELERY_TASK_ROUTES.items():
+            module, _, task = name.rpartition(".")
+            self.assertEqual(module, "listings.tasks")
+            self.assertTrue(hasattr(tasks, task), name)
+        queues = {queue.name for queue in settings.CELERY_TASK_QUEUES}
+        routed = {route["queue"] for route in settings.CELERY_TASK_ROUTES.values()}
+        self.assertLessEqual(routed | {settings.CELERY_TASK_DEFAULT_QUEUE}, queues)
+
+    def test_payment_work_is_kept_off_the_email_queue(self):
+        payment = "listings.tasks.send_payment_checkout_mail"
+        email = "listings.tasks.send_booking_confirmation"
+        topology = task_topology([payment, email, "listings.tasks.relay_outbox"])
+
+        self.assertEqual(topology[payment][0], "payments")
+        self.assertEqual(topology[email][0], "email")
+        self.assertIsNone(topology[payment][2])
+        self.assertEqual(topology["listings.tasks.relay_outbox"][0], "payments")
+        self.assertEqual(topology[email][2], 200.0)
+
+    def test_broker_stand_in_serves_priorities_first(self):
+        broker = MemoryBroker()
+        for priority, name in [(2, "low"), (9, "high"), (5, "mid"), (9, "high2")]:
+            broker.publish("payments", priority, name)
+        broker.publish("email", 7, "mail")
+
+        self.assertEqual(broker.fetch(["payments"], 2, 0), ["high", "high2"])
+        self.assertEqual(
+            broker.fetch(["payments", "email"], 10, 0), ["mid", "mail", "low"]
+        )
+        self.assertEqual(broker.fetch(["email"], 1, 0), [])
@@ -1,8 +1,55 @@
+from django.urls import path, re_path
 from rest_framework.routers import DefaultRouter
-from .views import ListingViewSet, BookingViewSet
+from . import async_views
+from .views import (
+    BookingViewSet,
+    ChapaMetricsView,
+    ExportView,
+    HostStatsView,
+    ListingImportViewSet,
+    ListingViewSet,
+    PaymentCompleteView,
+    PaymentViewSet,
+    chapa_webhook,
+)
 
 router = DefaultRouter()
 router.register(r"listings", ListingViewSet)
+router.register(r"listing-imports", ListingImportViewSet)
 router.register(r"booking", BookingViewSet)
+router.register(r"payments", PaymentViewSet)
 
-urlpatterns = router.urls
+urlpatterns = router.urls + [
+    path(
+        "payments/<uuid:payment_id>/complete/",
+        PaymentCompleteView.as_view(),
+        name="payment-complete",
+    ),
+    path(
+        "async/payments/<uuid:pk>/verify/",
+        async_views.verify_payment,
+        name="async-payment-verify",
+    ),
+    path(
+        "async/payments/<uuid:pk>/initialize/",
+        async_views.initialize_payment,
+        name="async-payment-initialize",
+    ),
+    path(
+        "async/payments/<uuid:payment_id>/complete/",
+        async_views.complete_payment,
+        name="async-payment-complete",
+    ),
+    path(
+        "hosts/<uuid:host_id>/stats/",
+        HostStatsView.as_view(),
+        name="host-stats",
+    ),
+    re_path(
+        r"^exports/(?P<kind>bookings|payments)\.(?P<fmt>ndjson|csv)$",
+        ExportView.as_view(),
+        name="export",
+    ),
+    path("chapa/metrics/", ChapaMetricsView.as_view(), name="chapa-metrics"),
+    path("chapa-webhook/", chapa_webhook, name="chapa-webhook"),
+]
@@ -1,43 +1,451 @@
+from datetime import date, timedelta
+from uuid import UUID
+
 from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
+from rest_framework import mixins
 from rest_framework import viewsets
 from rest_framework import permissions
 from rest_framework import status
 from rest_framework import views
+from rest_framework.filters import OrderingFilter
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-import requests
 
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
 
-from .models import Listing, Booking, Payment
-from .serializers import ListingSerializer, BookingSerializer, PaymentSerializer
-from .tasks import send_booking_confirmation
+from .bulk import CREATED, create_bookings
+from .caching import cached_response, detail_key, list_key
+from .chapa import ChapaUnavailable, get_client
+from .conditional import ConditionalMixin
+from .exports import CONTENT_TYPES, EXPORTS, export_filename, stream_export
+from .fieldsets import SparseFieldsMixin
+from .geo import TooManyMatches, within_radius
+from .idempotency import idempotent
+from .imports import FORMATS as IMPORT_FORMATS, create_import, detect_format, run_import
+from .filters import (
+    filter_available,
+    filter_bbox,
+    filter_rating,
+    parse_date_param,
+    parse_int_param,
+    parse_near_params,
+    parse_uuid_list_param,
+)
+from .middleware import query_budget
+from .models import Listing, ListingImport, Booking, Payment, User
+from .outbox import enqueue
+from .pagination import CreatedAtCursorPagination
+from .pricing import quote_listings, quote_stay
+from .reservations import reserve
+from .rollups import host_stats
+from .search import search_listings
+from .serializers import (
+    BookingSerializer,
+    BulkBookingItemSerializer,
+    ListingImportJobSerializer,
+    ListingSerializer,
+    PaymentSerializer,
+    QuoteSerializer,
+)
+from .tasks import (
+    import_listings_file,
+    send_booking_confirmation,
+    send_payment_checkout_mail,
+)
+from .webhooks import record_event, verify_signature
+
+# Fields whose change re-prices a booking
+STAY_FIELDS = {"listing", "start_date", "end_date"}
 
 
 # Create your views here.
-class ListingViewSet(viewsets.ModelViewSet):
+class ListingViewSet(ConditionalMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Listing.objects.all()
     serializer_class = ListingSerializer
+    pagination_class = CreatedAtCursorPagination
+    query_budget = {
+        # The page, plus the candidates of a ?near= search; a row served
+        # without updated_at (?fields=) looks its validators up
+        "list": 2,
+        "retrieve": 2,
+        "search": 25,
+        "quote": 3,
+        "default": 16,
+    }
+    filter_backends = [OrderingFilter]
+    ordering_fields = ["created_at", "price_per_night", "rating_avg", "rating_count"]
+    ordering = CreatedAtCursorPagination.ordering
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == "list":
+            queryset = filter_available(queryset, self.request.query_params)
+            queryset = filter_rating(queryset, self.request.query_params)
+            queryset = filter_bbox(queryset, self.request.query_params)
+            nearby = self.nearby_ids()
+            if nearby is not None:
+                queryset = queryset.filter(pk__in=nearby)
+        return queryset
+
+    def nearby_ids(self):
+        """Ids of the listings within ?radius_km= of ?near=, found once per
+        request"""
+        if not hasattr(self, "_nearby_ids"):
+            self._nearby_ids = None
+            near = parse_near_params(self.request.query_params)
+            if near is not None:
+                try:
+                    distances = within_radius(
+                        Listing.objects.all(),
+                        *near,
+                        max_matches=settings.GEO_MAX_MATCHES,
+                    )
+                except TooManyMatches:
+                    raise ValidationError(
+                        {"radius_km": "Too many listings in range, narrow the search."}
+                    )
+                self._nearby_ids = list(distances)
+        return self._nearby_ids
+
+    @swagger_auto_schema(
+        operation_description="List listings, optionally only those available",
+        manual_parameters=[
+            openapi.Parameter(
+                "check_in",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                format=openapi.FORMAT_DATE,
+                description="Arrival date (YYYY-MM-DD)",
+            ),
+            openapi.Parameter(
+                "check_out",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                format=openapi.FORMAT_DATE,
+                description="Departure date (YYYY-MM-DD)",
+            ),
+            openapi.Parameter(
+                "guests",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                description="Number of guests",
+            ),
+            openapi.Parameter(
+                "min_rating",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_NUMBER,
+                description="Minimum average review rating (0-5)",
+            ),
+            openapi.Parameter(
+                "near",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="Center of a radius search (lat,lng)",
+            ),
+            openapi.Parameter(
+                "radius_km",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_NUMBER,
+                description="Radius around near, in km",
+            ),
+            openapi.Parameter(
+                "bbox",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="Bounding box (south,west,north,east)",
+            ),
+        ],
+    )
+    def list(self, request, *args, **kwargs):
+        return self.conditional_list(
+            request,
+            lambda: cached_response(
+                list_key(request),
+                lambda: self.values_list_response(
+                    request, lambda: super(ListingViewSet, self).list(request)
+                ),
+            ),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_retrieve(
+            request,
+            lambda: cached_response(
+                detail_key(request, kwargs[self.lookup_field]),
+                lambda: super(ListingViewSet, self).retrieve(request, *args, **kwargs),
+            ),
+        )
+
+    @swagger_auto_schema(
+        operation_description="Full-text search over name, location and description",
+        manual_parameters=[
+            openapi.Parameter(
+                "q",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                required=True,
+                description="Search text, the last word is prefix matched",
+            ),
+            openapi.Parameter(
+                "limit",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                description="Maximum number of results (default 20, max 100)",
+            ),
+        ],
+    )
+    @action(detail=False, methods=["GET"])
+    def search(self, request):
+        """Ranked listing search backed by the inverted index"""
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            return Response(
+                {"q": "This query parameter is required."},
+                status.HTTP_400_BAD_REQUEST,
+            )
+
+        limit = parse_int_param(request.query_params, "limit", min_value=1) or 20
+        listings = search_listings(query, limit=min(limit, 100))
+
+        data = self.get_serializer(listings, many=True).data
+        for item, listing in zip(data, listings):
+            item["score"] = round(listing.search_score, 4)
+        return Response({"results": data})
 
+    @swagger_auto_schema(
+        operation_description="Price one stay at many listings",
+        manual_parameters=[
+            openapi.Parameter(
+                "check_in",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                format=openapi.FORMAT_DATE,
+                required=True,
+                description="Arrival date (YYYY-MM-DD)",
+            ),
+            openapi.Parameter(
+                "check_out",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                format=openapi.FORMAT_DATE,
+                required=True,
+                description="Departure date (YYYY-MM-DD)",
+            ),
+            openapi.Parameter(
+                "listings",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                required=True,
+                description="Comma-separated listing ids",
+            ),
+        ],
+        responses={200: QuoteSerializer(many=True)},
+    )
+    @action(detail=False, methods=["GET"])
+    def quote(self, request):
+        """Total price of the same stay at each requested listing"""
+        params = request.query_params
+        check_in = parse_date_param(params, "check_in")
+        check_out = parse_date_param(params, "check_out")
+        if check_in is None or check_out is None:
+            raise ValidationError("check_in and check_out are required.")
+        if check_out <= check_in:
+            raise ValidationError({"check_out": "Must be after check_in."})
+
+        listing_ids = parse_uuid_list_param(
+            params, "listings", max_items=settings.QUOTE_MAX_LISTINGS
+        )
+        if not listing_ids:
+            raise ValidationError({"listings": "At least one listing id is required."})
+
+        quotes = quote_listings(listing_ids, check_in, check_out)
+        return Response({"results": QuoteSerializer(quotes, many=True).data})
+
+
+class ListingImportViewSet(
+    mixins.CreateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet
+):
+    """Bulk listing imports from CSV or NDJSON, upserted on external_id"""
+
+    queryset = ListingImport.objects.all()
+    serializer_class = ListingImportJobSerializer
+    permission_classes = [permissions.IsAdminUser]
+    # A synchronous import runs a handful of queries per chunk of rows
+    query_budget = {"create": None, "default": 3}
 
-class BookingViewSet(viewsets.ModelViewSet):
+    @swagger_auto_schema(
+        operation_description=(
+            "Upload a CSV or NDJSON file of one host's listings. Runs in the "
+            "request unless async=true, which queues a Celery job instead."
+        ),
+        manual_parameters=[
+            openapi.Parameter("file", openapi.IN_FORM, type=openapi.TYPE_FILE),
+            openapi.Parameter("host", openapi.IN_FORM, type=openapi.TYPE_STRING),
+            openapi.Parameter(
+                "format",
+                openapi.IN_FORM,
+                type=openapi.TYPE_STRING,
+                description="csv or ndjson, default from the file name",
+            ),
+            openapi.Parameter("async", openapi.IN_FORM, type=openapi.TYPE_BOOLEAN),
+        ],
+    )
+    def create(self, request, *args, **kwargs):
+        upload = request.FILES.get("file")
+        if upload is None:
+            raise ValidationError({"file": "This field is required."})
+        fmt = request.data.get("format") or detect_format(upload.name)
+        if fmt not in IMPORT_FORMATS:
+            raise ValidationError({"format": "Expected csv or ndjson."})
+        try:
+            host_id = UUID(request.data.get("host") or "")
+        except ValueError:
+            raise ValidationError({"host": "Expected the host's user id."})
+        host = get_object_or_404(User, pk=host_id)
+
+        job = create_import(host.pk, upload, fmt)
+        if request.data.get("async") in ("1", "true"):
+            import_listings_file.delay(str(job.pk))
+            code = status.HTTP_202_ACCEPTED
+        else:
+            run_import(job.pk)
+            job.refresh_from_db()
+            code = status.HTTP_201_CREATED
+        return Response(self.get_serializer(job).data, status=code)
+
+    @action(detail=True, methods=["get"])
+    def errors(self, request, pk=None):
+        """The per-row error report as NDJSON"""
+        job = self.get_object()
+        if not job.report:
+            raise Http404
+        return FileResponse(
+            default_storage.open(job.report, "rb"),
+            content_type="application/x-ndjson",
+            as_attachment=True,
+            filename=f"{job.pk}-errors.ndjson",
+        )
+
+
+class BookingViewSet(ConditionalMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Booking.objects.all()
     serializer_class = BookingSerializer
+    pagination_class = CreatedAtCursorPagination
+    # Writes include the listing lock and overlap check of listings.reservations,
+    # and creates up to 5 queries of Idempotency-Key bookkeeping
+    query_budget = {"list": 1, "retrieve": 2, "bulk": 11, "create": 21, "default": 16}
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_list(
+            request,
+            lambda: self.values_list_response(
+                request,
+                lambda: super(BookingViewSet, self).list(request, *args, **kwargs),
+            ),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_retrieve(
+            request,
+            lambda: super(BookingViewSet, self).retrieve(request, *args, **kwargs),
+        )
+
+    def _save(self, serializer):
+        """Prices the stay on the server and saves it if its nights are free"""
+        data, instance = serializer.validated_data, serializer.instance
+        listing = data.get("listing") or instance.listing
+        start_date = data.get("start_date") or instance.start_date
+        end_date = data.get("end_date") or instance.end_date
+
+        def save():
+            if instance is not None and not data.keys() & STAY_FIELDS:
+                # The stay is unchanged, so it keeps the price it was booked at
+                return serializer.save()
+            return serializer.save(
+                total_price=quote_stay(listing.pk, start_date, end_date)
+            )
+
+        # Only pending and confirmed bookings hold their nights
+        booking_status = data.get("status") or instance.status
+        if booking_status not in Booking.ACTIVE_STATUSES:
+            return save()
+        return reserve(
+            listing.pk,
+            start_date,
+            end_date,
+            save,
+            exclude=instance.pk if instance is not None else None,
+        )
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
-        booking = serializer.save()
-        send_booking_confirmation.delay(booking.user.email, booking.booking_id)
+        with transaction.atomic():
+            booking = self._save(serializer)
+            if booking.user.email:
+                enqueue(
+                    send_booking_confirmation, booking.user.email, booking.booking_id
+                )
+
+    def perform_update(self, serializer):
+        self._save(serializer)
+
+    @swagger_auto_schema(
+        operation_description="Create many bookings in one transaction",
+        request_body=BulkBookingItemSerializer(many=True),
+        responses={200: "Per-item result: created, conflict or invalid"},
+    )
+    @action(detail=False, methods=["POST"])
+    def bulk(self, request):
+        """Create a batch of bookings, reporting the outcome of each item"""
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response(
+                {"err": "Expected a non-empty list of bookings"},
+                status.HTTP_400_BAD_REQUEST,
+            )
+        if len(items) > settings.BOOKING_BULK_MAX_ITEMS:
+            return Response(
+                {
+                    "err": f"At most {settings.BOOKING_BULK_MAX_ITEMS} bookings per request"
+                },
+                status.HTTP_400_BAD_REQUEST,
+            )
+
+        results, _ = create_bookings(items)
+        created = sum(1 for result in results if result["status"] == CREATED)
+        return Response(
+            {"created": created, "failed": len(results) - created, "results": results}
+        )
 
 
 class PaymentViewSet(viewsets.ModelViewSet):
     """This is viewset for managing payments"""
 
-    queryset = Payment.objects.all()
+    queryset = Payment.objects.with_booking()
     serializer_class = PaymentSerializer
+    pagination_class = CreatedAtCursorPagination
+    # Creates include up to 5 queries of Idempotency-Key bookkeeping
+    query_budget = {
+        "list": 1,
+        "retrieve": 1,
+        "verify": 3,
+        "initialize": 11,
+        "create": 8,
+        "default": 3,
+    }
     permission_classes = [permissions.IsAuthenticated]
 
     def get_query(self):
@@ -46,8 +454,8 @@ class PaymentViewSet(viewsets.ModelViewSet):
 
         user = self.request.user
         if user.is_staff:
-            return Payment.objects.all()
-        return Payment.objects.filter(booking_user=user)
+            return Payment.objects.with_booking()
+        return Payment.objects.with_booking().filter(booking_user=user)
 
     @swagger_auto_schema(
         operation_description="Verify payment status with Chapa",
@@ -63,17 +471,8 @@ class PaymentViewSet(viewsets.ModelViewSet):
         payment = self.get_object()
 
         try:
-            # Set header with chapa secret key
-            headers = {
-                "Authorization": f"Bearer {settings.CHAPA_SECRET_KEY}",
-                "Content-Type": "application/json",
-            }
-
             # Make Verification Request to Chapa
-            res = requests.get(
-                f"{settings.CHAPA_API_URL}/v1/transaction/verify/{payment.payment_id}",
-                headers=headers,
-            )
+            res = get_client().verify(payment.payment_id)
 
             res_data = res.json()
 
@@ -91,17 +490,19 @@ class PaymentViewSet(viewsets.ModelViewSet):
                 booking.save()
             return Response(PaymentSerializer(payment).data, status.HTTP_201_CREATED)
 
+        except ChapaUnavailable as e:
+            return Response({"err": str(e)}, status.HTTP_503_SERVICE_UNAVAILABLE)
         except Exception as e:
             return Response({"err": str(e)}, status.HTTP_INTERNAL_SERVER_ERROR)
 
     @action(detail=True, methods=["POST"])
+    @idempotent
     def initialize(self, request, pk=None):
         """Initiate Payment for a booking"""
         payment = self.get_object()
         booking = payment.booking
-        user = booking.user
 
-        payment.email = user.email
+        payment.email = request.user.email
         payment.first_name = "Guest"
         payment.last_name = "User"
         payment.payment_title = "Reservation Payment"
@@ -110,24 +511,21 @@ class PaymentViewSet(viewsets.ModelViewSet):
         payment.save()
 
         try:
-            headers = {
-                "Authorization": f"Bearer {settings.CHAPA_SECRET_KEY}",
-                "Content-Type": "application/json",
-            }
-
             # Prepare payload for Chapa API
             payload = {
                 "amount": str(payment.amount),
                 "currency": payment.currency,
-                "email": payment.booking.user,
-                "phone_number": payment.booking.user,
+                "email": payment.email,
+                "first_name": payment.first_name,
+                "last_name": payment.last_name,
+                "tx_ref": str(payment.payment_id),
+                "customization": {
+                    "title": payment.payment_title,
+                    "description": payment.description,
+                },
             }
 
-            response = requests.post(
-                f"{settings.CHAPA_API_URL}/v1/transaction/initialize",
-                json=payload,
-                headers=headers,
-            )
+            response = get_client().initialize(payload)
 
             response_data = response.json()
 
@@ -138,12 +536,18 @@ class PaymentViewSet(viewsets.ModelViewSet):
                     f"CHAPA ERROR: {response_data.get('msg',str(response_data))}"
                 )
 
-            # Update payment with checkout URL and Response
+            # Update payment with checkout URL and Response, and send the
+            # checkout URL to user's email once both are stored
             payment.checkout_url = response_data["data"]["checkout_url"]
             payment.responses = response_data
-            payment.save()
-
-            # Send checkout URL to user's email
+            with transaction.atomic():
+                payment.save()
+                enqueue(
+                    send_payment_checkout_mail,
+                    payment.payment_id,
+                    payment.email,
+                    payment.checkout_url,
+                )
 
             return Response(
                 {
@@ -153,6 +557,8 @@ class PaymentViewSet(viewsets.ModelViewSet):
                 }
             )
 
+        except ChapaUnavailable as e:
+            return Response({"err": str(e)}, status.HTTP_503_SERVICE_UNAVAILABLE)
         except Exception as e:
             return Response({"err": str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -197,6 +603,7 @@ class PaymentViewSet(viewsets.ModelViewSet):
             404: "Not Found - Booking not found",
         },
     )
+    @idempotent
     def create(self, request, *args, **kwargs):
         return super().create(request, *args, **kwargs)
 
@@ -205,13 +612,14 @@ class PaymentCompleteView(views.APIView):
     """Handle payment completion redirect"""
 
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 1
 
     @swagger_auto_schema(
         operation_description="Get payment details after completion",
         responses={200: PaymentSerializer(), 403: "Forbidden", 404: "Not Found"},
     )
     def get(self, request, payment_id):
-        payment = get_object_or_404(Payment, id=payment_id)
+        payment = get_object_or_404(Payment.objects.with_booking(), id=payment_id)
 
         # Verify the payment belongs to the user
         if not request.user.is_staff and payment.booking.user != request.user:
@@ -222,3 +630,132 @@ class PaymentCompleteView(views.APIView):
 
         serializer = PaymentSerializer(payment)
         return Response(serializer.data)
+
+
+class HostStatsView(views.APIView):
+    """Occupancy, ADR and revenue of a host's listings, from daily rollups"""
+
+    permission_classes = [permissions.IsAuthenticated]
+    query_budget = 4
+
+    @swagger_auto_schema(
+        operation_description="Occupancy rate, ADR and revenue per listing",
+        manual_parameters=[
+            openapi.Parameter(
+                "from",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                format=openapi.FORMAT_DATE,
+                description="First night (YYYY-MM-DD), default 30 days ago",
+            ),
+            openapi.Parameter(
+                "to",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                format=openapi.FORMAT_DATE,
+                description="Day after the last night (YYYY-MM-DD), default today",
+            ),
+        ],
+        responses={200: "Stats per listing and in total", 403: "Forbidden"},
+    )
+    def get(self, request, host_id):
+        host = get_object_or_404(User, pk=host_id)
+
+        # Only the host and staff see a host's revenue
+        if not request.user.is_staff and host.pk != request.user.pk:
+            return Response(
+                {"error": "Not authorized to view this host's stats"},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        end = parse_date_param(request.query_params, "to") or date.today()
+        start = parse_date_param(request.query_params, "from") or end - timedelta(
+            days=30
+        )
+        if end <= start:
+            raise ValidationError({"to": "Must be after from."})
+        if (end - start).days > settings.STATS_MAX_RANGE_DAYS:
+            raise ValidationError(
+                f"At most {settings.STATS_MAX_RANGE_DAYS} days can be requested."
+            )
+
+        return Response({"host": host_id, **host_stats(host_id, start, end)})
+
+
+class ExportView(views.APIView):
+    """Streams every booking or payment as NDJSON or CSV"""
+
+    permission_classes = [permissions.IsAdminUser]
+    # Rows are read while the response streams, after the budget is checked
+    query_budget = 0
+
+    @swagger_auto_schema(
+        operation_description="Full export, streamed; ?gzip=1 compresses it",
+        manual_parameters=[
+            openapi.Parameter(
+                "from",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                format=openapi.FORMAT_DATE,
+                description="Created on or after this day (YYYY-MM-DD)",
+            ),
+            openapi.Parameter(
+                "to",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                format=openapi.FORMAT_DATE,
+                description="Created before this day (YYYY-MM-DD)",
+            ),
+            openapi.Parameter("status", openapi.IN_QUERY, type=openapi.TYPE_STRING),
+            openapi.Parameter("gzip", openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN),
+        ],
+    )
+    def get(self, request, kind, fmt):
+        params = request.query_params
+        start = parse_date_param(params, "from")
+        end = parse_date_param(params, "to")
+        if start and end and end <= start:
+            raise ValidationError({"to": "Must be after from."})
+
+        status_value = params.get("status")
+        model, _ = EXPORTS[kind]
+        choices = dict(model._meta.get_field("status").choices)
+        if status_value and status_value not in choices:
+            raise ValidationError({"status": f"Expected one of {', '.join(choices)}."})
+        compress = params.get("gzip") in ("1", "true")
+
+        response = StreamingHttpResponse(
+            stream_export(kind, fmt, start, end, status_value, compress),
+            content_type="application/gzip" if compress else CONTENT_TYPES[fmt],
+        )
+        filename = export_filename(kind, fmt, start, end, compress)
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+class ChapaMetricsView(views.APIView):
+    """Latency and error counters of this process's Chapa client"""
+
+    permission_classes = [permissions.IsAdminUser]
+    query_budget = 0
+
+    def get(self, request):
+        client = get_client()
+        return Response(
+            {"circuit": client.breaker.state, "operations": client.metrics.snapshot()}
+        )
+
+
+@csrf_exempt
+@require_POST
+@query_budget(4)
+def chapa_webhook(request):
+    """Receives Chapa events; they are applied later by a Celery task"""
+    if not verify_signature(request):
+        return JsonResponse({"error": "Invalid signature"}, status=401)
+
+    try:
+        record_event(request.body)
+    except ValueError:
+        return JsonResponse({"error": "Invalid payload"}, status=400)
+    return JsonResponse({"status": "received"})
@@ -0,0 +1,150 @@
+"""
+Chapa webhook ingestion.
+
+The view only checks the signature and appends the raw event; duplicates hit
+the unique event_id and are dropped. apply_pending_events() later folds the
+stored events into Payment and Booking statuses in batches. Events whose
+tx_ref names no payment are marked processed with an error instead of
+holding up the events behind them.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Booking, ChapaWebhookEvent, Payment
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADERS = ("HTTP_X_CHAPA_SIGNATURE", "HTTP_CHAPA_SIGNATURE")
+
+SUCCESS_STATUSES = {"success"}
+FAILED_STATUSES = {"failed", "failed/cancelled", "cancelled"}
+
+
+def verify_signature(request):
+    """Checks the HMAC-SHA256 of the raw body against the Chapa headers"""
+    secret = settings.CHAPA_WEBHOOK_SECRET
+    if not secret:
+        # An empty key would accept any HMAC computed with ""
+        logger.error("CHAPA_WEBHOOK_SECRET is not set, rejecting webhook")
+        return False
+
+    expected = hmac.new(secret.encode(), request.body, hashlib.sha256).hexdigest()
+    return any(
+        hmac.compare_digest(expected, request.META.get(header, ""))
+        for header in SIGNATURE_HEADERS
+    )
+
+
+def event_type_for(payload):
+    return str(payload.get("event") or payload.get("type") or "")
+
+
+def event_id_for(payload):
+    """Redeliveries of the same event map to the same id"""
+    if payload.get("id"):
+        return str(payload["id"])
+
+    reference = payload.get("reference") or payload.get("tx_ref") or ""
+    return f"{event_type_for(payload)}:{reference}:{payload.get('status', '')}"
+
+
+def record_event(body):
+    """Stores a webhook payload; returns False for duplicates"""
+    payload = json.loads(body)
+    if not isinstance(payload, dict):
+        raise ValueError("Webhook payload must be a JSON object")
+
+    try:
+        with transaction.atomic():
+            ChapaWebhookEvent.objects.create(
+                event_id=event_id_for(payload)[:255],
+                event_type=event_type_for(payload)[:64],
+                tx_ref=str(payload.get("tx_ref") or "")[:255],
+                status=str(payload.get("status") or "").lower()[:32],
+                payload=payload,
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+def apply_pending_events(batch_size=None):
+    """Applies one batch of unprocessed events; returns how many were applied"""
+    batch_size = batch_size or settings.CHAPA_WEBHOOK_BATCH_SIZE
+
+    with transaction.atomic():
+        events = list(
+            ChapaWebhookEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True)
+            .order_by("id")
+            .only("id", "tx_ref", "status")[:batch_size]
+        )
+        if not events:
+            return 0
+
+        now = timezone.now()
+        refs, errors = {}, {}
+        for event in events:
+            try:
+                refs[event.pk] = uuid.UUID(event.tx_ref)
+            except ValueError:
+                errors[event.pk] = "tx_ref is not a payment id"
+        known = set(
+            Payment.objects.filter(payment_id__in=set(refs.values())).values_list(
+                "payment_id", flat=True
+            )
+        )
+        for pk, ref in refs.items():
+            if ref not in known:
+                errors[pk] = "no payment has this tx_ref"
+
+        # A success anywhere in the batch wins over failures for that tx_ref
+        outcome = {}
+        for event in events:
+            if event.pk in errors:
+                continue
+            ref = refs[event.pk]
+            if event.status in SUCCESS_STATUSES:
+                outcome[ref] = Payment.PaymentStatus.COMPLETED
+            elif event.status in FAILED_STATUSES:
+                outcome.setdefault(ref, Payment.PaymentStatus.FAILED)
+
+        completed = [
+            ref for ref, s in outcome.items() if s == Payment.PaymentStatus.COMPLETED
+        ]
+        failed = [
+            ref for ref, s in outcome.items() if s == Payment.PaymentStatus.FAILED
+        ]
+
+        if completed:
+            payments = Payment.objects.filter(payment_id__in=completed)
+            booking_ids = list(payments.values_list("booking_id", flat=True))
+            payments.update(status=Payment.PaymentStatus.COMPLETED, updated_at=now)
+            # A canceled booking stays canceled
+            Booking.objects.filter(booking_id__in=booking_ids, status="pending").update(
+                status="confirmed", updated_at=now
+            )
+        if failed:
+            # Failures never downgrade a completed payment
+            Payment.objects.filter(payment_id__in=failed).exclude(
+                status=Payment.PaymentStatus.COMPLETED
+            ).update(status=Payment.PaymentStatus.FAILED, updated_at=now)
+
+        ChapaWebhookEvent.objects.filter(
+            pk__in=[e.pk for e in events if e.pk not in errors]
+        ).update(processed_at=now)
+        for error in set(errors.values()):
+            skipped = [pk for pk, e in errors.items() if e == error]
+            logger.warning("Skipping Chapa webhook events %s: %s", skipped, error)
+            ChapaWebhookEvent.objects.filter(pk__in=skipped).update(
+                processed_at=now, error=error
+            )
+    return len(events)
@@ -11,13 +11,19 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import sys
 import environ
 from pathlib import Path
 
+from kombu import Queue
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Apps such as listings live next to this file and import as top-level
+# packages. Appended, so this directory's celery.py never shadows Celery.
+sys.path.append(str(BASE_DIR / "alx_travel_app"))
+
 # Env variables
 env = environ.Env()
 environ.Env.read_env(os.path.join(BASE_DIR, ".env"))
@@ -61,7 +67,7 @@ INSTALLED_APPS = (
     + THIRD_PARTY_APPS
     + LOCAL_APPS
     + [
-        "django-chapa",
+        "django_chapa",
     ]
 )
 
@@ -73,8 +79,12 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "listings.middleware.QueryBudgetMiddleware",
 ]
 
+# Raise instead of logging when a view goes over its query budget
+QUERY_BUDGET_RAISE = env.bool("QUERY_BUDGET_RAISE", default=False)
+
 ROOT_URLCONF = "alx_travel_app.urls"
 
 TEMPLATES = [
@@ -93,23 +103,29 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "alx_travel_app.wsgi.application"
+# Serves the async payment views without holding a thread per request
+ASGI_APPLICATION = "alx_travel_app.asgi.application"
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        # "ENGINE": "django.db.backends.sqlite3",
-        # "NAME": BASE_DIR / "db.sqlite3",
-        "ENGINE": "django.db.backends.mysql",
-        "NAME": env("MYSQL_DATABASE"),
-        "USER": env("MYSQL_USER"),
-        "PASSWORD": env("MYSQL_PASSWORD"),
-        "HOST": env("MYSQL_HOST", default="localhost"),
-        "PORT": env("DB_PORT", default="3306"),
+# DATABASE_URL (e.g. sqlite:///test.sqlite3) replaces the MySQL settings
+if env("DATABASE_URL", default=""):
+    DATABASES = {"default": env.db("DATABASE_URL")}
+else:
+    DATABASES = {
+        "default": {
+            # "ENGINE": "django.db.backends.sqlite3",
+            # "NAME": BASE_DIR / "db.sqlite3",
+            "ENGINE": "django.db.backends.mysql",
+            "NAME": env("MYSQL_DATABASE"),
+            "USER": env("MYSQL_USER"),
+            "PASSWORD": env("MYSQL_PASSWORD"),
+            "HOST": env("MYSQL_HOST", default="localhost"),
+            "PORT": env("DB_PORT", default="3306"),
+        }
     }
-}
 
 
 # Password validation
@@ -148,6 +164,9 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
+# Uploaded listing imports and their error reports
+MEDIA_ROOT = env.str("MEDIA_ROOT", default=str(BASE_DIR / "media"))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -160,6 +179,40 @@ REST_FRAMEWOR = {
     "DEFAULT_RENDERER_CLASSES": ["rest_framework.renderers.JSONRenderer"],
 }
 
+# Pagination (cursor based, see listings/pagination.py)
+API_PAGE_SIZE = env.int("API_PAGE_SIZE", default=50)
+API_MAX_PAGE_SIZE = env.int("API_MAX_PAGE_SIZE", default=500)
+# Serve read-only list endpoints from values() rows (see listings/fieldsets.py)
+API_VALUES_LIST = env.bool("API_VALUES_LIST", default=True)
+
+# Maximum number of items in POST /api/booking/bulk/
+BOOKING_BULK_MAX_ITEMS = env.int("BOOKING_BULK_MAX_ITEMS", default=1000)
+
+# Rows fetched per round trip by the streaming exports (listings/exports.py)
+EXPORT_CHUNK_SIZE = env.int("EXPORT_CHUNK_SIZE", default=2000)
+# Rows validated and upserted together by bulk listing imports
+LISTING_IMPORT_CHUNK_SIZE = env.int("LISTING_IMPORT_CHUNK_SIZE", default=500)
+
+# Maximum number of listing ids in GET /api/listings/quote/
+QUOTE_MAX_LISTINGS = env.int("QUOTE_MAX_LISTINGS", default=100)
+
+# Geo search (see listings/geo.py): geohash cells covering a search area,
+# the largest ?radius_km= and the most listings a ?near= search may match
+GEO_MAX_CELLS = env.int("GEO_MAX_CELLS", default=32)
+GEO_MAX_RADIUS_KM = env.int("GEO_MAX_RADIUS_KM", default=100)
+GEO_MAX_MATCHES = env.int("GEO_MAX_MATCHES", default=10000)
+
+# Listing response cache (see listings/caching.py). CACHE_URL selects the
+# backend (e.g. redis://localhost:6379/1). The default local-memory cache is
+# per process, so a write handled by one worker would not invalidate the
+# others: the listing cache is only on by default with a shared backend
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+LISTINGS_CACHE_ENABLED = env.bool(
+    "LISTINGS_CACHE_ENABLED",
+    default=not CACHES["default"]["BACKEND"].endswith(("LocMemCache", "DummyCache")),
+)
+LISTINGS_CACHE_TIMEOUT = env.int("LISTINGS_CACHE_TIMEOUT", default=300)
+
 
 """
 Contains global settings for this project
@@ -171,6 +224,17 @@ CHAPA_API_URL = "https://api.chapa.co"
 CHAPA_API_VERSION = "v1"
 CHAPA_TRANSACTION_MODEL = "listings.Payment"
 CHAPA_WEBHOOK_URL = "/api/chapa-webhook/"
+CHAPA_WEBHOOK_SECRET = env("CHAPA_WEBHOOK_SECRET", default="")
+CHAPA_WEBHOOK_BATCH_SIZE = env.int("CHAPA_WEBHOOK_BATCH_SIZE", default=500)
+
+# Chapa HTTP client (see listings/chapa.py)
+CHAPA_CONNECT_TIMEOUT = env.float("CHAPA_CONNECT_TIMEOUT", default=3.05)
+CHAPA_READ_TIMEOUT = env.float("CHAPA_READ_TIMEOUT", default=10.0)
+CHAPA_MAX_RETRIES = env.int("CHAPA_MAX_RETRIES", default=2)
+CHAPA_RETRY_BACKOFF = env.float("CHAPA_RETRY_BACKOFF", default=0.25)
+CHAPA_POOL_SIZE = env.int("CHAPA_POOL_SIZE", default=20)
+CHAPA_BREAKER_THRESHOLD = env.int("CHAPA_BREAKER_THRESHOLD", default=5)
+CHAPA_BREAKER_RESET_TIMEOUT = env.float("CHAPA_BREAKER_RESET_TIMEOUT", default=30.0)
 
 # Celery Configurations
 
@@ -182,6 +246,106 @@ CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = ""
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
+CELERY_BEAT_SCHEDULE = {
+    "flush-mail-queue": {
+        "task": "listings.tasks.flush_mail_queue",
+        "schedule": env.float("EMAIL_FLUSH_INTERVAL", default=5.0),
+    },
+    "apply-chapa-webhook-events": {
+        "task": "listings.tasks.apply_chapa_webhook_events",
+        "schedule": env.float("CHAPA_WEBHOOK_APPLY_INTERVAL", default=2.0),
+    },
+    "reconcile-pending-payments": {
+        "task": "listings.tasks.reconcile_pending_payments",
+        "schedule": env.float("PAYMENT_RECONCILE_SCHEDULE", default=300.0),
+    },
+    "refresh-listing-stats": {
+        "task": "listings.tasks.refresh_listing_stats",
+        "schedule": env.float("STATS_REFRESH_SCHEDULE", default=300.0),
+    },
+    "relay-outbox": {
+        "task": "listings.tasks.relay_outbox",
+        "schedule": env.float("OUTBOX_RELAY_INTERVAL", default=5.0),
+    },
+    "purge-idempotency-keys": {
+        "task": "listings.tasks.purge_idempotency_keys",
+        "schedule": env.float("IDEMPOTENCY_PURGE_INTERVAL", default=3600.0),
+    },
+}
+
+# Task queues: payment work and email work are consumed by separate workers
+# (celery worker -Q payments / -Q email,default), so a mail backlog never
+# sits in front of a payment. Within a queue, higher priorities go first.
+CELERY_TASK_QUEUES = (
+    Queue("payments", routing_key="payments"),
+    Queue("email", routing_key="email"),
+    Queue("default", routing_key="default"),
+)
+CELERY_TASK_DEFAULT_QUEUE = "default"
+CELERY_TASK_QUEUE_MAX_PRIORITY = 10
+CELERY_TASK_DEFAULT_PRIORITY = 5
+CELERY_TASK_ROUTES = {
+    "listings.tasks.apply_chapa_webhook_events": {"queue": "payments", "priority": 9},
+    "listings.tasks.send_payment_checkout_mail": {"queue": "payments", "priority": 8},
+    "listings.tasks.send_confirm_payment_mail": {"queue": "payments", "priority": 8},
+    "listings.tasks.reconcile_pending_payments": {"queue": "payments", "priority": 2},
+    # Drains outbox messages the publisher thread missed, payment tasks
+    # among them, so it must not wait behind the email backlog
+    "listings.tasks.relay_outbox": {"queue": "payments", "priority": 6},
+    "listings.tasks.send_booking_confirmation": {"queue": "email", "priority": 7},
+    "listings.tasks.send_confirm_booking_email": {"queue": "email", "priority": 7},
+    "listings.tasks.send_booking_confirmations": {"queue": "email", "priority": 4},
+    "listings.tasks.flush_mail_queue": {"queue": "email", "priority": 2},
+}
+# Rate limit of every task on a queue ("200/s", "30/m"; empty for none).
+# Celery enforces it per task and per worker process, not cluster-wide
+TASK_QUEUE_RATE_LIMITS = {
+    "payments": env.str("PAYMENTS_QUEUE_RATE_LIMIT", default=""),
+    "email": env.str("EMAIL_QUEUE_RATE_LIMIT", default="200/s"),
+}
+CELERY_TASK_ANNOTATIONS = {
+    name: {"rate_limit": TASK_QUEUE_RATE_LIMITS[route["queue"]]}
+    for name, route in CELERY_TASK_ROUTES.items()
+    if TASK_QUEUE_RATE_LIMITS.get(route["queue"])
+}
+# Tasks are short, so each worker process reserves a few at a time; a larger
+# window would take messages out of priority order. Messages are acked after
+# the task ran, so a killed worker's tasks are redelivered
+CELERY_WORKER_PREFETCH_MULTIPLIER = env.int(
+    "CELERY_WORKER_PREFETCH_MULTIPLIER", default=4
+)
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+
+# Transactional outbox for task dispatch (see listings/outbox.py)
+OUTBOX_BATCH_SIZE = env.int("OUTBOX_BATCH_SIZE", default=200)
+# Broker publishes in flight at once while draining a batch
+OUTBOX_PUBLISH_CONCURRENCY = env.int("OUTBOX_PUBLISH_CONCURRENCY", default=8)
+# Seconds before the first retry of a failed publish, doubling up to the cap
+OUTBOX_RETRY_DELAY = env.int("OUTBOX_RETRY_DELAY", default=5)
+OUTBOX_MAX_RETRY_DELAY = env.int("OUTBOX_MAX_RETRY_DELAY", default=300)
+
+# Idempotency-Key handling of booking and payment POSTs (see
+# listings/idempotency.py): how long a response is replayed, how long a
+# request may hold its key before a duplicate takes over, and how long a
+# duplicate waits for the original to finish
+IDEMPOTENCY_KEY_TTL = env.int("IDEMPOTENCY_KEY_TTL", default=86400)
+IDEMPOTENCY_LOCK_TIMEOUT = env.int("IDEMPOTENCY_LOCK_TIMEOUT", default=60)
+IDEMPOTENCY_WAIT_TIMEOUT = env.float("IDEMPOTENCY_WAIT_TIMEOUT", default=15.0)
+
+# Pending payment reconciliation (see listings/reconcile.py)
+PAYMENT_RECONCILE_PAGE_SIZE = env.int("PAYMENT_RECONCILE_PAGE_SIZE", default=200)
+PAYMENT_RECONCILE_CONCURRENCY = env.int("PAYMENT_RECONCILE_CONCURRENCY", default=8)
+# Seconds a payment must be pending before it is checked, and between checks
+PAYMENT_RECONCILE_GRACE = env.int("PAYMENT_RECONCILE_GRACE", default=600)
+PAYMENT_RECONCILE_INTERVAL = env.int("PAYMENT_RECONCILE_INTERVAL", default=900)
+
+# Daily occupancy/revenue rollups (see listings/rollups.py)
+# Rows updated up to this many seconds before the watermark are rescanned,
+# covering transactions that committed after a refresh started
+STATS_WATERMARK_LAG = env.int("STATS_WATERMARK_LAG", default=300)
+# Longest range GET /api/hosts/<id>/stats/ accepts
+STATS_MAX_RANGE_DAYS = env.int("STATS_MAX_RANGE_DAYS", default=731)
 
 # Email Configuration
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
@@ -189,3 +353,8 @@ EMAIL_HOST = env("EMAIL_HOST", default="mailpit")
 EMAIL_PORT = env("EMAIL_PORT", default=1025)
 EMAIL_USE_TLS = env("EMAIL_USE_TLS", default=False)
 DEFAULT_FROM_EMAIL = env("DEFAULT_FROM_EMAIL", default="test01@alxtravelapp.com")
+
+# Batched delivery (see listings/mail.py)
+EMAIL_BATCH_SIZE = env.int("EMAIL_BATCH_SIZE", default=100)
+EMAIL_MAX_ATTEMPTS = env.int("EMAIL_MAX_ATTEMPTS", default=5)
+EMAIL_RETRY_DELAY = env.int("EMAIL_RETRY_DELAY", default=30)
@@ -1,19 +0,0 @@
-import os
-
-from alx_travel_app.celery import Celery
-
-
-# set the default django settings module for celery program
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_travel_app.settings")
-
-app = Celery("alx_travel_app")
-
-
-app.config_from_object("django.conf:settings", namespace="CELERY")
-
-app.autodiscover_tasks()
-
-
-@app.task(bind=True, ignore_result=True)
-def debug_task(self):
-    print(f"Request: --> {self.request!r}")